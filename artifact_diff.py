@@ -0,0 +1,153 @@
+"""
+Line diffs between artifact versions, for the preview of edit_artifact calls.
+
+diff_versions() trims the lines both versions start and end with before
+running difflib on the rest, so a small edit of a huge artifact costs little
+more than comparing its lines once. Lines replaced one for one are refined
+to the characters that changed, and unchanged lines beyond a few lines of
+context are collapsed. Diffs are cached per (artifact, sequence), since the
+preview renders the same edit again for each viewer and font size.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, List, Tuple
+import difflib
+import hashlib
+import threading
+
+from content_utils import looks_like_xml, reindent_xml_block
+
+# Lines of unchanged context shown around each change
+CONTEXT_LINES = 3
+# Replaced lines are only refined to characters up to this length, and if they are similar enough
+REFINE_MAX_CHARS = 2000
+REFINE_MIN_RATIO = 0.5
+
+@dataclass(frozen=True)
+class ArtifactEdit:
+    """An artifact's versions before and after an edit"""
+    artifact_id: str
+    sequence: Any
+    before: str
+    after: str
+
+    def digest(self) -> str:
+        hasher = hashlib.blake2b(digest_size=16)
+        for text in (self.artifact_id, str(self.sequence), self.before, self.after):
+            hasher.update(text.encode("utf-8", "surrogatepass"))
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+@dataclass(frozen=True)
+class DiffLine:
+    kind: str  # "context", "removed", "added" or "skipped"
+    text: str = ""
+    # Character ranges of text that changed (refined lines only)
+    changes: Tuple[Tuple[int, int], ...] = ()
+    # Number of collapsed lines ("skipped" only)
+    skipped: int = 0
+
+def _refine(removed: str, added: str) -> Tuple[Tuple[Tuple[int, int], ...], Tuple[Tuple[int, int], ...]]:
+    """Changed character ranges of a line and its replacement; none if they are too long or too different"""
+    if len(removed) > REFINE_MAX_CHARS or len(added) > REFINE_MAX_CHARS:
+        return (), ()
+    matcher = difflib.SequenceMatcher(None, removed, added, autojunk=False)
+    if matcher.ratio() < REFINE_MIN_RATIO:
+        return (), ()
+    opcodes = [opcode for opcode in matcher.get_opcodes() if opcode[0] != "equal"]
+    return (tuple((i1, i2) for _, i1, i2, _, _ in opcodes if i2 > i1),
+            tuple((j1, j2) for _, _, _, j1, j2 in opcodes if j2 > j1))
+
+def _unchanged(lines: List[str], start: int, end: int, first: bool, last: bool, context: int) -> List[DiffLine]:
+    """Unchanged lines[start:end], with what is not context of a change collapsed"""
+    keep_head = 0 if first else context
+    keep_tail = 0 if last else context
+    if end - start <= keep_head + keep_tail + context:
+        # Not worth collapsing
+        return [DiffLine("context", line) for line in lines[start:end]]
+    result = [DiffLine("context", line) for line in lines[start:start + keep_head]]
+    result.append(DiffLine("skipped", skipped=end - start - keep_head - keep_tail))
+    result.extend(DiffLine("context", line) for line in lines[end - keep_tail:end])
+    return result
+
+def diff_versions(before: str, after: str, context: int = CONTEXT_LINES) -> List[DiffLine]:
+    """Changed lines of after against before, with context; empty if no line changed"""
+    if before == after:
+        return []
+    old, new = before.splitlines(), after.splitlines()
+
+    # Most edits touch a small part of the artifact: only diff what lies between the common head and tail
+    limit = min(len(old), len(new))
+    head = 0
+    while head < limit and old[head] == new[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and old[-1 - tail] == new[-1 - tail]:
+        tail += 1
+    matcher = difflib.SequenceMatcher(None, old[head:len(old) - tail], new[head:len(new) - tail])
+    opcodes = [("equal", 0, head, 0, head)]
+    opcodes.extend((tag, i1 + head, i2 + head, j1 + head, j2 + head) for tag, i1, i2, j1, j2 in matcher.get_opcodes())
+    opcodes.append(("equal", len(old) - tail, len(old), len(new) - tail, len(new)))
+
+    changes = [index for index, opcode in enumerate(opcodes) if opcode[0] != "equal"]
+    if not changes:
+        # Only line endings differ
+        return []
+    result: List[DiffLine] = []
+    for index, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == "equal":
+            if i2 > i1:
+                result.extend(_unchanged(old, i1, i2, index < changes[0], index > changes[-1], context))
+            continue
+        removed, added = old[i1:i2], new[j1:j2]
+        refined = [_refine(line, replacement) for line, replacement in zip(removed, added)] if tag == "replace" else []
+        result.extend(DiffLine("removed", line, refined[k][0] if k < len(refined) else ())
+                      for k, line in enumerate(removed))
+        result.extend(DiffLine("added", line, refined[k][1] if k < len(refined) else ())
+                      for k, line in enumerate(added))
+    return result
+
+def diff_text(lines: List[DiffLine]) -> str:
+    """A diff in the plain-text viewer: unified-diff style line prefixes"""
+    if not lines:
+        return "(no changed lines)\n"
+    prefixes = {"context": "  ", "removed": "- ", "added": "+ "}
+    return "".join(f"@@ {line.skipped} unchanged lines @@\n" if line.kind == "skipped"
+                   else f"{prefixes[line.kind]}{line.text}\n" for line in lines)
+
+def _prepare(content: str, clean_xml: bool) -> str:
+    # Reindented XML diffs by element rather than as one long line
+    if clean_xml and looks_like_xml(content):
+        return reindent_xml_block(content.strip())
+    return content
+
+class ArtifactDiffs:
+    """
+    Diffs of artifact edits by (artifact, sequence, clean_xml), least
+    recently used evicted first. An entry is reused while both versions
+    are unchanged, e.g. not after loading another conversation.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[str, str, bool], Tuple[ArtifactEdit, List[DiffLine]]]" = OrderedDict()
+        # Diffs are computed in render threads
+        self._lock = threading.Lock()
+
+    def get(self, edit: ArtifactEdit, clean_xml: bool) -> List[DiffLine]:
+        key = (edit.artifact_id, str(edit.sequence), clean_xml)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == edit:
+                self.entries.move_to_end(key)
+                return entry[1]
+        lines = diff_versions(_prepare(edit.before, clean_xml), _prepare(edit.after, clean_xml))
+        with self._lock:
+            self.entries[key] = (edit, lines)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return lines
+
+artifact_diffs = ArtifactDiffs()
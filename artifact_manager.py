@@ -2,8 +2,13 @@ from typing import Dict, List, Optional, Any, Tuple
 import time
 import copy
 
+from conversation_events import ArtifactVersionAdded, EventBus
+
 class ArtifactManager:   
-    def __init__(self):
+    def __init__(self, events: Optional[EventBus] = None):
+        # Change events; shared with the owning conversation
+        self.events = events or EventBus()
+
         # Main dictionary of artifacts (current version of each)
         self.artifacts: Dict[str, str] = {}
         
@@ -24,6 +29,7 @@ class ArtifactManager:
         
         # Initialize version history
         self.artifact_history[artifact_id] = [(sequence_id, contents)]
+        self.events.publish(ArtifactVersionAdded(artifact_id, sequence_id, contents, 1))
         
         return {
             "success": True,
@@ -68,6 +74,8 @@ class ArtifactManager:
         
         # Add to version history
         self.artifact_history[artifact_id].append((sequence_id, new_content))
+        self.events.publish(ArtifactVersionAdded(artifact_id, sequence_id, new_content,
+                                                 len(self.artifact_history[artifact_id])))
         
         return {
             "success": True,
@@ -130,6 +138,13 @@ class ArtifactManager:
             return 0
         return len(self.artifact_history[artifact_id])
     
+    def fork(self, events: Optional[EventBus] = None) -> "ArtifactManager":
+        """Return a copy whose artifacts and version histories can be changed independently"""
+        forked = ArtifactManager(events)
+        forked.artifacts = self.artifacts.copy()
+        forked.artifact_history = {k: list(v) for k, v in self.artifact_history.items()}
+        return forked
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for serialization"""
         return {
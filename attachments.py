@@ -0,0 +1,208 @@
+"""
+Attachment loading: read, detect the MIME type, and shrink before sending.
+
+Files are read and processed in a worker thread, so large attachments never
+block the Tk event loop. Optional stages cut upload size and token cost; each
+one reports bytes in and out. Stages whose library is not installed are
+skipped (Pillow for images, numpy for audio, pypdf / bs4 for text extraction).
+
+Settings (environment):
+  LLM_ATTACHMENT_STAGES         comma-separated stages to run (default "downscale_image,mono_audio";
+                                "extract_text" replaces PDFs and HTML with their text)
+  LLM_ATTACHMENT_MAX_IMAGE_PX   longest image side after downscaling (default 1536)
+  LLM_ATTACHMENT_SAMPLE_RATE    sample rate of downmixed audio (default 16000)
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import io
+import mimetypes
+import os
+import time
+
+# (offset, magic bytes, MIME type); checked in order
+SIGNATURES = [
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (8, b"WAVE", "audio/wav"),
+    (8, b"AIFF", "audio/aiff"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"ID3", "audio/mp3"),
+    (0, b"\xff\xfb", "audio/mp3"),
+    (0, b"\xff\xf3", "audio/mp3"),
+    (0, b"\xff\xf2", "audio/mp3"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"fLaC", "audio/flac"),
+    (4, b"ftypM4A", "audio/mp4"),
+    (4, b"ftyp", "video/mp4"),
+]
+
+def _looks_like_text(head: bytes) -> bool:
+    if b"\x00" in head:
+        return False
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character may be cut off at the end of the head
+        return e.start >= len(head) - 3
+    return True
+
+def detect_mime_type(path: str, head: bytes) -> str:
+    """MIME type from the file's first bytes; text files are told apart by their extension"""
+    for offset, magic, mime_type in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return mime_type
+    if _looks_like_text(head):
+        guessed, _ = mimetypes.guess_type(path)
+        return guessed if guessed and guessed.startswith("text/") else "text/plain"
+    raise ValueError(f"Unsupported attachment type: {path}")
+
+@dataclass
+class StageReport:
+    stage: str
+    bytes_in: int
+    bytes_out: int
+    seconds: float
+
+    def __str__(self) -> str:
+        return f"{self.stage}: {self.bytes_in / 1024:.0f} KB -> {self.bytes_out / 1024:.0f} KB ({self.seconds:.2f}s)"
+
+class Stage:
+    """A preprocessing step; returns the data unchanged when it does not apply"""
+    name = ""
+
+    def applies(self, mime_type: str) -> bool:
+        return False
+
+    def run(self, data: bytes, mime_type: str) -> Tuple[bytes, str]:
+        return data, mime_type
+
+class DownscaleImage(Stage):
+    name = "downscale_image"
+
+    def __init__(self, max_pixels: int = 1536):
+        self.max_pixels = max_pixels
+
+    def applies(self, mime_type: str) -> bool:
+        return mime_type in ("image/png", "image/jpeg", "image/webp")
+
+    def run(self, data: bytes, mime_type: str) -> Tuple[bytes, str]:
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(data))
+        if max(image.size) <= self.max_pixels:
+            return data, mime_type
+        image.thumbnail((self.max_pixels, self.max_pixels), Image.LANCZOS)
+        output = io.BytesIO()
+        image_format = {"image/png": "PNG", "image/jpeg": "JPEG", "image/webp": "WEBP"}[mime_type]
+        image.save(output, format=image_format, **({"quality": 85} if image_format != "PNG" else {"optimize": True}))
+        return output.getvalue(), mime_type
+
+class MonoAudio(Stage):
+    """Downmix 16-bit PCM WAV to mono and resample it; speech models gain nothing from more"""
+    name = "mono_audio"
+
+    def __init__(self, sample_rate: int = 16000):
+        self.sample_rate = sample_rate
+
+    def applies(self, mime_type: str) -> bool:
+        return mime_type == "audio/wav"
+
+    def run(self, data: bytes, mime_type: str) -> Tuple[bytes, str]:
+        import numpy as np
+        import wave
+
+        with wave.open(io.BytesIO(data)) as reader:
+            channels, width, rate = reader.getnchannels(), reader.getsampwidth(), reader.getframerate()
+            if width != 2 or (channels == 1 and rate <= self.sample_rate):
+                return data, mime_type
+            frames = np.frombuffer(reader.readframes(reader.getnframes()), dtype="<i2")
+        samples = frames.reshape(-1, channels).mean(axis=1)
+        if rate > self.sample_rate:
+            count = int(len(samples) * self.sample_rate / rate)
+            samples = np.interp(np.arange(count) * (rate / self.sample_rate), np.arange(len(samples)), samples)
+            rate = self.sample_rate
+
+        output = io.BytesIO()
+        with wave.open(output, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(rate)
+            writer.writeframes(np.clip(np.round(samples), -32768, 32767).astype("<i2").tobytes())
+        return output.getvalue(), mime_type
+
+class ExtractText(Stage):
+    """Replace PDFs and HTML with their text; loses layout and images, but costs far fewer tokens"""
+    name = "extract_text"
+
+    def applies(self, mime_type: str) -> bool:
+        return mime_type in ("application/pdf", "text/html")
+
+    def run(self, data: bytes, mime_type: str) -> Tuple[bytes, str]:
+        if mime_type == "application/pdf":
+            from pypdf import PdfReader
+            text = "\n\n".join(page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages)
+        else:
+            from bs4 import BeautifulSoup
+            text = BeautifulSoup(data, "html.parser").get_text("\n")
+        return text.encode("utf-8"), "text/plain"
+
+STAGES = {stage.name: stage for stage in (DownscaleImage, MonoAudio, ExtractText)}
+
+def stages_from_env() -> List[Stage]:
+    names = [n.strip() for n in os.environ.get("LLM_ATTACHMENT_STAGES", "downscale_image,mono_audio").split(",") if n.strip()]
+    stages = []
+    for name in names:
+        if name not in STAGES:
+            raise ValueError(f"Unknown attachment stage: {name} (known: {', '.join(STAGES)})")
+        if name == "downscale_image":
+            stages.append(DownscaleImage(int(os.environ.get("LLM_ATTACHMENT_MAX_IMAGE_PX", "1536"))))
+        elif name == "mono_audio":
+            stages.append(MonoAudio(int(os.environ.get("LLM_ATTACHMENT_SAMPLE_RATE", "16000"))))
+        else:
+            stages.append(STAGES[name]())
+    return stages
+
+@dataclass
+class Attachment:
+    path: str
+    mime_type: str
+    data: bytes
+    reports: List[StageReport] = field(default_factory=list)
+
+    def part(self) -> Dict[str, Any]:
+        """The attachment as a conversation part"""
+        return {"mime_type": self.mime_type, "data": self.data, "display_name": os.path.basename(self.path)}
+
+def process_file(path: str, stages: Optional[List[Stage]] = None) -> Attachment:
+    """Read, detect and preprocess one file (blocking; see load_attachment)"""
+    with open(path, "rb") as f:
+        data = f.read()
+    attachment = Attachment(path, detect_mime_type(path, data[:512]), data)
+    for stage in stages if stages is not None else stages_from_env():
+        if not stage.applies(attachment.mime_type):
+            continue
+        start = time.perf_counter()
+        try:
+            data, mime_type = stage.run(attachment.data, attachment.mime_type)
+        except ImportError as e:
+            print(f">> Attachment stage {stage.name} skipped, {e.name} is not installed")
+            continue
+        except Exception as e:
+            # E.g. an audio encoding the wave module cannot read or a corrupt image: send the file as it is
+            print(f">> Attachment stage {stage.name} failed on {os.path.basename(path)}, kept unprocessed: "
+                  f"{type(e).__name__}: {e}")
+            continue
+        report = StageReport(stage.name, len(attachment.data), len(data), time.perf_counter() - start)
+        attachment.data, attachment.mime_type = data, mime_type
+        attachment.reports.append(report)
+        print(f">> {os.path.basename(path)} {report}")
+    return attachment
+
+async def load_attachment(path: str, stages: Optional[List[Stage]] = None) -> Attachment:
+    """process_file in a worker thread"""
+    return await asyncio.to_thread(process_file, path, stages)
@@ -0,0 +1,190 @@
+"""
+Headless batch runner: runs a corpus of inputs through a prompt stack.
+
+Every input becomes its own conversation, in which the stack's prompts are
+sent one after another as user turns. A prompt may reference the input as
+{input}; if no prompt in the stack does, the input is prepended to the first
+prompt. Results are appended to a JSONL file as soon as each conversation
+finishes, and that file doubles as the checkpoint: re-running the same
+command skips inputs that already completed successfully.
+
+Inputs are either a directory (one input per file, id = file name without
+extension) or a JSONL file with one {"id": ..., "text": ...} object per line.
+
+Usage:
+    python batch_runner.py default inputs/ --output results.jsonl --concurrency 8
+"""
+
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import importlib.util
+import json
+import pathlib
+import time
+
+from conversation_manager import ConversationManager
+from prompt_stack_manager import PromptStackManager
+from request_deadline import Deadline
+
+if importlib.util.find_spec("user_ui_model_local"):
+    from user_ui_model_local import UserUIModel
+else:
+    from user_ui_model import UserUIModel
+
+def load_inputs(path: str) -> List[Dict[str, str]]:
+    """Load inputs from a directory of files or a JSONL file"""
+    source = pathlib.Path(path)
+    inputs = []
+    if source.is_dir():
+        for file in sorted(source.iterdir()):
+            if file.is_file():
+                inputs.append({"id": file.stem, "text": file.read_text(encoding="utf-8").strip()})
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    item = json.loads(line)
+                    inputs.append({"id": str(item.get("id", line_number)), "text": item.get("text", item.get("input", ""))})
+    return inputs
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    """Return the successfully completed results of an earlier run, keyed by input id"""
+    completed = {}
+    output = pathlib.Path(path)
+    if output.exists():
+        with open(output, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    if not result.get("error"):
+                        completed[result["id"]] = result
+    return completed
+
+def build_turns(prompts: List[str], text: str) -> List[str]:
+    if any("{input}" in prompt for prompt in prompts):
+        return [prompt.replace("{input}", text) for prompt in prompts]
+    return [f"{text}\n\n{prompts[0]}"] + prompts[1:]
+
+class BatchRunner:
+    def __init__(self, ui_model, prompts: List[str], prompt_names: List[str], system_prompt: Optional[str],
+                 concurrency: int, timeout: Optional[float]):
+        self.ui_model = ui_model
+        self.prompts = prompts
+        self.prompt_names = prompt_names
+        self.system_prompt = system_prompt
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.timeout = timeout
+
+    async def run_item(self, item: Dict[str, str]) -> Dict[str, Any]:
+        """Run one input through the whole stack as a multi-turn conversation"""
+        async with self.semaphore:
+            conversation_manager = ConversationManager()
+            result = {"id": item["id"], "turns": [], "error": None}
+            start_time = time.monotonic()
+            for name, message in zip(self.prompt_names, build_turns(self.prompts, item["text"])):
+                turn_start = time.monotonic()
+                try:
+                    chat_session = self.ui_model.generate_chat_session(conversation_manager, self.system_prompt)
+                    conversation_manager.add_user_message([message])
+                    response, new_history_items = await chat_session.send_message_async([message], Deadline(self.timeout))
+                except Exception as e:
+                    result["error"] = f"{name}: {type(e).__name__}: {e}"
+                    break
+                usage = getattr(response, "usage_metadata", None)
+                result["turns"].append({
+                    "prompt": name,
+                    "response": "\n\n".join(i["parts"][0] for i in new_history_items if i["role"] == "model" and i["parts"]),
+                    "latency": time.monotonic() - turn_start,
+                    "tokens": getattr(usage, "total_token_count", None)
+                })
+            result["latency"] = time.monotonic() - start_time
+            result["tokens"] = sum(t["tokens"] or 0 for t in result["turns"])
+            result["history"] = conversation_manager.get_full_history()
+            return result
+
+def _percentile(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+async def run_batch(args) -> Dict[str, Any]:
+    prompt_manager = PromptStackManager(args.stacks_dir)
+    prompts = prompt_manager.load_stack(args.stack)
+    if not prompts:
+        raise ValueError(f"Stack {args.stack} has no prompts")
+    system_prompt = pathlib.Path(args.system_prompt_file).read_text(encoding="utf-8") if args.system_prompt_file else None
+
+    ui_model = UserUIModel()
+    if args.model:
+        provider_name, model_id = args.model.split(":", 1)
+        if provider_name not in ui_model.get_provider_models():
+            raise ValueError(f"Unknown provider: {provider_name}")
+        ui_model.set_provider(provider_name)
+        ui_model.set_model(model_id)
+
+    inputs = load_inputs(args.inputs)
+    completed = load_checkpoint(args.output)
+    todo = [item for item in inputs if item["id"] not in completed]
+    print(f">> {len(inputs)} inputs, {len(inputs) - len(todo)} already done, running {len(todo)} "
+          f"on {ui_model.current_provider.name}:{ui_model.current_model}")
+
+    runner = BatchRunner(ui_model, prompts, prompt_manager.prompt_files, system_prompt, args.concurrency, args.timeout)
+    results = list(completed.values())
+    start_time = time.monotonic()
+    with open(args.output, "a", encoding="utf-8") as output:
+        for done, future in enumerate(asyncio.as_completed([runner.run_item(item) for item in todo]), 1):
+            result = await future
+            # One line per finished conversation, so an interrupted run can resume
+            output.write(json.dumps(result, default=repr) + "\n")
+            output.flush()
+            results.append(result)
+            status = "FAIL " + result["error"] if result["error"] else "ok"
+            print(f">> [{done}/{len(todo)}] {result['id']}: {status} ({result['latency']:.2f}s, {result['tokens']} tokens)")
+
+    succeeded = [r for r in results if not r.get("error")]
+    latencies = [r["latency"] for r in succeeded]
+    turn_latencies = [t["latency"] for r in succeeded for t in r["turns"]]
+    return {
+        "stack": args.stack,
+        "model": f"{ui_model.current_provider.name}:{ui_model.current_model}",
+        "items": len(inputs),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "total_tokens": sum(r.get("tokens", 0) for r in results),
+        "wall_time": time.monotonic() - start_time,
+        "item_latency_p50": _percentile(latencies, 50),
+        "item_latency_p95": _percentile(latencies, 95),
+        "turn_latency_p50": _percentile(turn_latencies, 50),
+        "turn_latency_p95": _percentile(turn_latencies, 95),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("stack", help="Prompt stack name (a directory under --stacks-dir)")
+    parser.add_argument("inputs", help="Directory of input files, or a JSONL file of {id, text} objects")
+    parser.add_argument("--output", default="batch_results.jsonl", help="Results JSONL, also used as checkpoint")
+    parser.add_argument("--stats", help="Where to write run statistics (default: <output>.stats.json)")
+    parser.add_argument("--model", help="Model as provider_name:model_id (default: first available)")
+    parser.add_argument("--system-prompt-file", help="File with the system prompt for every conversation")
+    parser.add_argument("--stacks-dir", default="prompt_stacks")
+    parser.add_argument("--concurrency", type=int, default=4, help="Conversations run at the same time")
+    parser.add_argument("--timeout", type=float, default=300, help="Deadline per turn in seconds (0 = none)")
+    args = parser.parse_args()
+    args.timeout = args.timeout or None
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(verbose=True, override=True)
+    except ImportError:
+        pass
+
+    stats = asyncio.run(run_batch(args))
+    stats_path = args.stats or args.output + ".stats.json"
+    with open(stats_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2)
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,665 @@
+"""
+Micro-benchmarks for performance-sensitive parts of the tool.
+
+Usage:
+    python benchmarks.py hedging [--requests N]
+    python benchmarks.py batch [--requests N]
+    python benchmarks.py importtime [--module M] [--max-ms MS]
+    python benchmarks.py transport [--requests N]
+    python benchmarks.py prefetch [--turns N]
+    python benchmarks.py uploads [--kb KB]
+    python benchmarks.py lexers [CORPUS ...]
+    python benchmarks.py formatter [--mb MB] [--one-block]
+    python benchmarks.py xml [--mb MB]
+    python benchmarks.py dispatch [--tasks N] [--burst N]
+"""
+
+from typing import Dict, List
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    def pick(pct):
+        return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99), "max": ordered[-1]}
+
+def bench_hedging(args):
+    """Tail latency of plain vs. hedged requests against the latency-injecting stub provider"""
+    from conversation_manager import ConversationManager
+    from llm_provider_stub import StubProvider
+    from request_hedging import HedgePolicy, HedgedChatSession, ModelHealth
+
+    provider = StubProvider(seed=args.seed)
+    provider.initialize()
+    provider.settings["latency_ms"].set_value(args.latency_ms)
+    provider.settings["jitter_ms"].set_value(args.jitter_ms)
+    provider.settings["stall_probability"].set_value(args.stall_probability)
+    provider.settings["stall_ms"].set_value(args.stall_ms)
+
+    policy = HedgePolicy(hedge_delay=(args.latency_ms + args.jitter_ms) / 1000.0,
+                         min_samples=20, min_delay=0.0)
+    health = ModelHealth()
+
+    async def one_request(hedged: bool, semaphore: asyncio.Semaphore) -> float:
+        async with semaphore:
+            cm = ConversationManager()
+            if hedged:
+                session = HedgedChatSession(cm, ["stub:stub-echo"], policy, health,
+                                            lambda target, fork: provider.create_chat_session("stub-echo", fork, None))
+            else:
+                session = provider.create_chat_session("stub-echo", cm, None)
+            cm.add_user_message(["ping"])
+            start = time.monotonic()
+            await session.send_message_async(["ping"])
+            return time.monotonic() - start
+
+    async def run(hedged: bool) -> List[float]:
+        semaphore = asyncio.Semaphore(args.concurrency)
+        return await asyncio.gather(*[one_request(hedged, semaphore) for _ in range(args.requests)])
+
+    for hedged in (False, True):
+        started = time.monotonic()
+        samples = asyncio.run(run(hedged))
+        stats = _percentiles(samples)
+        label = "hedged" if hedged else "plain"
+        print(f"{label:>8}: " + "  ".join(f"{k}={v * 1000:.0f}ms" for k, v in stats.items())
+              + f"  wall={time.monotonic() - started:.1f}s")
+
+def bench_batch(args):
+    """Native /batches path vs. the in-process fallback, end to end against fake_llm_server.py"""
+    import os
+    from conversation_manager import ConversationManager
+    from fake_llm_server import FakeLLMServer
+    from llm_provider import BatchRequest, LLMProvider
+
+    server = FakeLLMServer(latency_ms=args.latency_ms, batch_delay=args.batch_delay).start()
+    os.environ.update({"GROQ_API_KEY": "fake", "NOUS_API_KEY": "fake",
+                       "GROQ_BASE_URL": server.url, "NOUS_BASE_URL": server.url})
+    from llm_provider_generic_oai import GenericOAIWrapperProvider
+    provider = GenericOAIWrapperProvider()
+    provider.initialize()
+    provider.batch_concurrency = args.concurrency
+
+    def make_requests() -> List[BatchRequest]:
+        return [BatchRequest(custom_id=f"req-{i}", model_id="groq-llama-3.3-70b-versatile",
+                             conversation_manager=ConversationManager(), parts=[f"prompt {i}"])
+                for i in range(args.requests)]
+
+    async def run(native: bool):
+        requests = make_requests()
+        if native:
+            job = await provider.run_batch(requests, poll_interval=0.1)
+        else:
+            # Bypass the override to time the generic fallback on the same provider
+            job = await LLMProvider.submit_batch(provider, requests)
+            await job.handle
+        applied = job.apply_results()
+        history = requests[0].conversation_manager.get_full_history()
+        assert applied == len(requests) and history[-1]["parts"][0].endswith("prompt 0"), history
+        return job
+
+    for native in (True, False):
+        started = time.monotonic()
+        requests_before = server.request_count
+        job = asyncio.run(run(native))
+        failed = sum(1 for r in job.results.values() if r.error)
+        label = "native" if native else "fallback"
+        print(f"{label:>8}: wall={time.monotonic() - started:.2f}s  http_requests={server.request_count - requests_before}"
+              f"  results={len(job.results)}  failed={failed}")
+    server.stop()
+
+def bench_transport(args):
+    """Connection reuse and latency of the shared pooled transport vs. a new client per request, against fake_llm_server.py"""
+    import httpx
+    from fake_llm_server import FakeLLMServer
+    from http_transport import connection_stats, shared_async_client, warm_up
+
+    server = FakeLLMServer(latency_ms=args.latency_ms).start()
+    body = {"model": "bench", "messages": [{"role": "user", "content": "ping"}]}
+
+    async def run(pooled: bool) -> List[float]:
+        if pooled:
+            await warm_up(server.url, min_interval=0)
+        samples = []
+        for _ in range(args.requests):
+            start = time.monotonic()
+            if pooled:
+                response = await shared_async_client().post(f"{server.url}/chat/completions", json=body)
+            else:
+                async with httpx.AsyncClient() as client:
+                    response = await client.post(f"{server.url}/chat/completions", json=body)
+            response.raise_for_status()
+            samples.append(time.monotonic() - start)
+        return samples
+
+    for pooled in (False, True):
+        connections_before = server.connection_count
+        samples = asyncio.run(run(pooled))
+        stats = _percentiles(samples)
+        label = "pooled" if pooled else "fresh"
+        print(f"{label:>8}: " + "  ".join(f"{k}={v * 1000:.1f}ms" for k, v in stats.items())
+              + f"  server_connections={server.connection_count - connections_before}")
+    print(f"pool stats: {connection_stats()}")
+    server.stop()
+
+def bench_prefetch(args):
+    """Send-to-first-byte latency on a long conversation, with and without a session prefetched while typing"""
+    import json
+    import os
+    import tempfile
+    from conversation_manager import ConversationManager
+    from fake_llm_server import FakeLLMServer
+    from http_transport import warm_up
+    from request_prefetch import RequestPrefetcher
+
+    # The provider's debug output would print the whole history on every request
+    from icecream import ic
+    ic.disable()
+
+    server = FakeLLMServer().start()
+    # Route a providers.json entry to the fake server so the real UserUIModel path is measured
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"providers": [{"name": "bench", "factory": "llm_provider_generic_oai:OpenAICompatibleProvider",
+                                  "models": [{"id": "bench"}], "options": {"base_url": server.url}}]}, f)
+    os.environ["LLM_PROVIDERS_CONFIG"] = f.name
+    from user_ui_model import UserUIModel
+    ui_model = UserUIModel()
+    ui_model.set_provider("bench")
+    prefetcher = RequestPrefetcher(ui_model)
+    system_prompt = "You are a benchmark."
+
+    base = ConversationManager()
+    filler = " ".join(["lorem ipsum dolor sit amet"] * (args.message_chars // 26 + 1))[:args.message_chars]
+    for i in range(args.turns):
+        seq = base.add_user_message([f"question {i}: {filler}"])
+        base.add_model_message(f"answer {i}: {filler}", seq + 1)
+        base.seq_user += 1
+
+    async def run(prefetched: bool) -> List[float]:
+        samples = []
+        for i in range(args.requests):
+            conversation_manager = base.fork()
+            if prefetched:
+                # What happens in the background once typing pauses
+                prefetcher.prepare(conversation_manager, system_prompt)
+            start = time.monotonic()
+            session = (prefetcher.take_session(conversation_manager, system_prompt)
+                       or ui_model.generate_chat_session(conversation_manager, system_prompt))
+            await session.send_message_async([f"prompt {i}"])
+            samples.append(server.last_request_at - start)
+        return samples
+
+    async def run_both():
+        # One event loop for both, since pooled connections belong to the loop that opened them
+        await warm_up(server.url, min_interval=0)
+        for prefetched in (False, True):
+            stats = _percentiles(await run(prefetched))
+            label = "prefetch" if prefetched else "cold"
+            print(f"{label:>8}: " + "  ".join(f"{k}={v * 1000:.2f}ms" for k, v in stats.items()))
+
+    asyncio.run(run_both())
+    print(f"turns={args.turns}  prefetch stats: {prefetcher.stats}")
+    os.unlink(f.name)
+    server.stop()
+
+def bench_uploads(args):
+    """Attachment bytes sent per turn with file uploads: reuse, expiry and save/load of references, against fake_llm_server.py"""
+    import ast
+    import base64
+    import os
+    import tempfile
+    from context_autosave import write_context
+    from conversation_manager import ConversationManager
+    from fake_llm_server import FakeLLMServer
+
+    from icecream import ic
+    ic.disable()
+
+    server = FakeLLMServer().start()
+    os.environ.update({"GOOGLE_API_KEY": "fake", "GOOGLE_GEMINI_BASE_URL": server.base_url,
+                       # Half the attachment, so it is uploaded
+                       "LLM_UPLOAD_THRESHOLD_MB": str(args.kb / 2048)})
+    from llm_provider_google import GoogleAIProvider
+    provider = GoogleAIProvider()
+    provider.initialize()
+    model_id = provider.get_available_models()[-1].id
+    attachment = {"mime_type": "application/pdf", "data": os.urandom(args.kb * 1024), "display_name": "bench.pdf"}
+
+    async def turn(conversation_manager: ConversationManager, parts: List) -> None:
+        # As the UI does it: the session is created before the prompt is added to the conversation
+        session = provider.create_chat_session(model_id, conversation_manager, None)
+        conversation_manager.add_user_message(parts)
+        await session.send_message_async(parts)
+
+    def expire(conversation_manager: ConversationManager) -> ConversationManager:
+        # As if the provider's retention period had passed
+        server.gemini_files[attachment["file_name"]]["expires_at"] = time.time() - 1
+        attachment["file_expires"] = time.time() - 1
+        return conversation_manager
+
+    def save_and_load(conversation_manager: ConversationManager) -> ConversationManager:
+        # The context file format, read back like load_context does
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+            path = f.name
+        write_context(path, conversation_manager.get_full_history())
+        with open(path, encoding="utf-8") as f:
+            history = ast.literal_eval(f.read().split("history=", 1)[1].strip())
+        os.unlink(path)
+        for item in history:
+            for part in item["parts"]:
+                if isinstance(part, dict) and isinstance(part.get("data"), str):
+                    part["data"] = base64.b64decode(part["data"])
+        loaded = ConversationManager()
+        loaded.import_history(history)
+        return loaded
+
+    # (step, what happens to the conversation before the turn, parts, whether the attachment should be uploaded)
+    steps = [("first turn", None, ["Summarize the attachment.", attachment], True),
+             ("second turn", None, ["And the conclusion?"], False),
+             ("after expiry", expire, ["Once more, please."], True),
+             ("after save/load", save_and_load, ["Anything else?"], False)]
+    failures = []
+
+    async def run():
+        conversation_manager = ConversationManager()
+        for step, before, parts, uploads in steps:
+            if before:
+                conversation_manager = before(conversation_manager)
+            uploaded, inline, started = server.uploaded_bytes, server.inline_bytes, time.monotonic()
+            await turn(conversation_manager, parts)
+            uploaded, inline = server.uploaded_bytes - uploaded, server.inline_bytes - inline
+            print(f"{step:>16}: uploaded={uploaded / 1024:.0f} KB  inline={inline / 1024:.0f} KB  "
+                  f"wall={(time.monotonic() - started) * 1000:.0f}ms")
+            if inline:
+                failures.append(f"{step} sent {inline} bytes inline")
+            if bool(uploaded) != uploads:
+                failures.append(f"{step} {'did not upload' if uploads else 'uploaded'} the attachment")
+
+    asyncio.run(run())
+    server.stop()
+    if failures:
+        print("FAIL: " + ", ".join(failures))
+        sys.exit(1)
+
+# Code blocks used by the lexer benchmark when no corpus is given (tag, code)
+SYNTHETIC_BLOCKS = [
+    ("python", "import os\n\nclass Loader:\n    def load(self, path):\n        if path is None:\n            return None\n        with open(path) as f:\n            return f.read()\n"),
+    ("javascript", "const fs = require('fs');\nfunction load(path) {\n  if (path === undefined) return null;\n  return fs.readFileSync(path, 'utf8');\n}\nmodule.exports = { load };\n"),
+    ("bash", "#!/bin/bash\nset -e\nfor f in *.txt; do\n  echo \"$f\" | grep -q foo && mv \"$f\" done/\ndone\n"),
+    ("sql", "SELECT u.name, COUNT(o.id) AS orders\nFROM users u\nLEFT JOIN orders o ON o.user_id = u.id\nWHERE u.active = 1\nGROUP BY u.name\nORDER BY orders DESC;\n"),
+    ("json", '{"name": "example", "version": 3, "items": [{"id": 1, "tags": ["a", "b"]}, {"id": 2, "tags": []}]}'),
+    ("xml", "<config>\n  <server host=\"localhost\" port=\"8080\"/>\n  <users>\n    <user name=\"a\"/>\n  </users>\n</config>\n"),
+    ("go", "package main\n\nimport \"fmt\"\n\nfunc main() {\n\tx := 42\n\tfmt.Println(x)\n}\n"),
+    ("rust", "use std::collections::HashMap;\n\nfn main() {\n    let mut counts = HashMap::new();\n    counts.insert(\"a\", 1);\n    println!(\"{:?}\", counts);\n}\n"),
+    ("cpp", "#include <iostream>\n#include <vector>\n\nint main() {\n    std::vector<int> v{1, 2, 3};\n    for (auto x : v) std::cout << x << std::endl;\n}\n"),
+    ("java", "import java.util.List;\n\npublic class Main {\n    private int count;\n    public static void main(String[] args) {\n        System.out.println(\"hi\");\n    }\n}\n"),
+    ("yaml", "name: build\non: [push]\njobs:\n  test:\n    runs-on: ubuntu-latest\n    steps:\n      - uses: actions/checkout@v4\n"),
+]
+
+def _corpus_texts(paths: List[str]) -> List[str]:
+    """Model outputs from saved contexts (.py), batch results (.jsonl) or any other text files"""
+    import ast
+    import json
+    import pathlib
+
+    texts = []
+    files = [f for p in paths for f in (sorted(pathlib.Path(p).rglob("*")) if pathlib.Path(p).is_dir() else [pathlib.Path(p)])
+             if f.is_file()]
+    for file in files:
+        content = file.read_text(encoding="utf-8", errors="replace")
+        if file.suffix == ".jsonl":
+            for line in content.splitlines():
+                if line.strip():
+                    texts.extend(turn["response"] for turn in json.loads(line).get("turns", []))
+        elif file.suffix == ".py" and "history=" in content:
+            history = ast.literal_eval(content.split("history=", 1)[1].strip())
+            texts.extend(part for item in history if item["role"] == "model" for part in item["parts"] if isinstance(part, str))
+        else:
+            texts.append(content)
+    return texts
+
+def bench_lexers(args):
+    """Lexer selection for fenced code blocks: code_lexers (heuristics, capped guess) vs. pygments' guess_lexer"""
+    from pygments import lexers
+    from pygments.util import ClassNotFound
+    from code_lexers import detect_language, lexer_for
+    from preview_renderer import CODE_BLOCK
+
+    if args.corpus:
+        blocks = [(match.group(2).strip().lower(), match.group(3))
+                  for text in _corpus_texts(args.corpus) for match in CODE_BLOCK.finditer(text)]
+        print(f"corpus: {len(blocks)} code blocks")
+    else:
+        # Each sample at a few sizes, since guess_lexer's cost grows with the block
+        blocks = [(tag, code * repeat) for tag, code in SYNTHETIC_BLOCKS for repeat in (1, 10, 100)]
+        print(f"synthetic corpus: {len(blocks)} code blocks (pass saved contexts or batch results for real model outputs)")
+
+    def correct(tag, lexer) -> bool:
+        return tag in lexer.aliases or tag == lexer.name.lower()
+
+    def guess(code):
+        try:
+            return lexers.guess_lexer(code)
+        except ClassNotFound:
+            return lexers.get_lexer_by_name("text")
+
+    results = {}
+    for label, select in (("guess_lexer", guess), ("code_lexers", lambda code: lexer_for(code, None))):
+        samples, right, tagged = [], 0, 0
+        for tag, code in blocks:
+            start = time.perf_counter()
+            lexer = select(code)
+            samples.append(time.perf_counter() - start)
+            if tag:
+                tagged += 1
+                right += correct(tag, lexer)
+        results[label] = sum(samples)
+        stats = _percentiles(samples)
+        print(f"{label:>12}: total={sum(samples) * 1000:.1f}ms  " + "  ".join(f"{k}={v * 1000:.2f}ms" for k, v in stats.items())
+              + (f"  accuracy={right}/{tagged} tagged blocks" if tagged else ""))
+    detected = sum(detect_language(code) is not None for _, code in blocks)
+    print(f"heuristics decided {detected}/{len(blocks)} blocks; speedup {results['guess_lexer'] / max(results['code_lexers'], 1e-9):.1f}x")
+
+_legacy_formatters = {}
+
+def _legacy_format(tokens, style="monokai"):
+    """Block HTML as highlight_block made it before PreviewHtmlFormatter: HtmlFormatter, then regex and replace passes"""
+    import re
+    import pygments
+    from pygments.formatters import HtmlFormatter
+
+    def preserve_whitespace(match):
+        processed = re.sub(r'^([ \t]+)', lambda m: '&nbsp;' * len(m.group(1)), match.group(2), flags=re.MULTILINE)
+        processed = re.sub(r'  +', lambda m: '&nbsp; ' * (len(m.group(0)) // 2) + ('&nbsp;' if len(m.group(0)) % 2 else ''), processed)
+        return f'<span {match.group(1)}>{processed}</span>'
+
+    if style not in _legacy_formatters:
+        _legacy_formatters[style] = HtmlFormatter(style=style, lineseparator='<br/>')
+        # pygments 2.21 escapes the option; before that it was written as given
+        _legacy_formatters[style].lineseparator = '<br/>'
+    highlighted = pygments.format(tokens, _legacy_formatters[style])
+    highlighted = re.sub(r'<span([^>]*)>(.*?)</span>', preserve_whitespace, highlighted, flags=re.DOTALL)
+    return highlighted.replace('<div class="highlight"><pre>', '<div class="highlight"><div class="code-wrapper">'
+                               ).replace('</pre></div>', '</div></div>')
+
+def _same_html(legacy, html):
+    """Whether both render the same: the regex pass spelled span tags with two spaces, and escaping differs by pygments version"""
+    import html as html_module
+    legacy = legacy.replace("<span  class=", "<span class=").replace("<span ></span>", "<span></span>")
+    return html_module.unescape(legacy) == html_module.unescape(html)
+
+def bench_formatter(args):
+    """Preview HTML of a large message: PreviewHtmlFormatter (one pass) vs. HtmlFormatter plus regex passes"""
+    import tracemalloc
+    import pygments
+    from code_lexers import lexer_for
+    from preview_renderer import highlight_block, html_formatter, split_blocks
+
+    # Prose with indented, space-aligned code blocks in several languages, as in long model answers
+    parts, size, i = [], 0, 0
+    while size < args.mb * 1024 * 1024:
+        tag, code = SYNTHETIC_BLOCKS[i % len(SYNTHETIC_BLOCKS)]
+        if args.one_block:
+            part = code
+        else:
+            part = f"Step {i}:  the  following   code\n  does **this**\n\n```{tag}\n{code * 20}```\n\n"
+        parts.append(part)
+        size += len(part)
+        i += 1
+    blocks = [("".join(parts), "python")] if args.one_block else split_blocks("".join(parts))
+
+    # Lexing costs the same either way, so it is timed once and the formatters get the same tokens
+    start = time.perf_counter()
+    tokens = [list(lexer_for(text, lexer_name).get_tokens(text)) for text, lexer_name in blocks]
+    print(f"message: {size / (1024 * 1024):.2f} MB, {len(blocks)} blocks, {sum(map(len, tokens))} tokens; "
+          f"lexing took {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    formatter = html_formatter("monokai")[0]
+    outputs, times = {}, {}
+    for label, format_block in (("regex passes", _legacy_format),
+                                ("one pass", lambda block: pygments.format(block, formatter))):
+        format_block(tokens[0])
+        samples = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            outputs[label] = "".join(format_block(block) for block in tokens)
+            samples.append(time.perf_counter() - start)
+        # Peak of the intermediate strings of the biggest block
+        biggest = max(tokens, key=len)
+        tracemalloc.start()
+        format_block(biggest)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        times[label] = min(samples)
+        print(f"{label:>12}: best={min(samples) * 1000:.0f}ms  median={sorted(samples)[len(samples) // 2] * 1000:.0f}ms  "
+              f"peak allocations={peak / 1024:.0f} KB per {len(biggest)} token block")
+
+    identical = _same_html(outputs["regex passes"], outputs["one pass"])
+    # highlight_block must match too (lexer selection included)
+    identical = identical and _same_html("".join(_legacy_format(block) for block in tokens[:50]),
+                                         "".join(highlight_block(text, lexer_name) for text, lexer_name in blocks[:50]))
+    print(f"same highlighting: {identical}; formatting speedup {times['regex passes'] / times['one pass']:.2f}x")
+    if not identical:
+        sys.exit(1)
+
+def _legacy_fix_content(text):
+    """fix_content(text, reindent_xml=True) as it was: BeautifulSoup prettify() per block, then whole-text regexes"""
+    import re
+    import warnings
+    from bs4 import BeautifulSoup
+
+    def process_xml(match):
+        xml_content = match.group(1).strip()
+        try:
+            if not xml_content.startswith("<?xml"):
+                xml_content = '<?xml version="1.0" encoding="UTF-8"?>' + "\n" + xml_content
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                pretty_xml = BeautifulSoup(xml_content, 'html.parser').find().prettify().strip()
+            return f"```xml\n{pretty_xml}\n```"
+        except Exception as e:
+            return f"```xml\n<!-- Invalid XML: {e} -->\n{xml_content}\n```"
+
+    text = re.sub(r'```xml(.*?)```', process_xml, text, flags=re.DOTALL)
+    text = re.sub(r'<!--[\s]*', r'<!-- ', text)
+    return re.sub(r'<([^>/]+)([^>]*)>\s*</\1>', r'<\1\2/>', text)
+
+def bench_xml(args):
+    """XML cleanup of a large artifact: content_utils' streaming reindenter (cold and memoized) vs. BeautifulSoup"""
+    import random
+    import content_utils
+
+    # A config-like document: nested elements with attributes, text, comments and empty elements
+    rng = random.Random(0)
+    parts, size, i = ["```xml\n<?xml version=\"1.0\"?>\n<catalog>"], 0, 0
+    while size < args.mb * 1024 * 1024:
+        part = (f'<item id="{i}" kind="{rng.choice(["a", "b", "c"])}"><!--item {i}--><name>Item  {i}</name>'
+                f'<tags>{"".join(f"<tag>{rng.randint(0, 99)}</tag>" for _ in range(rng.randint(0, 4)))}</tags>'
+                f'<note></note><price currency="EUR">{rng.random() * 100:.2f}</price></item>')
+        parts.append(part)
+        size += len(part)
+        i += 1
+    text = "".join(parts) + "</catalog>\n```\n"
+    print(f"artifact: {len(text) / (1024 * 1024):.2f} MB, {i} items")
+
+    def timed(function) -> float:
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+
+    legacy = min(timed(lambda: _legacy_fix_content(text)) for _ in range(args.runs))
+    cold = []
+    for _ in range(args.runs):
+        content_utils._reindented.clear()
+        cold.append(timed(lambda: content_utils.fix_content(text)))
+    warm = min(timed(lambda: content_utils.fix_content(text)) for _ in range(args.runs))
+    print(f"BeautifulSoup: {legacy * 1000:.0f}ms")
+    print(f"   reindenter: {min(cold) * 1000:.0f}ms cold, {warm * 1000:.1f}ms memoized; "
+          f"speedup {legacy / min(cold):.1f}x cold, {legacy / warm:.0f}x memoized")
+    lines = content_utils.fix_content(text).count("\n"), _legacy_fix_content(text).count("\n")
+    print(f"lines: {lines[0]} (reindenter), {lines[1]} (BeautifulSoup)")
+
+    # An unterminated tag with a long name and attribute, as in a truncated response: must stay linear
+    for n in (1000, 4000, 16000):
+        pathological = "<" + "a" * n + " " + "x" * n
+        print(f"unterminated tag of {2 * n + 2} chars: {timed(lambda: content_utils.reindent_xml(pathological)) * 1000:.1f}ms")
+
+def bench_dispatch(args):
+    """Delay from posting work on a background thread to running it on the UI loop: 100 ms queue polling vs. TkDispatcher"""
+    import queue
+    import threading
+    from tk_dispatcher import TkDispatcher
+
+    async def run(label, post, start_consumer):
+        latencies = []
+        done = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def task(posted):
+            latencies.append(time.perf_counter() - posted)
+            if len(latencies) == args.tasks:
+                done.set()
+
+        def produce():
+            # Bursts of tasks, like a ZMQ burst or a response with many function calls
+            for i in range(args.tasks):
+                posted = time.perf_counter()
+                post(lambda posted=posted: task(posted))
+                if (i + 1) % args.burst == 0:
+                    time.sleep(args.gap_ms / 1000.0)
+
+        consumer = start_consumer(loop)
+        start = time.perf_counter()
+        threading.Thread(target=produce, daemon=True).start()
+        await done.wait()
+        elapsed = time.perf_counter() - start
+        if consumer:
+            consumer.cancel()
+        stats = _percentiles(latencies)
+        print(f"{label:>14}: {args.tasks} tasks in {elapsed:.2f}s  " + "  ".join(f"{k}={v * 1000:.1f}ms" for k, v in stats.items()))
+
+    async def main():
+        # As listen_to_queue did: every 100 ms, take one task from the queue and hand it to Tk
+        pending = queue.Queue()
+
+        async def poll():
+            while True:
+                if not pending.empty():
+                    asyncio.get_running_loop().call_soon(pending.get())
+                await asyncio.sleep(0.1)
+
+        await run("queue polling", pending.put, lambda loop: asyncio.ensure_future(poll()))
+
+        dispatcher = TkDispatcher()
+        await run("TkDispatcher", dispatcher.post, lambda loop: dispatcher.start(loop))
+        print(dispatcher.describe(), dispatcher.stats)
+
+    asyncio.run(main())
+
+# Heavy dependencies that must not be imported at startup
+STARTUP_FORBIDDEN = ["google.genai", "openai", "pygments", "tkinterweb", "bs4"]
+
+def bench_importtime(args):
+    """Cold import time of a module (python -X importtime), failing if it is too slow or pulls in heavy SDKs"""
+    samples = []
+    for _ in range(args.runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {args.module}"],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print(result.stderr.strip().splitlines()[-1])
+            sys.exit(result.returncode)
+
+        # Lines look like "import time:   self [us] | cumulative | imported package", nested packages indented
+        imports = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "imported package" in line:
+                continue
+            self_us, cumulative_us, package = line[len("import time:"):].split("|")
+            imports[package.strip()] = (int(self_us), int(cumulative_us), len(package) - len(package.lstrip()))
+        samples.append(sum(cumulative for _, cumulative, depth in imports.values() if depth == 1) / 1000.0)
+
+    print(f"{args.module}: best={min(samples):.1f}ms  median={sorted(samples)[len(samples) // 2]:.1f}ms  runs={args.runs}")
+    for package, (self_us, cumulative_us, depth) in sorted(imports.items(), key=lambda i: -i[1][1])[:args.top]:
+        print(f"  {cumulative_us / 1000.0:8.1f}ms  {'  ' * (depth - 1)}{package}")
+
+    failures = [f"imports {name}" for name in args.forbid if name in imports]
+    if args.max_ms and min(samples) > args.max_ms:
+        failures.append(f"takes {min(samples):.1f}ms (limit {args.max_ms:.1f}ms)")
+    if failures:
+        print(f"FAIL: {args.module} " + ", ".join(failures))
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    hedging = subparsers.add_parser("hedging", help=bench_hedging.__doc__)
+    hedging.add_argument("--requests", type=int, default=200)
+    hedging.add_argument("--concurrency", type=int, default=20)
+    hedging.add_argument("--latency-ms", type=int, default=100)
+    hedging.add_argument("--jitter-ms", type=int, default=100)
+    hedging.add_argument("--stall-probability", type=float, default=0.05)
+    hedging.add_argument("--stall-ms", type=int, default=3000)
+    hedging.add_argument("--seed", type=int, default=0)
+    hedging.set_defaults(func=bench_hedging)
+
+    batch = subparsers.add_parser("batch", help=bench_batch.__doc__)
+    batch.add_argument("--requests", type=int, default=100)
+    batch.add_argument("--concurrency", type=int, default=4, help="Fallback concurrency")
+    batch.add_argument("--latency-ms", type=int, default=50, help="Fake server latency per chat completion")
+    batch.add_argument("--batch-delay", type=float, default=0.5, help="Fake server delay before a batch runs")
+    batch.set_defaults(func=bench_batch)
+
+    importtime = subparsers.add_parser("importtime", help=bench_importtime.__doc__)
+    importtime.add_argument("--module", default="gemini_llm_tkui")
+    importtime.add_argument("--runs", type=int, default=5)
+    importtime.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    importtime.add_argument("--max-ms", type=float, default=0, help="Fail above this import time (0 = no limit)")
+    importtime.add_argument("--forbid", nargs="*", default=STARTUP_FORBIDDEN, help="Fail if any of these modules is imported")
+    importtime.set_defaults(func=bench_importtime)
+
+    transport = subparsers.add_parser("transport", help=bench_transport.__doc__)
+    transport.add_argument("--requests", type=int, default=200)
+    transport.add_argument("--latency-ms", type=int, default=0, help="Fake server latency per request")
+    transport.set_defaults(func=bench_transport)
+
+    prefetch = subparsers.add_parser("prefetch", help=bench_prefetch.__doc__)
+    prefetch.add_argument("--turns", type=int, default=500, help="Conversation length (user + model pairs)")
+    prefetch.add_argument("--message-chars", type=int, default=2000)
+    prefetch.add_argument("--requests", type=int, default=20)
+    prefetch.set_defaults(func=bench_prefetch)
+
+    uploads = subparsers.add_parser("uploads", help=bench_uploads.__doc__)
+    uploads.add_argument("--kb", type=int, default=8192, help="Attachment size")
+    uploads.set_defaults(func=bench_uploads)
+
+    lexer = subparsers.add_parser("lexers", help=bench_lexers.__doc__)
+    lexer.add_argument("corpus", nargs="*", help="Saved contexts (.py), batch results (.jsonl), text files or directories")
+    lexer.set_defaults(func=bench_lexers)
+
+    formatter = subparsers.add_parser("formatter", help=bench_formatter.__doc__)
+    formatter.add_argument("--mb", type=float, default=1.0, help="Message size")
+    formatter.add_argument("--runs", type=int, default=3)
+    formatter.add_argument("--one-block", action="store_true", help="One code block of that size instead of markdown with many")
+    formatter.set_defaults(func=bench_formatter)
+
+    xml = subparsers.add_parser("xml", help=bench_xml.__doc__)
+    xml.add_argument("--mb", type=float, default=1.0, help="Artifact size")
+    xml.add_argument("--runs", type=int, default=3)
+    xml.set_defaults(func=bench_xml)
+
+    dispatch = subparsers.add_parser("dispatch", help=bench_dispatch.__doc__)
+    dispatch.add_argument("--tasks", type=int, default=200)
+    dispatch.add_argument("--burst", type=int, default=20, help="Tasks posted back to back")
+    dispatch.add_argument("--gap-ms", type=float, default=50, help="Pause between bursts")
+    dispatch.set_defaults(func=bench_dispatch)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
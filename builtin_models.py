@@ -0,0 +1,51 @@
+"""
+Model lists of the built-in providers, used both by the providers and by
+their registry specs (user_ui_model.builtin_provider_specs). Kept apart from
+the provider modules so the UI can list the models, with their hedging
+policies, without importing any provider SDK.
+"""
+
+from typing import List
+import os
+
+from llm_provider import ModelOption
+from request_hedging import HedgePolicy
+
+def google_models() -> List[ModelOption]:
+    """Gemini Developer API models with GOOGLE_API_KEY set, Vertex AI models otherwise"""
+    if "GOOGLE_API_KEY" in os.environ:
+        stable_model = "gemini-1.5-pro"
+        models = [ModelOption(id="gemini-1.5-pro", name="Gemini 1.5 Pro")]
+    else:
+        stable_model = "gemini-1.5-pro-002"
+        models = [
+            ModelOption(id="gemini-1.5-pro-002", name="Gemini 1.5 Pro"),
+            ModelOption(id="gemini-2.0-flash-exp", name="Gemini 2.0 Flash Experimental"),
+            ModelOption(id="gemini-2.0-flash-thinking-exp-01-21", name="Gemini 2.0 Flash Experimental (Thinking)")
+        ]
+    return [
+        ModelOption(
+            id="gemini-2.0-pro-exp-02-05",
+            name="Gemini 2.0 Pro Experimental",
+            # Experimental models occasionally stall; hedge to the stable model
+            hedge=HedgePolicy(hedge_delay=45.0, fallback_models=[f"google_ai:{stable_model}"])
+        )
+    ] + models
+
+def groq_nous_models() -> List[ModelOption]:
+    return [
+        ModelOption(id="groq-llama-3.3-70b-versatile", name="Llama 3.3 70B Versatile (Groq)"),
+        ModelOption(id="nous-Hermes-3-Llama-3.1-70B", name="Hermes 3 Llama 3.1 70B (Nous)"),
+        ModelOption(id="nous-DeepHermes-3-Mistral-24B-Preview", name="DeepHermes 3 Mistral 24B Preview (Nous)"),
+        ModelOption(id="nous-DeepHermes-3-Llama-3-8B-Preview", name="DeepHermes 3 Llama 3 8B Preview (Nous)")
+    ]
+
+def stub_models() -> List[ModelOption]:
+    return [
+        ModelOption(id="stub-echo", name="Echo Stub"),
+        ModelOption(
+            id="stub-echo-hedged",
+            name="Echo Stub (Hedged)",
+            hedge=HedgePolicy(hedge_delay=1.0, fallback_models=["stub:stub-echo"])
+        )
+    ]
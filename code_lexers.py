@@ -0,0 +1,116 @@
+"""
+Lexer selection for the preview's code blocks.
+
+pygments' guess_lexer runs every lexer's analyse_text over the whole block,
+which is slow on large blocks (and often wrong on ordinary code). Blocks
+without a language tag are first run through cheap heuristics on a bounded
+prefix: shebang, XML / JSON sniffing and keyword histograms. guess_lexer is
+only the last resort, for blocks up to a size cap. Lexers are created once
+per name and reused.
+
+Settings (environment):
+  LLM_LEXER_GUESS_MAX_CHARS   largest untagged block given to guess_lexer (default 20000, 0: never)
+"""
+
+from typing import Dict, List, Optional, Tuple
+import functools
+import os
+import re
+
+from content_utils import looks_like_json, looks_like_xml
+
+# Heuristics only look at this much of a block
+PREFIX_CHARS = 4096
+
+SHEBANG = re.compile(r"#!\s*(?:/usr)?(?:/local)?/bin/(?:env\s+)?(\w+)")
+SHEBANG_LANGUAGES = {"python": "python", "python3": "python", "bash": "bash", "sh": "bash", "zsh": "bash",
+                     "node": "javascript", "perl": "perl", "ruby": "ruby"}
+
+# Per language, patterns typical of it; a block's score is the number of matches in its prefix
+KEYWORDS: Dict[str, List[str]] = {
+    "python": [r"^\s*def \w+\(.*\):", r"^\s*(?:from [\w.]+ )?import \w+", r"^\s*class \w+(?:\(.*\))?:", r"\bself\.",
+               r"\belif\b", r"\bNone\b", r"^\s*@\w+", r'"""', r"\bprint\("],
+    "javascript": [r"\bfunction\s*\w*\s*\(", r"\b(?:const|let|var) \w+\s*=", r"=>", r"\bconsole\.log\(",
+                   r"\brequire\(", r"\bexport (?:default )?", r"===", r"\bundefined\b"],
+    "typescript": [r"\w\??:\s*(?:string|number|boolean|any|void)\b", r"\binterface \w+\s*\{", r"\btype \w+\s*=",
+                   r"\bimplements\b"],
+    "java": [r"\bpublic (?:static )?(?:class|void|final)\b", r"\bSystem\.out\.print", r"\bprivate \w+",
+             r"@Override", r"\bimport java\."],
+    "c": [r"^#include\s*<\w+\.h>", r"\bprintf\(", r"\bint main\(", r"\bmalloc\(", r"\bstruct \w+"],
+    "cpp": [r"^#include\s*<\w+>", r"\bstd::", r"\bcout\b", r"\btemplate\s*<", r"\bnamespace\b"],
+    "go": [r"^package \w+", r"\bfunc (?:\(\w+ \*?\w+\) )?\w+\(", r":=", r"\bfmt\.", r"\bgo func\b"],
+    "rust": [r"\bfn \w+\(", r"\blet mut\b", r"\bimpl\b", r"\bpub fn\b", r"\bprintln!\(", r"&mut\b", r"\buse \w+::"],
+    "bash": [r"^\s*(?:sudo|apt|apt-get|pip|npm|cd|ls|echo|export|git|docker|curl|mkdir|rm|uv)\s", r"\$\{?\w+\}?",
+             r"^\s*(?:if|then|fi|for|do|done)\b", r"\|\s*(?:grep|awk|sed|xargs)\b", r"^\$ "],
+    "sql": [r"(?i)\bselect\b.+\bfrom\b", r"(?i)\b(?:insert into|create table|update \w+ set|delete from)\b",
+            r"(?i)\b(?:where|join|group by|order by)\b"],
+    "css": [r"^\s*[.#]?[\w-]+(?:\s*[,>]\s*[.#]?[\w-]+)*\s*\{", r"^\s*[\w-]+:\s*[^;]+;", r"@media\b"],
+    "yaml": [r"^\s*[\w-]+:(?:\s+[^\s{]|$)", r"^\s*- \w", r"^---\s*$"],
+}
+_KEYWORD_PATTERNS: Dict[str, List[re.Pattern]] = {
+    language: [re.compile(pattern, re.MULTILINE) for pattern in patterns] for language, patterns in KEYWORDS.items()
+}
+# Languages whose patterns are only distinctive on top of another one's
+REFINES = {"typescript": "javascript", "cpp": "c"}
+MIN_SCORE = 3
+
+def guess_max_chars() -> int:
+    return int(os.environ.get("LLM_LEXER_GUESS_MAX_CHARS", "20000"))
+
+@functools.lru_cache(maxsize=None)
+def get_lexer(name: str):
+    """A lexer by name or alias, created once (raises pygments.util.ClassNotFound)"""
+    from pygments import lexers
+    return lexers.get_lexer_by_name(name)
+
+def keyword_scores(prefix: str) -> Dict[str, int]:
+    return {language: sum(len(pattern.findall(prefix)) for pattern in patterns)
+            for language, patterns in _KEYWORD_PATTERNS.items()}
+
+def detect_language(code: str) -> Optional[str]:
+    """Lexer name from cheap heuristics on the start of the block; None if unsure"""
+    prefix = code[:PREFIX_CHARS]
+    stripped = prefix.lstrip()
+
+    shebang = SHEBANG.match(stripped)
+    if shebang:
+        return SHEBANG_LANGUAGES.get(shebang.group(1))
+    if looks_like_xml(stripped):
+        return "html" if re.match(r"(?i)<(?:!doctype html|html)\b", stripped) else "xml"
+    if stripped[:1] in ("{", "["):
+        # A quoted key is convincing enough (also for JSON Lines); otherwise parse blocks of a bounded size
+        if re.match(r'[\[{\s]*"[^"\n]*"\s*:', stripped) or (len(code) <= PREFIX_CHARS * 4 and looks_like_json(code)):
+            return "json"
+
+    scores = keyword_scores(prefix)
+    ranked: List[Tuple[int, str]] = sorted(((score, language) for language, score in scores.items()), reverse=True)
+    best_score, best = ranked[0]
+    runner_up = next((score for score, language in ranked[1:] if REFINES.get(language) != best and REFINES.get(best) != language), 0)
+    if best_score < MIN_SCORE or best_score < runner_up * 1.5:
+        return None
+    # A base language with the refining one's distinctive features is the refining one
+    for refined, base in REFINES.items():
+        if best == base and scores[refined] >= 2:
+            return refined
+    return best
+
+def lexer_for(code: str, lexer_name: Optional[str] = None):
+    """
+    The lexer of a code block: by name if tagged, else detected, else guessed
+    by pygments (small blocks only), else plain text
+    """
+    from pygments.util import ClassNotFound
+
+    try:
+        if lexer_name:
+            return get_lexer(lexer_name)
+        detected = detect_language(code)
+        if detected:
+            return get_lexer(detected)
+        if len(code) <= guess_max_chars():
+            from pygments import lexers
+            return lexers.guess_lexer(code)
+    except ClassNotFound:
+        pass
+    # Default to text if we can't determine the language
+    return get_lexer("text")
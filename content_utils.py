@@ -1,25 +1,123 @@
+from collections import OrderedDict
+from typing import List, Optional
+import hashlib
+import json
 import re
-from bs4 import BeautifulSoup
+import threading
+
+def looks_like_xml(text: str) -> bool:
+    """Starts with a tag (XML declaration, XML or HTML); a simplistic check that catches most markup"""
+    stripped = text.strip()
+    return stripped.startswith('<') and '>' in stripped
+
+def looks_like_json(text: str) -> bool:
+    """A JSON object or array; parses the text, so callers bound its size where that matters"""
+    stripped = text.strip()
+    if not ((stripped.startswith('{') and stripped.endswith('}')) or
+            (stripped.startswith('[') and stripped.endswith(']'))):
+        return False
+    try:
+        json.loads(stripped)
+    except (ValueError, RecursionError):
+        return False
+    return True
+
+# Markup of an XML block; whatever does not parse as markup (e.g. a stray "<") is text.
+# Names and attributes are matched possessively (Python 3.11+): an unterminated tag
+# must fail in one scan instead of retrying every split of the name and attributes.
+XML_TOKEN = re.compile(r"""
+    (?P<comment><!--.*?(?:-->|\Z))
+  | (?P<cdata><!\[CDATA\[.*?(?:\]\]>|\Z))
+  | (?P<special><[?!][^<>]*>)
+  | (?P<close></(?P<close_name>[A-Za-z_:][\w:.-]*+)\s*+>)
+  | (?P<open><(?P<open_name>[A-Za-z_:][\w:.-]*+)(?:"[^"<]*+"|'[^'<]*+'|[^'"<>])*+>)
+  | (?P<text>[^<]+|<)
+""", re.DOTALL | re.VERBOSE)
+
+def reindent_xml(xml: str, indent: str = " ") -> str:
+    """
+    Put each tag, comment and text of an XML block on its own line, indented
+    by nesting depth, and collapse empty elements to <tag/>. A single pass
+    over the tokens: malformed markup is kept as text and unmatched closing
+    tags are written where they are, so any input gives a result.
+    """
+    lines: List[str] = []
+    stack: List[str] = []
+    text: List[str] = []
+    # Opening tag not yet written, in case the element turns out to be empty
+    pending: Optional[str] = None
+
+    def write(line: str, depth: int) -> None:
+        lines.append(indent * depth + line)
+
+    for match in XML_TOKEN.finditer(xml):
+        kind = match.lastgroup
+        token = match.group()
+        if kind == "text":
+            text.append(token)
+            continue
+        if pending is not None:
+            if kind == "close" and match.group("close_name") == stack[-1] and not "".join(text).strip():
+                stack.pop()
+                write(pending[:-1] + "/>", len(stack))
+                pending = None
+                text.clear()
+                continue
+            write(pending, len(stack) - 1)
+            pending = None
+        if text:
+            stripped = "".join(text).strip()
+            if stripped:
+                write(stripped, len(stack))
+            text.clear()
+
+        if kind == "open":
+            if token.endswith("/>"):
+                write(token, len(stack))
+            else:
+                stack.append(match.group("open_name"))
+                pending = token
+        elif kind == "close":
+            name = match.group("close_name")
+            if name in stack:
+                while stack.pop() != name:
+                    pass
+            write(token, len(stack))
+        elif kind == "comment":
+            write("<!-- " + token[4:].lstrip(), len(stack))
+        else:
+            write(token, len(stack))
+
+    if pending is not None:
+        write(pending, len(stack) - 1)
+    stripped = "".join(text).strip()
+    if stripped:
+        write(stripped, len(stack))
+    return "\n".join(lines)
+
+# Reindented XML blocks by hash of their text, most recently used last
+_reindented: "OrderedDict[bytes, str]" = OrderedDict()
+_reindented_lock = threading.Lock()
+REINDENT_MEMO_SIZE = 64
+
+def reindent_xml_block(xml: str) -> str:
+    """reindent_xml(), remembered for the most recent blocks (previews re-render the same ones)"""
+    key = hashlib.blake2b(xml.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    with _reindented_lock:
+        if key in _reindented:
+            _reindented.move_to_end(key)
+            return _reindented[key]
+    result = reindent_xml(xml)
+    with _reindented_lock:
+        _reindented[key] = result
+        while len(_reindented) > REINDENT_MEMO_SIZE:
+            _reindented.popitem(last=False)
+    return result
+
+XML_BLOCK = re.compile(r'```xml(.*?)```', re.DOTALL)
 
 def fix_content(text: str, reindent_xml: bool = True):
-        # Define a callback function to process each XML block
-        def process_xml(match):
-            xml_content = match.group(1).strip()
-            try:
-                if not xml_content.startswith("<?xml"):
-                    xml_content = '<?xml version="1.0" encoding="UTF-8"?>' + "\n" + xml_content
-                soup = BeautifulSoup(xml_content, 'html.parser')
-                pretty_xml = soup.find().prettify()
-                pretty_xml = pretty_xml.strip()
-                return f"```xml\n{pretty_xml}\n```"
-            except Exception as e:
-                # If parsing fails, return the original block with an error message
-                return f"```xml\n<!-- Invalid XML: {e} -->\n{xml_content}\n```"
-
-        # Use re.sub to find and replace all XML blocks
-        if reindent_xml:
-            text = re.sub(r'```xml(.*?)```', process_xml, text, flags=re.DOTALL)
-            text = re.sub(r'<!--[\s]*', r'<!-- ', text)
-            text = re.sub(r'<([^>/]+)([^>]*)>\s*</\1>', r'<\1\2/>', text)
-
-        return text
+    """With reindent_xml, the ```xml blocks of the text reindented (see reindent_xml())"""
+    if reindent_xml:
+        text = XML_BLOCK.sub(lambda match: f"```xml\n{reindent_xml_block(match.group(1).strip())}\n```", text)
+    return text
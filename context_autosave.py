@@ -0,0 +1,89 @@
+"""
+Saving the conversation in the context file format that load_context reads,
+on request or automatically.
+
+Autosave is driven by the conversation's change events: nothing is scanned
+or written until something changes, and a burst of changes (a response with
+several function calls) is written once, in a background thread.
+
+Settings (environment):
+  LLM_AUTOSAVE         file to save the conversation to after every change (default: off)
+  LLM_AUTOSAVE_DELAY   seconds to wait for further changes before writing (default 2)
+"""
+
+from typing import Any, Dict, List, Optional
+import base64
+import os
+import pprint
+import threading
+
+from conversation_events import ConversationEvent
+
+def _prepare_data(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: _prepare_data(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_prepare_data(item) for item in obj]
+    elif isinstance(obj, bytes):
+        # Base64, like AI Studio exports, which load_context expects
+        return base64.b64encode(obj).decode("ascii")
+    else:
+        return obj
+
+def write_context(file_path: str, history: List[Dict[str, Any]]) -> None:
+    """Write the history as a loadable context file (valid Python, via pprint)"""
+    pp = pprint.PrettyPrinter(indent=2, width=120)
+    text = f"history={pp.pformat(_prepare_data(history))}\n\n"
+    with open(file_path, "w", encoding="utf-8") as file:
+        file.write(text)
+
+class ContextAutosave:
+    """Write the conversation to a file shortly after it changes"""
+
+    def __init__(self, conversation_manager, file_path: str, delay: float = 2.0):
+        self.conversation_manager = conversation_manager
+        self.file_path = file_path
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self.unsubscribe = conversation_manager.events.subscribe(self._on_change)
+
+    @classmethod
+    def from_env(cls, conversation_manager) -> Optional["ContextAutosave"]:
+        file_path = os.environ.get("LLM_AUTOSAVE")
+        if not file_path:
+            return None
+        return cls(conversation_manager, file_path, float(os.environ.get("LLM_AUTOSAVE_DELAY", "2")))
+
+    def _on_change(self, event: Optional[ConversationEvent]) -> None:
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.save)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def save(self) -> None:
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+            self._timer = None
+        history = list(self.conversation_manager.history)
+        temp_path = self.file_path + ".tmp"
+        try:
+            write_context(temp_path, history)
+            os.replace(temp_path, self.file_path)
+        except RuntimeError:
+            # An item changed while it was being written (e.g. an upload reference was added); retry
+            self._on_change(None)
+            return
+        except OSError as e:
+            print(f">> Autosave to {self.file_path} failed: {e}")
+            return
+        print(f">> Autosaved {len(history)} items to {self.file_path}")
+
+    def flush(self) -> None:
+        """Write now if a save is pending (e.g. on exit)"""
+        with self._lock:
+            pending = self._timer is not None
+        if pending:
+            self.save()
@@ -0,0 +1,93 @@
+"""
+Typed change events of a conversation.
+
+ConversationManager (and the ArtifactManager it owns) publish an event for
+every change, so views can update just what changed instead of rescanning
+the whole history. Events can be published from any thread; a subscriber
+that passes `dispatch` gets events from other threads through it (e.g. onto
+the Tk thread), and those from its own thread directly.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+import threading
+import traceback
+
+class ConversationEvent:
+    """Base class of all change events"""
+
+@dataclass
+class ItemAppended(ConversationEvent):
+    index: int
+    item: Dict[str, Any]
+
+@dataclass
+class ItemEdited(ConversationEvent):
+    index: int
+    item: Dict[str, Any]
+
+@dataclass
+class ItemDeleted(ConversationEvent):
+    index: int
+    item: Dict[str, Any]
+
+@dataclass
+class HistoryReplaced(ConversationEvent):
+    """The history was replaced as a whole (loaded, imported or rolled back)"""
+
+@dataclass
+class ArtifactVersionAdded(ConversationEvent):
+    artifact_id: str
+    sequence: int
+    content: str
+    version: int  # 1 for a newly created artifact
+
+@dataclass
+class MemoryChanged(ConversationEvent):
+    memory_id: int
+    contents: Optional[str]  # None: deleted
+
+@dataclass
+class SystemPromptChanged(ConversationEvent):
+    system_prompt: str
+
+Subscriber = Callable[[ConversationEvent], None]
+
+class EventBus:
+    """Thread-safe publish / subscribe of conversation events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: List[Tuple[Subscriber, Tuple[Type[ConversationEvent], ...], Optional[Callable], int]] = []
+
+    def subscribe(self, callback: Subscriber, *event_types: Type[ConversationEvent],
+                  dispatch: Optional[Callable[[Callable[[], None]], None]] = None) -> Callable[[], None]:
+        """
+        Call callback for events of the given types (all if none are given).
+        Events published on other threads than this one go through dispatch,
+        if given. Returns a function that unsubscribes.
+        """
+        entry = (callback, event_types or (ConversationEvent,), dispatch, threading.get_ident())
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    def publish(self, event: ConversationEvent) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback, event_types, dispatch, thread_id in subscribers:
+            if not isinstance(event, event_types):
+                continue
+            if dispatch and thread_id != threading.get_ident():
+                dispatch(lambda callback=callback: callback(event))
+                continue
+            try:
+                callback(event)
+            except Exception:
+                # A failing view must not break the change that was made
+                traceback.print_exc()
@@ -1,22 +1,50 @@
 from typing import Dict, List, Any, Optional
 from artifact_manager import ArtifactManager
+from conversation_events import (ArtifactVersionAdded, EventBus, HistoryReplaced, ItemAppended, ItemDeleted, ItemEdited,
+                                 MemoryChanged, SystemPromptChanged)
 
 class ConversationManager:
     """Manages the conversation history and artifacts"""
     
     def __init__(self):
+        # Change events of this conversation (see conversation_events.py); forks get their own
+        self.events = EventBus()
         self.history: List[Dict[str, Any]] = []
-        self.artifact_manager = ArtifactManager()
+        self.artifact_manager = ArtifactManager(self.events)
         self.seq_user = 0
         self.system_prompt = ""
         self.system_prompt_setup = ""
         self.system_memories = {}  # Dictionary of {id: memory_text}
         self.next_memory_id = 1
+        # Bumped on every change, so prepared requests can tell whether they are still current
+        self.revision = 0
+
+    def touch(self) -> None:
+        """Record a change made to the conversation from outside (e.g. editing a history item in place)"""
+        self.revision += 1
+
+    def _append(self, item: Dict[str, Any]) -> None:
+        self.touch()
+        self.history.append(item)
+        self.events.publish(ItemAppended(len(self.history) - 1, item))
+
+    def edit_item(self, index: int, content: str) -> None:
+        """Replace the text of a history item"""
+        item = self.history[index]
+        item["parts"][0] = content
+        self.touch()
+        self.events.publish(ItemEdited(index, item))
+
+    def delete_item(self, index: int) -> None:
+        """Remove an item from the history"""
+        item = self.history.pop(index)
+        self.touch()
+        self.events.publish(ItemDeleted(index, item))
     
     def add_user_message(self, parts: List[Any]) -> int:
         """Add a user message to the history and return its sequence number"""
         self.seq_user += 1
-        self.history.append({
+        self._append({
             "role": "user",
             "parts": parts,
             "sequence": self.seq_user
@@ -25,7 +53,7 @@ class ConversationManager:
     
     def add_model_message(self, message: str, sequence: int) -> None:
         """Add a model message to the history"""
-        self.history.append({
+        self._append({
             "role": "model",
             "parts": [message],
             "sequence": sequence
@@ -33,7 +61,7 @@ class ConversationManager:
     
     def add_function_call(self, function_name: str, args: Dict[str, Any], sequence: int) -> None:
         """Add a function call to the history"""
-        self.history.append({
+        self._append({
             "role": "function",
             "parts": [],  # Empty parts array for consistency
             "function_call": {
@@ -45,7 +73,7 @@ class ConversationManager:
 
     def add_function_response(self, function_name: str, result: Dict[str, Any], sequence: int) -> None:
         """Add a function result to the history"""
-        self.history.append({
+        self._append({
             "role": "function_response",
             "parts": [],  # Empty parts array for consistency
             "function_response": {
@@ -217,6 +245,7 @@ class ConversationManager:
     def import_history(self, history: List[Dict[str, Any]]) -> None:
         """Import history from an external source and reconstruct artifacts"""
         self.history = []       
+        self.touch()
         for item in history:
             if item["role"] == "user":
                 # Update sequence counter
@@ -372,6 +401,7 @@ class ConversationManager:
                     },
                     "sequence": current_seq
                 })
+        self.events.publish(HistoryReplaced())
     
     def get_llm_history(self, include_functions=True) -> List[Dict[str, Any]]:
         llm_history = []      
@@ -494,6 +524,8 @@ class ConversationManager:
         
         # Update the system prompt with the new content
         self.system_prompt = current_content
+        self.touch()
+        self.events.publish(SystemPromptChanged(current_content))
         
         result = {
             "success": True,
@@ -551,6 +583,8 @@ class ConversationManager:
             
             # Store the memory
             self.system_memories[memory_id] = contents
+            self.touch()
+            self.events.publish(MemoryChanged(memory_id, contents))
             
             result = {
                 "success": True,
@@ -594,6 +628,8 @@ class ConversationManager:
             
             # Update the memory
             self.system_memories[memory_id] = contents
+            self.touch()
+            self.events.publish(MemoryChanged(memory_id, contents))
             
             result = {
                 "success": True,
@@ -629,6 +665,8 @@ class ConversationManager:
             
             # Delete the memory
             del self.system_memories[memory_id]
+            self.touch()
+            self.events.publish(MemoryChanged(memory_id, None))
             
             result = {
                 "success": True,
@@ -675,6 +713,59 @@ class ConversationManager:
 
         return full_prompt
 
+    def fork(self) -> "ConversationManager":
+        """
+        Return a copy of the conversation that can be mutated independently.
+
+        History items themselves are shared, since chat sessions only ever append.
+        """
+        forked = ConversationManager()
+        forked.history = list(self.history)
+        forked.artifact_manager = self.artifact_manager.fork(forked.events)
+        forked.seq_user = self.seq_user
+        forked.system_prompt = self.system_prompt
+        forked.system_prompt_setup = self.system_prompt_setup
+        forked.system_memories = self.system_memories.copy()
+        forked.next_memory_id = self.next_memory_id
+        return forked
+
+    def adopt(self, other: "ConversationManager") -> None:
+        """
+        Replace the state of this conversation with that of another one (e.g. a fork).
+
+        If the other history only extends this one, as when adopting a finished
+        request's fork, the additions are published as appends (and new artifact
+        versions); anything else is published as HistoryReplaced.
+        """
+        old_history, old_versions = self.history, self.artifact_manager.artifact_history
+        extends = (len(other.history) >= len(old_history)
+                   and all(a is b for a, b in zip(old_history, other.history)))
+        self.history = other.history
+        self.artifact_manager = other.artifact_manager
+        self.artifact_manager.events = self.events
+        self.seq_user = other.seq_user
+        system_prompt_changed = self.system_prompt != other.system_prompt
+        self.system_prompt = other.system_prompt
+        self.system_prompt_setup = other.system_prompt_setup
+        old_memories, self.system_memories = self.system_memories, other.system_memories
+        self.next_memory_id = other.next_memory_id
+        self.touch()
+
+        if not extends:
+            self.events.publish(HistoryReplaced())
+            return
+        for index in range(len(old_history), len(self.history)):
+            self.events.publish(ItemAppended(index, self.history[index]))
+        for artifact_id, versions in self.artifact_manager.artifact_history.items():
+            for version in range(len(old_versions.get(artifact_id, ())), len(versions)):
+                sequence, content = versions[version]
+                self.events.publish(ArtifactVersionAdded(artifact_id, sequence, content, version + 1))
+        for memory_id in old_memories.keys() | self.system_memories.keys():
+            if old_memories.get(memory_id) != self.system_memories.get(memory_id):
+                self.events.publish(MemoryChanged(memory_id, self.system_memories.get(memory_id)))
+        if system_prompt_changed:
+            self.events.publish(SystemPromptChanged(self.system_prompt))
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert the conversation to a dictionary for serialization"""
         return {
@@ -693,4 +784,6 @@ class ConversationManager:
         self.seq_user = data.get("seq_user", 0)
         self.system_prompt = data.get("system_prompt", "")
         self.system_memories = data.get("system_memories", {})
-        self.next_memory_id = data.get("next_memory_id", 1)
\ No newline at end of file
+        self.next_memory_id = data.get("next_memory_id", 1)
+        self.touch()
+        self.events.publish(HistoryReplaced())
\ No newline at end of file
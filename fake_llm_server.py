@@ -0,0 +1,315 @@
+"""
+Local fake of an OpenAI-compatible inference API, for offline end-to-end runs.
+
+Implements just enough of the API for the providers in this repo:
+  POST /v1/chat/completions      echoes the last user message back
+  POST /v1/files                 multipart upload, stored in memory
+  GET  /v1/files/{id}            file metadata
+  GET  /v1/files/{id}/content    file contents
+  POST /v1/batches               runs the uploaded JSONL after --batch-delay seconds
+  GET  /v1/batches/{id}          batch status
+
+And of the Gemini Developer API:
+  POST /v1beta/models/{model}:generateContent   echoes the last user text; rejects unknown or expired file URIs
+  POST /upload/v1beta/files                     resumable upload (start, upload, finalize)
+  GET  /v1beta/files/{id}                       file metadata
+
+Usage:
+    python fake_llm_server.py --port 8765 --latency-ms 200
+    GROQ_BASE_URL=http://127.0.0.1:8765/v1 GROQ_API_KEY=fake ...
+    GOOGLE_GEMINI_BASE_URL=http://127.0.0.1:8765 GOOGLE_API_KEY=fake ...
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.parser import BytesParser
+from email import policy
+from typing import Any, Dict, Optional
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import base64
+import itertools
+import json
+import threading
+import time
+
+def _field(obj: Dict[str, Any], name: str) -> Any:
+    """A JSON field by its camelCase name, also accepting snake_case (both are valid in the Gemini API)"""
+    snake = "".join(f"_{c.lower()}" if c.isupper() else c for c in name)
+    return obj.get(name, obj.get(snake))
+
+class FakeLLMServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: int = 0, batch_delay: float = 0.5,
+                 file_ttl: float = 48 * 3600):
+        self.latency_ms = latency_ms
+        self.batch_delay = batch_delay
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        # Gemini files: upload id -> upload in progress, "files/{id}" -> file metadata (+ data)
+        self.file_ttl = file_ttl
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+        self.gemini_files: Dict[str, Dict[str, Any]] = {}
+        # Attachment bytes received through uploads and inline in generateContent requests
+        self.uploaded_bytes = 0
+        self.inline_bytes = 0
+        self.request_count = 0
+        self.connection_count = 0
+        # time.monotonic() when the last POST arrived, for send-to-first-byte measurements in-process
+        self.last_request_at = 0.0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def next_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}-{next(self._ids)}"
+
+    def chat_completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        user_messages = [m["content"] for m in body.get("messages", []) if m.get("role") == "user"]
+        prompt = user_messages[-1] if user_messages else ""
+        text = f"[{body.get('model', 'fake')}] {prompt}"
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        completion_tokens = len(text.split())
+        return {
+            "id": self.next_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+    def add_file(self, filename: str, data: bytes, purpose: str) -> Dict[str, Any]:
+        file_id = self.next_id("file")
+        meta = {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+        self.files[file_id] = {"meta": meta, "data": data}
+        return meta
+
+    def create_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        batch_id = self.next_id("batch")
+        batch = {"id": batch_id, "object": "batch", "endpoint": body["endpoint"],
+                 "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window", "24h"),
+                 "status": "validating", "created_at": int(time.time()), "output_file_id": None,
+                 "error_file_id": None, "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+        self.batches[batch_id] = batch
+        threading.Timer(self.batch_delay, self._run_batch, args=(batch_id,)).start()
+        return batch
+
+    def _run_batch(self, batch_id: str) -> None:
+        batch = self.batches[batch_id]
+        batch["status"] = "in_progress"
+        lines = self.files[batch["input_file_id"]]["data"].decode("utf-8").splitlines()
+        output = []
+        for line in lines:
+            if line.strip():
+                request = json.loads(line)
+                response = {"status_code": 200, "request_id": self.next_id("req"), "body": self.chat_completion(request["body"])}
+                output.append(json.dumps({"id": self.next_id("batch_req"), "custom_id": request["custom_id"],
+                                          "response": response, "error": None}))
+        batch["request_counts"] = {"total": len(output), "completed": len(output), "failed": 0}
+        batch["output_file_id"] = self.add_file(f"{batch_id}_output.jsonl", "\n".join(output).encode("utf-8"), "batch_output")["id"]
+        batch["status"] = "completed"
+
+    def start_upload(self, mime_type: str, display_name: Optional[str]) -> str:
+        upload_id = self.next_id("upload")
+        self.uploads[upload_id] = {"mime_type": mime_type, "display_name": display_name, "data": bytearray()}
+        return upload_id
+
+    def finish_upload(self, upload_id: str) -> Dict[str, Any]:
+        upload = self.uploads.pop(upload_id)
+        name = f"files/{self.next_id('file')}"
+        now = time.time()
+
+        def timestamp(t: float) -> str:
+            return datetime.fromtimestamp(t, timezone.utc).isoformat().replace("+00:00", "Z")
+
+        meta = {"name": name, "mimeType": upload["mime_type"], "sizeBytes": str(len(upload["data"])),
+                "createTime": timestamp(now), "expirationTime": timestamp(now + self.file_ttl),
+                "uri": f"{self.base_url}/v1beta/{name}", "state": "ACTIVE", "source": "UPLOADED"}
+        if upload["display_name"]:
+            meta["displayName"] = upload["display_name"]
+        self.gemini_files[name] = {"meta": meta, "data": bytes(upload["data"]), "expires_at": now + self.file_ttl}
+        with self._lock:
+            self.uploaded_bytes += len(upload["data"])
+        return meta
+
+    def generate_content(self, model: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Gemini generateContent; raises ValueError for file URIs that are unknown or expired"""
+        prompt = ""
+        prompt_tokens = 0
+        for content in body.get("contents", []):
+            for part in content.get("parts", []):
+                if "text" in part:
+                    prompt_tokens += len(part["text"].split())
+                    if content.get("role", "user") == "user":
+                        prompt = part["text"]
+                elif _field(part, "inlineData"):
+                    # The SDK sends unpadded URL-safe base64
+                    data = _field(part, "inlineData")["data"]
+                    with self._lock:
+                        self.inline_bytes += len(base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)))
+                elif _field(part, "fileData"):
+                    name = "files/" + _field(_field(part, "fileData"), "fileUri").rsplit("/files/", 1)[-1]
+                    file = self.gemini_files.get(name)
+                    if file is None or file["expires_at"] < time.time():
+                        raise ValueError(f"File {name} is not found or has expired")
+        text = f"[{model}] {prompt}"
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": len(text.split()),
+                              "totalTokenCount": prompt_tokens + len(text.split())},
+            "modelVersion": model
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; without this, delayed ACKs add ~40ms per response
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connection_count += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> None:
+                self._send_bytes(json.dumps(payload).encode("utf-8"), "application/json", status, headers)
+
+            def _send_bytes(self, data: bytes, content_type: str, status: int = 200,
+                            headers: Optional[Dict[str, str]] = None) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_GET(self):
+                with server._lock:
+                    server.request_count += 1
+                path = self.path.split("?")[0].rstrip("/")
+                parts = path.split("/")
+                if path.startswith("/v1/files/") and path.endswith("/content") and parts[3] in server.files:
+                    self._send_bytes(server.files[parts[3]]["data"], "application/octet-stream")
+                elif path.startswith("/v1/files/") and parts[3] in server.files:
+                    self._send_json(server.files[parts[3]]["meta"])
+                elif path.startswith("/v1/batches/") and parts[3] in server.batches:
+                    self._send_json(server.batches[parts[3]])
+                elif path.startswith("/v1beta/files/") and path[len("/v1beta/"):] in server.gemini_files:
+                    self._send_json(server.gemini_files[path[len("/v1beta/"):]]["meta"])
+                elif path == "/v1/models":
+                    self._send_json({"object": "list", "data": []})
+                else:
+                    self._send_json({"error": {"message": f"Not found: {path}"}}, 404)
+
+            def do_HEAD(self):
+                # Used for connection warm-up
+                with server._lock:
+                    server.request_count += 1
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                with server._lock:
+                    server.request_count += 1
+                    server.last_request_at = time.monotonic()
+                path = self.path.split("?")[0].rstrip("/")
+                body = self._read_body()
+                if path == "/v1/chat/completions":
+                    if server.latency_ms:
+                        time.sleep(server.latency_ms / 1000.0)
+                    self._send_json(server.chat_completion(json.loads(body)))
+                elif path == "/v1/files":
+                    header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+                    message = BytesParser(policy=policy.HTTP).parsebytes(header + body)
+                    fields = {}
+                    for part in message.iter_parts():
+                        name = part.get_param("name", header="content-disposition")
+                        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+                    filename, data = fields["file"]
+                    purpose = fields.get("purpose", (None, b""))[1].decode("utf-8")
+                    self._send_json(server.add_file(filename or "upload", data, purpose))
+                elif path == "/v1/batches":
+                    self._send_json(server.create_batch(json.loads(body)))
+                elif path == "/upload/v1beta/files":
+                    self._upload(body)
+                elif path.startswith("/v1beta/models/") and path.endswith(":generateContent"):
+                    model = path[len("/v1beta/models/"):-len(":generateContent")]
+                    try:
+                        self._send_json(server.generate_content(model, json.loads(body)))
+                    except ValueError as e:
+                        self._send_json({"error": {"code": 400, "message": str(e), "status": "INVALID_ARGUMENT"}}, 400)
+                else:
+                    self._send_json({"error": {"message": f"Not found: {path}"}}, 404)
+
+            def _upload(self, body: bytes) -> None:
+                command = self.headers.get("X-Goog-Upload-Command", "")
+                if command == "start":
+                    metadata = json.loads(body or b"{}").get("file", {})
+                    upload_id = server.start_upload(self.headers.get("X-Goog-Upload-Header-Content-Type"),
+                                                    metadata.get("displayName"))
+                    self._send_json({}, headers={"X-Goog-Upload-Status": "active",
+                                                 "X-Goog-Upload-URL": f"{server.base_url}/upload/v1beta/files?upload_id={upload_id}"})
+                    return
+                upload_id = parse_qs(urlsplit(self.path).query).get("upload_id", [""])[0]
+                if upload_id not in server.uploads:
+                    self._send_json({"error": {"code": 404, "message": "Unknown upload"}}, 404)
+                    return
+                server.uploads[upload_id]["data"] += body
+                if "finalize" in command:
+                    self._send_json({"file": server.finish_upload(upload_id)}, headers={"X-Goog-Upload-Status": "final"})
+                else:
+                    self._send_json({}, headers={"X-Goog-Upload-Status": "active"})
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=int, default=0, help="Delay added to every chat completion")
+    parser.add_argument("--batch-delay", type=float, default=0.5, help="Seconds before a submitted batch runs")
+    parser.add_argument("--file-ttl", type=float, default=48 * 3600, help="Seconds before an uploaded Gemini file expires")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.host, args.port, args.latency_ms, args.batch_delay, args.file_ttl)
+    print(f">> Fake LLM server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
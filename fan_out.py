@@ -0,0 +1,64 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import asyncio
+import time
+
+from conversation_manager import ConversationManager
+from request_deadline import Deadline, UNBOUNDED
+
+@dataclass
+class FanOutResult:
+    """Outcome of one model's turn in a fan-out"""
+    target: str
+    text: str = ""
+    latency: float = 0.0
+    token_count: Optional[int] = None
+    error: Optional[str] = None
+
+class FanOutSession:
+    """
+    Sends each turn to several models at once, for side-by-side comparison.
+
+    Every model ("provider_name:model_id") gets its own branch of the
+    conversation, forked from the conversation the fan-out was started from,
+    so follow-up turns build on that model's own previous answers. All models
+    are queried concurrently, so a turn takes about as long as the slowest one.
+    """
+
+    def __init__(self, ui_model, conversation_manager: ConversationManager, targets: List[str], system_prompt: Optional[str]):
+        self.ui_model = ui_model
+        self.targets = list(targets)
+        self.system_prompt = system_prompt
+        self.branches: Dict[str, ConversationManager] = {t: conversation_manager.fork() for t in self.targets}
+        self.turns: List[List[FanOutResult]] = []
+
+    async def _send_one(self, target: str, parts: List[Any], deadline: Deadline) -> FanOutResult:
+        branch = self.branches[target]
+        snapshot = branch.fork()
+        start_time = time.monotonic()
+        try:
+            session = self.ui_model.create_target_session(target, branch, self.system_prompt)
+            branch.add_user_message(parts)
+            response, new_history_items = await session.send_message_async(parts, deadline)
+        except asyncio.CancelledError:
+            branch.adopt(snapshot)
+            raise
+        except Exception as e:
+            # Keep the branch consistent so the next turn can still be compared
+            branch.adopt(snapshot)
+            return FanOutResult(target=target, latency=time.monotonic() - start_time, error=f"{type(e).__name__}: {e}")
+
+        texts = [item["parts"][0] for item in new_history_items if item["role"] == "model" and item["parts"]]
+        usage = getattr(response, "usage_metadata", None)
+        return FanOutResult(
+            target=target,
+            text="\n\n".join(texts),
+            latency=time.monotonic() - start_time,
+            token_count=getattr(usage, "total_token_count", None)
+        )
+
+    async def send_message_async(self, parts: List[Any], deadline: Deadline = UNBOUNDED) -> List[FanOutResult]:
+        """Send one turn to every model concurrently; results are in target order"""
+        results = await asyncio.gather(*[self._send_one(t, list(parts), deadline) for t in self.targets])
+        self.turns.append(results)
+        return results
@@ -0,0 +1,88 @@
+"""
+Large attachments are uploaded once through the provider's file API instead of
+being sent inline with every request that includes them in the history.
+
+An attachment part is a dict with "mime_type" and "data". Once uploaded, the
+reference is recorded in the part itself, so it is kept in the conversation
+and in saved contexts:
+  file_uri       what requests refer to
+  file_name      the provider's resource name
+  file_provider  the provider that holds the file (URIs are provider specific)
+  file_expires   epoch seconds after which the provider deletes it (None: never)
+"data" is always kept, so expired or foreign references are simply uploaded again.
+
+Settings (environment):
+  LLM_UPLOAD_THRESHOLD_MB      attachments from this size on are uploaded (default 4)
+  LLM_UPLOAD_PROCESSING_SECS   longest wait for the provider to process an upload, e.g. a video,
+                               before the attachment is sent inline instead (default 60)
+"""
+
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+import asyncio
+import os
+import time
+
+# An uploaded file must stay valid for at least this long to be referenced
+EXPIRY_MARGIN = 600.0
+
+@dataclass
+class UploadedFile:
+    uri: str
+    name: str
+    expires_at: Optional[float] = None
+
+def upload_threshold() -> int:
+    return int(float(os.environ.get("LLM_UPLOAD_THRESHOLD_MB", "4")) * 1024 * 1024)
+
+def processing_timeout() -> float:
+    return float(os.environ.get("LLM_UPLOAD_PROCESSING_SECS", "60"))
+
+def is_attachment(part: Any) -> bool:
+    return isinstance(part, dict) and "mime_type" in part and "data" in part
+
+def uploaded_uri(part: Dict[str, Any], provider_name: str, now: Optional[float] = None) -> Optional[str]:
+    """The part's file URI if it was uploaded to this provider and is not about to expire"""
+    if part.get("file_provider") != provider_name or not part.get("file_uri"):
+        return None
+    expires = part.get("file_expires")
+    if expires is not None and expires - EXPIRY_MARGIN < (now or time.time()):
+        return None
+    return part["file_uri"]
+
+def needs_upload(part: Any, provider_name: str, threshold: Optional[int] = None) -> bool:
+    if not is_attachment(part):
+        return False
+    threshold = upload_threshold() if threshold is None else threshold
+    return len(part["data"]) >= threshold and uploaded_uri(part, provider_name) is None
+
+def record_upload(part: Dict[str, Any], provider_name: str, uploaded: UploadedFile) -> None:
+    part.update(file_uri=uploaded.uri, file_name=uploaded.name, file_provider=provider_name,
+                file_expires=uploaded.expires_at)
+
+async def upload_attachments(parts: Iterable[Any], provider_name: str,
+                             upload: Callable[[bytes, str], Awaitable[UploadedFile]],
+                             threshold: Optional[int] = None) -> int:
+    """
+    Upload every large attachment among parts that has no current reference,
+    concurrently, and record the references in the parts. Returns how many
+    were uploaded.
+    """
+    # The same part can appear more than once (e.g. in the history and a fork of it)
+    pending: Dict[int, Dict[str, Any]] = {}
+    for part in parts:
+        if needs_upload(part, provider_name, threshold):
+            pending[id(part)] = part
+
+    async def upload_one(part: Dict[str, Any]) -> None:
+        start = time.monotonic()
+        uploaded = await upload(part["data"], part["mime_type"])
+        record_upload(part, provider_name, uploaded)
+        print(f">> Uploaded {len(part['data'])} bytes ({part['mime_type']}) to {provider_name} "
+              f"in {time.monotonic() - start:.1f}s: {uploaded.uri}")
+
+    await asyncio.gather(*(upload_one(part) for part in pending.values()))
+    return len(pending)
+
+def history_parts(llm_history: List[Dict[str, Any]]) -> List[Any]:
+    return [part for item in llm_history for part in item.get("parts", [])]
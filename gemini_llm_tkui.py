@@ -16,41 +16,49 @@
 from dotenv import load_dotenv
 load_dotenv(verbose=True, override=True)
 
-from content_utils import fix_content
+import importlib.util
+
 from conversation_manager import ConversationManager
 from prompt_stack_manager import PromptStackManager
-try:
+from request_deadline import Deadline
+from send_queue import SendQueue, QueuedRequest
+from response_cache import track_hits
+from request_prefetch import RequestPrefetcher
+from attachments import load_attachment
+from preview_renderer import PreviewSource, RenderCache, RenderPool, RenderSettings, preview_source, queued_source
+from history_view import RowSummaries, SearchIndex, VirtualTreeview, preview_text
+from conversation_events import HistoryReplaced, ItemAppended, ItemDeleted, ItemEdited
+from tk_dispatcher import TkDispatcher
+from context_autosave import ContextAutosave, write_context
+from knob_sweep import parse_sweep_spec, grid_configurations, random_configurations, run_sweep, write_csv
+# Only fall back when there is no local copy; errors inside it should surface
+if importlib.util.find_spec("user_ui_model_local"):
     from user_ui_model_local import UserUIModel
-except:
+else:
     from user_ui_model import UserUIModel
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from tkinter import StringVar
 
-USE_PYGMENTS = True
-if USE_PYGMENTS:
-    import re
-    import pygments
-    from pygments import lexers
-    from pygments.formatters import HtmlFormatter
-    import tkinterweb  # For HTML rendering
+# pygments and tkinterweb are imported when the syntax-highlighting viewer is first used
 
 import asyncio
-from queue import Queue
 from async_tkinter_loop import async_handler, async_mainloop
 
 import ast
+import base64
 import json
 import time
 import uuid
 
-import pathlib
+import os
 import threading
 
 class LLMControlUI:
-    def __init__(self, root, queue):
-        self.queue = queue
+    def __init__(self, root, dispatcher: TkDispatcher):
+        # Runs work posted from other threads on the Tk thread
+        self.dispatcher = dispatcher
         self.root = root
         self.root.title("LLM Interface")
         self.root.geometry("1280x800")
@@ -61,7 +69,25 @@ class LLMControlUI:
         self.seq_user = 0
         self.seq_model = 0
         self.conversation_manager = ConversationManager()
-        self.stopped = False
+        self.current_request = None
+
+        # Outbound prompts, sent in order per conversation; shown below the history until sent
+        self.send_queue = SendQueue(self._send_request, self._on_request_changed)
+        # Request whose attachments are still loading, and the history row of the one in flight
+        self.loading_request = None
+        self.running_index = None
+
+        # History rows: summaries are computed once per item, search matches kept by index
+        self.row_summaries = RowSummaries()
+        self.search_index = SearchIndex()
+
+        # Builds the next chat session while the user types
+        self.prefetcher = RequestPrefetcher(self.ui_model)
+
+        # Previews are rendered off the Tk thread; recent ones are cached, so reselecting a row does not render it again
+        self.render_cache = RenderCache.from_env()
+        self.render_pool = RenderPool.from_env(self.render_cache)
+        self.preview_task = None
 
         # ZMQ connection
         self.zmq_context = None
@@ -111,8 +137,9 @@ class LLMControlUI:
         self.clear_search_button = ttk.Button(search_frame, text="Clear", command=self.clear_search)
         self.clear_search_button.pack(side=tk.LEFT, padx=(5, 0))
 
-        # Create tree view
-        self.tree = ttk.Treeview(left_frame, columns=("Role", "Sequence", "Size", "Content"), show="headings")
+        # Create tree view; only the visible rows exist as Treeview items (with its own scrollbar)
+        self.tree = VirtualTreeview(left_frame, ("Role", "Sequence", "Size", "Content"),
+                                    self._row_count, self._row, on_select=self.update_preview)
         self.tree.heading("Role", text="Role")
         self.tree.heading("Sequence", text="Seq.")
         self.tree.heading("Size", text="Size")
@@ -121,16 +148,11 @@ class LLMControlUI:
         self.tree.column("Sequence", minwidth=50, width=50, stretch=False)
         self.tree.column("Size", minwidth=50, width=50, stretch=False)
         self.tree.column("Content", stretch=True)
+        self.tree.tag_configure('match', background='yellow')
+        self.tree.tag_configure('pending', foreground='gray')
+        self.tree.tag_configure('running', foreground='blue')
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        # Add scrollbar to tree view
-        scrollbar = ttk.Scrollbar(left_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-
-        # Bind selection event to update preview
-        self.tree.bind("<<TreeviewSelect>>", self.update_preview)
-
         # Bind double-click event
         self.tree.bind("<Double-1>", self.edit_item)
 
@@ -151,20 +173,26 @@ class LLMControlUI:
         # Create input box (now scrolledtext)
         self.input_box = scrolledtext.ScrolledText(input_frame, height=5)
         self.input_box.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.input_box.bind("<KeyRelease>", self._on_input_typed)
 
         # Create file picker button
         self.file_picker_button = ttk.Button(input_frame, text="...", width=3, command=self.toggle_file_picker)
         self.file_picker_button.pack(side=tk.LEFT, padx=(5, 0))
-        self.selected_file_path = None
+        # (path, task loading it) for each file attached to the next prompt
+        self.selected_attachments = []
 
         # Create button frame
         button_frame = ttk.Frame(input_frame)
         button_frame.pack(side=tk.RIGHT)
 
         # Create send button
-        send_button = ttk.Button(button_frame, text="Send", command=async_handler(self.send_message))
+        send_button = ttk.Button(button_frame, text="Send", command=self.send_message)
         send_button.pack(side=tk.TOP, pady=2)
 
+        # Add cancel button for the in-flight request
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_request, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.TOP, pady=2)
+
         # Add broadcast button
         self.broadcast_button = ttk.Button(button_frame, text="Broadcast", command=self.broadcast_message)
         self.broadcast_button.pack(side=tk.TOP, pady=2)
@@ -195,6 +223,10 @@ class LLMControlUI:
         self.formatting_clean_xml = tk.BooleanVar(value=False)
         ttk.Checkbutton(viewer_frame, text="Clean XML", variable=self.formatting_clean_xml, command=self.update_preview).pack(side=tk.LEFT, padx=(0, 10))
 
+        # Large previews are cut off after LLM_PREVIEW_MAX_CHARS unless this is checked
+        self.preview_render_full = tk.BooleanVar(value=False)
+        ttk.Checkbutton(viewer_frame, text="Render Full", variable=self.preview_render_full, command=self.update_preview).pack(side=tk.LEFT, padx=(0, 10))
+
         # Font size selector
         ttk.Label(viewer_frame, text="").pack(side=tk.LEFT, expand=True)
         ttk.Label(viewer_frame, text="Font Size (px):").pack(side=tk.LEFT, padx=5)
@@ -236,10 +268,10 @@ class LLMControlUI:
         menubar.add_cascade(label="Model", menu=self.model_menu)
         self._create_model_menu()
 
-        # Create Settings menu
-        self.settings_menu = tk.Menu(menubar, tearoff=0)
+        # Create Settings menu; built when first opened, so the provider isn't created at startup
+        self.settings_menu_provider = None
+        self.settings_menu = tk.Menu(menubar, tearoff=0, postcommand=self._ensure_settings_menu)
         menubar.add_cascade(label="Settings", menu=self.settings_menu)
-        self._update_settings_menu()
 
         # Create Prompt Stack menu
         self.prompt_stack_menu = tk.Menu(menubar, tearoff=0)
@@ -262,16 +294,41 @@ class LLMControlUI:
         self.token_count_var = StringVar(value="Tokens: 0")
         ttk.Label(self.status_bar, textvariable=self.token_count_var).pack(side=tk.LEFT)
 
+        # Connection reuse of the shared HTTP pool
+        self.connection_var = StringVar(value="Connections: N/A")
+        ttk.Label(self.status_bar, textvariable=self.connection_var).pack(side=tk.LEFT, padx=(10, 0))
+
+        # Preview render cache hit rate
+        self.preview_cache_var = StringVar(value="Preview cache: N/A")
+        ttk.Label(self.status_bar, textvariable=self.preview_cache_var).pack(side=tk.LEFT, padx=(10, 0))
+
+        # Backlog and delay of work posted to the Tk thread
+        self.dispatch_var = StringVar(value="Tk queue: N/A")
+        ttk.Label(self.status_bar, textvariable=self.dispatch_var).pack(side=tk.LEFT, padx=(10, 0))
+        self.dispatcher.on_report = lambda dispatcher: self.dispatch_var.set(dispatcher.describe())
+
         # Search results count
         self.search_results_var = StringVar(value="Search Results: 0")
         ttk.Label(self.status_bar, textvariable=self.search_results_var).pack(side=tk.RIGHT)
 
+        # Per-request deadline (0 = no deadline)
+        self.deadline_var = tk.StringVar(value=os.environ.get("LLM_REQUEST_TIMEOUT", "300"))
+        ttk.Spinbox(self.status_bar, from_=0, to=3600, increment=30, textvariable=self.deadline_var, width=5).pack(side=tk.RIGHT, padx=(0, 10))
+        ttk.Label(self.status_bar, text="Deadline (s):").pack(side=tk.RIGHT, padx=(0, 5))
+
+        # Views follow the conversation's change events; those from other threads go through the dispatcher
+        self.conversation_manager.events.subscribe(self._on_conversation_event, dispatch=self.add_task_to_queue)
+        self.autosave = ContextAutosave.from_env(self.conversation_manager)
+
         # Close handler
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     # FIXME: Throw dialog for unsaved changes
     def on_close(self):
-        self.stopped = True
+        self.send_queue.cancel_all()
+        self.render_pool.shutdown()
+        if self.autosave:
+            self.autosave.flush()
         self.root.destroy()
         self.root.quit()
         exit(0)
@@ -281,41 +338,35 @@ class LLMControlUI:
         if not search_term:
             return
 
-        matches = 0
-        for item in self.tree.get_children():
-            index = self.tree.index(item)
-            history_item = self.conversation_manager.history[index]
-            if history_item["parts"]:
-                content = history_item["parts"][0]
-                if search_term in content.lower():
-                    self.tree.item(item, tags=('match',))
-                    matches += 1
-                else:
-                    self.tree.item(item, tags=())
-
-        self.tree.tag_configure('match', background='yellow')
+        matches = self.search_index.search(search_term, self.conversation_manager.history)
+        self.tree.refresh()
         self.search_results_var.set(f"Search Results: {matches}")
 
     def toggle_file_picker(self):
-        if self.selected_file_path:
+        if self.selected_attachments:
             self.clear_selected_file()
         else:
             self.open_file_picker()
 
     def open_file_picker(self):
-        file_path = filedialog.askopenfilename()
-        if file_path:
-            self.selected_file_path = file_path
-            self.file_picker_button.config(text="CL")
-
-    def clear_selected_file(self):
-        self.selected_file_path = None
+        file_paths = filedialog.askopenfilenames()
+        if file_paths:
+            # Start reading and preprocessing right away, off the Tk thread
+            self.selected_attachments = [(path, asyncio.ensure_future(load_attachment(path))) for path in file_paths]
+            count = len(file_paths)
+            self.file_picker_button.config(text="CL" if count == 1 else f"CL{count}")
+
+    def clear_selected_file(self, cancel: bool = True):
+        if cancel:
+            for _, task in self.selected_attachments:
+                task.cancel()
+        self.selected_attachments = []
         self.file_picker_button.config(text="...")
 
     def clear_search(self):
         self.search_var.set("")
-        for item in self.tree.get_children():
-            self.tree.item(item, tags=())
+        self.search_index.clear()
+        self.tree.refresh()
         self.search_results_var.set("Search Results: 0")
 
     def update_viewer(self):
@@ -343,294 +394,62 @@ class LLMControlUI:
 
     def create_syntax_highlighted_display(self):
         """Replace the preview text widget with a syntax-highlighting capable one"""
-        # Create new display using tkinterweb
+        import tkinterweb  # For HTML rendering
+
+        # Create new display using tkinterweb; the HTML itself comes from preview_renderer
         self.preview_text = tkinterweb.HtmlFrame(self.content_frame, messages_enabled=False, horizontal_scrollbar="auto")
         # Do not use threading
         self.preview_text.html.max_thread_count = 0
 
-        # Configure HTML/CSS for syntax highlighting
-        self.html_formatter = HtmlFormatter(style='monokai', lineseparator='<br/>')
-        self.css = self.html_formatter.get_style_defs('.highlight')
-
     def update_preview(self, event=None):
         """Update the preview pane based on the selected item in the tree view"""
-        do_clean_xml = self.formatting_clean_xml.get()
-
         selected_items = self.tree.selection()
         if not selected_items:
             return
             
-        item = selected_items[0]
-        item_id = self.tree.index(item)
-        message = self.conversation_manager.history[item_id]
-
-        sequence = message.get("sequence", "N/A")
-        role = message["role"]
-        
-        # Handle different types of content based on role
-        if role == "function":
-            # Handle function calls (especially artifact-related ones)
-            if "function_call" in message:
-                function_name = message["function_call"].get("name", "")
-                args = message["function_call"].get("args", {})
-
-                # FIXME: Wrap in markdown ```xml tags for XML
-                if function_name == "create_artifact":
-                    # For create_artifact, show the initial content
-                    artifact_id = args.get("id", "")
-                    content = args.get("contents", "")
-                    
-                    # Format display with header
-                    display_content = self._wrap_content_in_markdown_block(content)
-                    display_content = fix_content(display_content, do_clean_xml)
-
-                    self._display_content(display_content, role, sequence)
-                    return
-                    
-                elif function_name == "edit_artifact":
-                    # For edit_artifact, show before and after
-                    artifact_id = args.get("id", "")
-                   
-                    # Get artifact content before this edit
-                    before_content = self.conversation_manager.get_artifact_before_sequence(
-                        artifact_id, sequence)
-                    before_content = self._wrap_content_in_markdown_block(before_content)
-                    
-                    # Get artifact content after this edit
-                    after_content = self.conversation_manager.get_artifact_at_sequence(
-                        artifact_id, sequence)
-                    after_content = self._wrap_content_in_markdown_block(after_content)
-
-                    # Handle both new and legacy format
-                    global_subst = args.get("global_substitutions", [])
-                    single_subst = args.get("single_substitutions", [])
-                    
-                    # Handle legacy format
-                    if "from_string" in args and "to_string" in args:
-                        single_subst.append({
-                            "from": args["from_string"],
-                            "to": args["to_string"]
-                        })
-                    
-                    # Format substitutions for display
-                    subst_display = ""
-                    if global_subst:
-                        subst_display += "Global substitutions:\n"
-                        for i, s in enumerate(global_subst, 1):
-                            subst_display += f"  {i}. '{s.get('from_str', '')}' → '{s.get('to_str', '')}'\n"
-                    
-                    if single_subst:
-                        if subst_display:
-                            subst_display += "\n"
-                        subst_display += "Single-occurrence substitutions:\n"
-                        for i, s in enumerate(single_subst, 1):
-                            subst_display += f"  {i}. '{s.get('from_str', '')}' → '{s.get('to_str', '')}'\n"
-
-                    # If both are available, create split view
-                    if before_content and after_content:
-                        # Format display with header
-                        display_content = f"ARTIFACT EDIT: {artifact_id}\n"
-                        display_content += subst_display
-                        display_content += "\n" + "-" * 40 + "\n\n"
-                        display_content += "BEFORE:\n"
-                        display_content += "-" * 40 + "\n"
-                        display_content += fix_content(before_content, do_clean_xml)
-                        display_content += "\n\n" + "-" * 40 + "\n"
-                        display_content += "AFTER:\n"
-                        display_content += "-" * 40 + "\n"
-                        display_content += fix_content(after_content, do_clean_xml)
-                        
-                        # Display the content
-                        self._display_content(display_content, role, sequence)
-                        return
-                    
-                # Default function call display
-                content = f"Function: {function_name}\n"
-                content += f"Arguments: {json.dumps(args, indent=2)}"
-                self._display_content(content, role, sequence)
-                return
-        
-        # Handle normal message content
-        if message["parts"]:
-            content = message["parts"][0]
-            # Apply any rendering fix-ups
-            content = fix_content(content, do_clean_xml)
-            self._display_content(content, role, sequence)
+        item_id = selected_items[0]
+        history = self.conversation_manager.history
+        if item_id >= len(history):
+            # Queued prompt, not yet part of the history
+            source = queued_source(self._queued_requests()[item_id - len(history)].message)
         else:
-            # Empty parts array
-            self._display_content("(No content)", role, sequence)
-
-    def _wrap_content_in_markdown_block(self, content):
-        # Skip if content is None or empty
-        if not content:
-            return content
-        
-        # Check if content appears to be XML
-        is_xml = False
-        
-        # Look for XML declaration or opening tag patterns
-        content_stripped = content.strip()
-        if content_stripped.startswith('<?xml') or content_stripped.startswith('<'):
-            # Check for tag structure (simple heuristic)
-            if '>' in content_stripped and content_stripped.count('<') > 0:
-                # Additional verification: should have balanced tags or well-formed structure
-                # This is a simplistic check that catches most XML/HTML
-                is_xml = True
-        
-        # Check for JSON format (alternative highlighting option)
-        is_json = False
-        if (content_stripped.startswith('{') and content_stripped.endswith('}')) or \
-        (content_stripped.startswith('[') and content_stripped.endswith(']')):
-            try:
-                json.loads(content_stripped)
-                is_json = True
-            except:
-                pass
-        
-        # Apply appropriate formatting
-        if is_xml:
-            return f"```xml\n{content}\n```"
-        elif is_json:
-            return f"```json\n{content}\n```"        
-        # Return as is if no specific format detected
-        return content
-
-    def _display_content(self, content, role, sequence):
-        # Non-HTML
-        if self.viewer_type.get() == "text":
-            self.preview_text.delete("1.0", tk.END)
-            self.preview_text.insert(tk.END, content)
-            return
+            source = preview_source(history[item_id], self.conversation_manager)
+        self._display_content(source)
+
+    def _display_content(self, source: PreviewSource):
+        """Render the source in the background and show it; a newer selection supersedes the render"""
+        if self.preview_task and not self.preview_task.done():
+            self.preview_task.cancel()
+        settings = RenderSettings(self.viewer_type.get(), self.font_size, self.formatting_clean_xml.get())
+        self.preview_task = asyncio.ensure_future(self._render_preview(source, settings))
+
+    async def _render_preview(self, source: PreviewSource, settings: RenderSettings):
+        # The first chunk replaces the preview, the others are appended as they are rendered
+        chunks = self.render_pool.render_chunks(source, settings, self.preview_render_full.get())
+        first = True
+        try:
+            async for rendered in chunks:
+                self.preview_cache_var.set(self.render_cache.describe())
+                if settings.viewer_type != self.viewer_type.get():
+                    # The viewer was switched meanwhile, which renders again
+                    return
 
-        # Process content to handle markdown with code blocks
-        processed_content = ""
-        
-        # Default to markdown for most content
-        default_lexer = lexers.get_lexer_by_name("markdown")
-        
-        # Regular expression to find code blocks ```language ... ```
-        code_blocks = re.finditer(r'(```(\w*)\n)(.*?)(\n```)', content, re.DOTALL)
-        
-        last_end = 0
-        has_code_blocks = False
-        
-        for match in code_blocks:
-            has_code_blocks = True
-            start, end = match.span()
-            
-            # Add text before this code block using markdown lexer
-            if start > last_end:
-                markdown_part = content[last_end:start]
-                processed_content += pygments.highlight(markdown_part, default_lexer, self.html_formatter)
-            
-            # Extract opening, language, code and closing parts
-            opening = match.group(1)  # ```language\n
-            lang = match.group(2).strip() or None
-            code = match.group(3)
-            closing = match.group(4)  # \n```
-            
-            # First highlight the opening backticks with markdown lexer
-            processed_content += pygments.highlight(opening, default_lexer, self.html_formatter)
-            
-            try:
-                # Try to use the specified language
-                if lang and lang.lower() not in ('text', 'plain', 'markdown', 'md'):
-                    code_lexer = lexers.get_lexer_by_name(lang.lower())
+                # Non-HTML
+                if settings.viewer_type == "text":
+                    if first:
+                        self.preview_text.delete("1.0", tk.END)
+                    self.preview_text.insert(tk.END, rendered)
+                elif first:
+                    self.preview_text.load_html(rendered)
                 else:
-                    # Try to guess if no useful language is specified
-                    code_lexer = lexers.guess_lexer(code)
-            except:
-                # Default to text if we can't determine the language
-                code_lexer = lexers.get_lexer_by_name("text")
-                
-            # Highlight the code block with appropriate lexer
-            highlighted_code_part = pygments.highlight(code, code_lexer, self.html_formatter)
-            processed_content += highlighted_code_part
-            
-            # Highlight the closing backticks with markdown lexer
-            processed_content += pygments.highlight(closing, default_lexer, self.html_formatter)
-            
-            last_end = end
-            
-        # Add any remaining text after the last code block
-        if last_end < len(content):
-            remaining = content[last_end:]
-            processed_content += pygments.highlight(remaining, default_lexer, self.html_formatter)
-            
-        # If no code blocks were found, just use markdown for everything
-        if not has_code_blocks:
-            processed_content = pygments.highlight(content, default_lexer, self.html_formatter)
-            
-        # Store the processed content for the next steps    
-        highlighted_code = processed_content
-        
-        # TASK: Process the highlighted code to preserve whitespace while allowing wrapping
-        #
-        # First, convert spaces to non-breaking spaces to preserve consecutive spaces
-        # and replace tabs with the appropriate number of spaces
-        def process_content(match):
-            span_tag = match.group(1)  # This is the full span tag with attributes
-            content = match.group(2)   # This is just the content inside the span
-            
-            # Replace leading spaces with non-breaking spaces
-            processed = re.sub(r'^([ \t]+)', lambda m: '&nbsp;' * len(m.group(1)), content, flags=re.MULTILINE)
-            # Replace consecutive spaces with alternating space and non-breaking space
-            processed = re.sub(r'  +', lambda m: '&nbsp; ' * (len(m.group(0)) // 2) + ('&nbsp;' if len(m.group(0)) % 2 else ''), processed)
-            
-            # Return the span with its original attributes but processed content
-            return f'<span {span_tag}>{processed}</span>'
-            
-        # Use a regex to capture the content between span tags and process it
-        # The regex now captures both the span attributes and the content separately
-        highlighted_code = re.sub(r'<span([^>]*)>(.*?)</span>', process_content, highlighted_code, flags=re.DOTALL)
-        
-        # Then replace the pre tag with our wrapper div
-        highlighted_code = highlighted_code.replace(
-            '<div class="highlight"><pre>', 
-            '<div class="highlight"><div class="code-wrapper">'
-        ).replace('</pre></div>', '</div></div>')
-
-        # Create complete HTML document
-        css = self.css + f"""
-            body {{ 
-                font-size: {self.font_size}px; 
-            }}
-        """
-        
-        html_content = f"""
-        <html>
-        <head>
-            <style>
-                body {{ 
-                    background-color: #282828;
-                    color: #f8f8f2;
-                    font-family: 'IBM Plex Mono', 'Consolas', 'Monaco', monospace;
-                    padding: 2px;
-                }}
-                .metadata {{
-                    color: #66d9ef;
-                    margin-bottom: 10px;
-                }}
-                .code-wrapper {{
-                    font-family: monospace;
-                    margin: 0;
-                    padding: 0;
-                }}
-                {css}
-            </style>
-        </head>
-        <body>
-            <div class="metadata">
-                Sequence: {sequence}<br>
-                Role: {role}
-            </div>
-            {highlighted_code}
-        </body>
-        </html>
-        """
-        
-        # Update the display
-        self.preview_text.load_html(html_content)
+                    self.preview_text.add_html(rendered)
+                first = False
+                # Let Tk draw and handle input before the next chunk
+                await asyncio.sleep(0)
+        except Exception as e:
+            print(f">> Preview rendering failed: {type(e).__name__}: {e}")
+        finally:
+            await chunks.aclose()
 
     def _update_prompt_selector_ui(self):
         """Update the prompt selector buttons"""
@@ -751,8 +570,8 @@ class LLMControlUI:
         # Initialize selected model if not exists
         if not hasattr(self, 'selected_model'):
             self.selected_model = tk.StringVar()
-            if self.ui_model.current_provider and self.ui_model.current_model:
-                current = f"{self.ui_model.current_provider.name}:{self.ui_model.current_model}"
+            if self.ui_model.current_provider_name and self.ui_model.current_model:
+                current = f"{self.ui_model.current_provider_name}:{self.ui_model.current_model}"
                 self.selected_model.set(current)
 
         def update_model(*args):
@@ -762,12 +581,13 @@ class LLMControlUI:
             self.ui_model.set_provider(provider_name)
             self.ui_model.set_model(model_id)
             self._update_settings_menu()
+            self._warm_up_connections(load=True)
 
         self.selected_model.trace("w", update_model)
        
         # Add all models in a flat list
-        for provider_name, provider in self.ui_model.get_providers().items():
-            for model in provider.get_available_models():
+        for provider_name, models in self.ui_model.get_provider_models().items():
+            for model in models:
                 model_value = f"{provider_name}:{model.id}"
                 label = f"{model.name} ({provider_name})"
                 self.model_menu.add_radiobutton(
@@ -776,14 +596,143 @@ class LLMControlUI:
                     value=model_value
                 )
 
+        self.model_menu.add_separator()
+        self.model_menu.add_command(label="Fan-out Compare...", command=self.open_fan_out_window)
+
+    def open_fan_out_window(self):
+        """Send prompts to several models at once and compare their answers side by side"""
+        window = tk.Toplevel(self.root)
+        window.title("Fan-out Compare")
+        window.geometry("1000x750")
+
+        # Model selection, defaulting to the currently selected model
+        models_frame = ttk.LabelFrame(window, text="Models", padding=5)
+        models_frame.pack(fill=tk.X, padx=10, pady=5)
+        selected_targets = {}
+        for provider_name, models in self.ui_model.get_provider_models().items():
+            for model in models:
+                target = f"{provider_name}:{model.id}"
+                selected_targets[target] = tk.BooleanVar(value=(target == self.selected_model.get()))
+                ttk.Checkbutton(models_frame, text=f"{model.name} ({provider_name})",
+                                variable=selected_targets[target]).pack(anchor=tk.W)
+
+        # Prompt input, pre-filled from the main input box
+        prompt_box = scrolledtext.ScrolledText(window, height=4)
+        prompt_box.pack(fill=tk.X, padx=10, pady=5)
+        prompt_box.insert(tk.END, self.input_box.get("1.0", tk.END).strip())
+
+        button_frame = ttk.Frame(window)
+        button_frame.pack(fill=tk.X, padx=10)
+        status_var = StringVar(value="Status: IDLE")
+
+        # Results table: one row per model for the latest turn
+        results_tree = ttk.Treeview(window, columns=("Model", "Latency", "Tokens", "Response"), show="headings", height=6)
+        results_tree.heading("Model", text="Model")
+        results_tree.heading("Latency", text="Latency")
+        results_tree.heading("Tokens", text="Tokens")
+        results_tree.heading("Response", text="Response")
+        results_tree.column("Model", width=250, stretch=False)
+        results_tree.column("Latency", width=70, stretch=False)
+        results_tree.column("Tokens", width=70, stretch=False)
+        results_tree.column("Response", stretch=True)
+        results_tree.pack(fill=tk.X, padx=10, pady=5)
+
+        response_text = scrolledtext.ScrolledText(window, wrap=tk.WORD)
+        response_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 5))
+        ttk.Label(window, textvariable=status_var).pack(side=tk.LEFT, padx=10, pady=5)
+
+        state = {"session": None, "results": []}
+
+        async def send():
+            message = prompt_box.get("1.0", tk.END).strip()
+            targets = [t for t, var in selected_targets.items() if var.get()]
+            if not message:
+                return
+            if not targets:
+                messagebox.showerror("Error", "Select at least one model", parent=window)
+                return
+
+            status_var.set(f"Status: RUNNING on {len(targets)} models")
+            start_time = time.time()
+            try:
+                # Changing the model selection starts new branches from the main conversation
+                session = state["session"]
+                if session is None or session.targets != targets:
+                    session = self.ui_model.fan_out(self.conversation_manager, targets,
+                                                    self.prompt_manager.get_current_prompt())
+                    state["session"] = session
+                results = await session.send_message_async([message], self._request_deadline())
+            except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+                # The prompt stays in its box, so the turn can be sent again
+                fan_out_state = "TIMEOUT" if isinstance(e, asyncio.TimeoutError) else "CANCELLED"
+                print(f">> Fan-out request {fan_out_state.lower()}: {message}")
+                status_var.set(f"Status: {fan_out_state}")
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                return
+            except Exception as e:
+                print(f"FAIL, fan-out message sent to {', '.join(targets)}: {message}")
+                status_var.set("Status: FAIL")
+                messagebox.showerror("Error", f"Fan-out request failed: {type(e).__name__}: {e}", parent=window)
+                return
+            wall_time = time.time() - start_time
+
+            state["results"] = results
+            results_tree.delete(*results_tree.get_children())
+            for result in results:
+                preview = self.format_content_for_display(result.error or result.text)
+                results_tree.insert("", tk.END, values=(result.target, f"{result.latency:.2f}s",
+                                                        result.token_count if result.token_count is not None else "N/A",
+                                                        preview))
+            prompt_box.delete("1.0", tk.END)
+            status_var.set(f"Turn {len(session.turns)}: wall time {wall_time:.2f}s, "
+                           f"sum of latencies {sum(r.latency for r in results):.2f}s")
+
+        def show_result(event=None):
+            selection = results_tree.selection()
+            if selection:
+                result = state["results"][results_tree.index(selection[0])]
+                response_text.delete("1.0", tk.END)
+                response_text.insert(tk.END, result.error or result.text)
+
+        def adopt_branch():
+            """Continue the main conversation from the selected model's branch"""
+            selection = results_tree.selection()
+            if selection and state["session"]:
+                target = state["results"][results_tree.index(selection[0])].target
+                self.conversation_manager.adopt(state["session"].branches[target].fork())
+                self.scroll_tree_to_bottom()
+
+        def reset_branches():
+            state["session"] = None
+            state["results"] = []
+            results_tree.delete(*results_tree.get_children())
+            response_text.delete("1.0", tk.END)
+            status_var.set("Status: IDLE")
+
+        results_tree.bind("<<TreeviewSelect>>", show_result)
+        ttk.Button(button_frame, text="Send to Selected", command=async_handler(send)).pack(side=tk.LEFT)
+        ttk.Button(button_frame, text="Adopt Branch", command=adopt_branch).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Button(button_frame, text="Reset Branches", command=reset_branches).pack(side=tk.LEFT, padx=(5, 0))
+
+    def _ensure_settings_menu(self):
+        """Build the settings menu if it isn't for the current provider yet"""
+        if self.settings_menu_provider != self.ui_model.current_provider_name:
+            self._update_settings_menu()
+
     def _update_settings_menu(self):
         """Update settings menu based on current provider"""
         # Clear existing settings
         self.settings_menu.delete(0, tk.END)
         
-        current_provider = self.ui_model.current_provider
+        try:
+            current_provider = self.ui_model.current_provider
+        except (ValueError, ImportError) as e:
+            self.settings_menu.add_command(label=str(e), state="disabled")
+            return
         if not current_provider:
             return
+        self.settings_menu_provider = current_provider.name
             
         # Add provider name as header (disabled menu item)
         self.settings_menu.add_command(
@@ -803,6 +752,117 @@ class LLMControlUI:
             elif ui_component["type"] == "checkbox":
                 self._create_checkbox_menu_item(key, ui_component)
 
+        self.settings_menu.add_separator()
+        self.settings_menu.add_command(label="Sweep...", command=self.open_sweep_window)
+
+    def open_sweep_window(self):
+        """Run the same prompt over a grid or random sample of generation settings"""
+        provider = self.ui_model.current_provider
+        target = f"{provider.name}:{self.ui_model.current_model}"
+        knobs = provider.get_settings()
+
+        window = tk.Toplevel(self.root)
+        window.title(f"Settings Sweep: {target}")
+        window.geometry("1000x750")
+
+        # Sweep specification
+        spec_frame = ttk.Frame(window, padding=5)
+        spec_frame.pack(fill=tk.X, padx=5)
+        ttk.Label(spec_frame, text=f"Knobs: {', '.join(knobs)}").pack(anchor=tk.W)
+        ttk.Label(spec_frame, text="Values as key=v1,v2 or key=start:stop:step, separated by ';'").pack(anchor=tk.W)
+        default_spec = "temperature=0.0:2.0:0.5" if "temperature" in knobs else ""
+        spec_var = tk.StringVar(value=default_spec)
+        ttk.Entry(spec_frame, textvariable=spec_var).pack(fill=tk.X, pady=(2, 5))
+
+        options_frame = ttk.Frame(spec_frame)
+        options_frame.pack(fill=tk.X)
+        mode_var = tk.StringVar(value="grid")
+        ttk.Radiobutton(options_frame, text="Grid", variable=mode_var, value="grid").pack(side=tk.LEFT)
+        ttk.Radiobutton(options_frame, text="Random samples:", variable=mode_var, value="random").pack(side=tk.LEFT)
+        samples_var = tk.StringVar(value="8")
+        ttk.Spinbox(options_frame, from_=1, to=1000, textvariable=samples_var, width=5).pack(side=tk.LEFT)
+        ttk.Label(options_frame, text="Concurrency:").pack(side=tk.LEFT, padx=(10, 5))
+        concurrency_var = tk.StringVar(value="4")
+        ttk.Spinbox(options_frame, from_=1, to=64, textvariable=concurrency_var, width=5).pack(side=tk.LEFT)
+
+        # Prompt input, pre-filled from the main input box
+        prompt_box = scrolledtext.ScrolledText(window, height=4)
+        prompt_box.pack(fill=tk.X, padx=10, pady=5)
+        prompt_box.insert(tk.END, self.input_box.get("1.0", tk.END).strip())
+
+        button_frame = ttk.Frame(window)
+        button_frame.pack(fill=tk.X, padx=10)
+        status_var = StringVar(value="Status: IDLE")
+
+        # Results table: one row per configuration
+        results_tree = ttk.Treeview(window, columns=("Settings", "Latency", "Tokens", "Response"), show="headings", height=10)
+        results_tree.heading("Settings", text="Settings")
+        results_tree.heading("Latency", text="Latency")
+        results_tree.heading("Tokens", text="Tokens")
+        results_tree.heading("Response", text="Response")
+        results_tree.column("Settings", width=250, stretch=False)
+        results_tree.column("Latency", width=70, stretch=False)
+        results_tree.column("Tokens", width=70, stretch=False)
+        results_tree.column("Response", stretch=True)
+        results_tree.pack(fill=tk.X, padx=10, pady=5)
+
+        response_text = scrolledtext.ScrolledText(window, wrap=tk.WORD)
+        response_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 5))
+        ttk.Label(window, textvariable=status_var).pack(side=tk.LEFT, padx=10, pady=5)
+
+        state = {"results": []}
+
+        async def run():
+            message = prompt_box.get("1.0", tk.END).strip()
+            if not message:
+                return
+            try:
+                space = parse_sweep_spec(spec_var.get(), knobs)
+                if mode_var.get() == "grid":
+                    configs = grid_configurations(space)
+                else:
+                    configs = random_configurations(space, knobs, int(samples_var.get()))
+                concurrency = int(concurrency_var.get())
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid sweep: {e}", parent=window)
+                return
+
+            status_var.set(f"Status: RUNNING {len(configs)} configurations")
+            start_time = time.time()
+            results = await run_sweep(self.ui_model, target, self.conversation_manager,
+                                      self.prompt_manager.get_current_prompt(), [message], configs,
+                                      concurrency, self._request_deadline().timeout)
+            wall_time = time.time() - start_time
+
+            state["results"] = results
+            results_tree.delete(*results_tree.get_children())
+            for result in results:
+                settings = ", ".join(f"{k}={v}" for k, v in result.config.items())
+                preview = self.format_content_for_display(result.error or result.text)
+                results_tree.insert("", tk.END, values=(settings, f"{result.latency:.2f}s",
+                                                        result.token_count if result.token_count is not None else "N/A",
+                                                        preview))
+            failed = sum(1 for r in results if r.error)
+            status_var.set(f"Status: {len(results)} configurations in {wall_time:.2f}s, {failed} failed")
+
+        def show_result(event=None):
+            selection = results_tree.selection()
+            if selection:
+                result = state["results"][results_tree.index(selection[0])]
+                response_text.delete("1.0", tk.END)
+                response_text.insert(tk.END, result.error or result.text)
+
+        def save_results():
+            if not state["results"]:
+                return
+            file_path = filedialog.asksaveasfilename(parent=window, defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+            if file_path:
+                write_csv(state["results"], file_path)
+
+        results_tree.bind("<<TreeviewSelect>>", show_result)
+        ttk.Button(button_frame, text="Run Sweep", command=async_handler(run)).pack(side=tk.LEFT)
+        ttk.Button(button_frame, text="Save CSV", command=save_results).pack(side=tk.LEFT, padx=(5, 0))
+
     def _create_slider_menu_item(self, key, ui_component):
         def format_value(value, is_integer):
             return f"{int(value)}" if is_integer else f"{value:.2f}"
@@ -879,16 +939,23 @@ class LLMControlUI:
 
     # FIXME: This can race with the LLM response writing to conversation_manager
     def delete_item(self):
-        selected_items = self.tree.selection()
-        for item in reversed(selected_items):  # Reverse to maintain correct indices
-            index = self.tree.index(item)
-            self.tree.delete(item)
-            del self.conversation_manager.history[index]
+        history = self.conversation_manager.history
+        queued = self._queued_requests()
+        for index in reversed(self.tree.selection()):  # Reverse to maintain correct indices
+            if index >= len(history):
+                self.send_queue.cancel(queued[index - len(history)])
+                continue
+            self.conversation_manager.delete_item(index)
 
     def edit_item(self, event=None):
-        item = self.tree.selection()[0]
-        index = self.tree.index(item)
+        selected_items = self.tree.selection()
+        if not selected_items or selected_items[0] >= len(self.conversation_manager.history):
+            return
+        index = selected_items[0]
         message = self.conversation_manager.history[index]
+        if not message["parts"] or not isinstance(message["parts"][0], str):
+            # Function calls and attachments have no editable text
+            return
 
         role = message["role"]
         content = message["parts"][0]
@@ -906,9 +973,7 @@ class LLMControlUI:
 
         def save_changes():
             new_content = text_widget.get("1.0", tk.END).strip()
-            self.conversation_manager.history[index]["parts"][0] = new_content
-            new_content_size = len(new_content)
-            self.tree.item(item, values=(role, sequence, new_content_size, new_content))
+            self.conversation_manager.edit_item(index, new_content)
             dialog.destroy()
 
         # Create button frame
@@ -922,9 +987,10 @@ class LLMControlUI:
         cancel_button.pack(side=tk.LEFT, padx=5)
 
     def queue_to_local(self):
+        """Send the received messages to the local model, behind anything already queued"""
         queue_content = self.queue_text.get("1.0", tk.END).strip()
         if queue_content:
-            self.input_box.insert(tk.END, queue_content + "\n")
+            self.send_queue.submit(self.conversation_manager, queue_content, [queue_content])
         self.queue_text.delete("1.0", tk.END)
 
     def broadcast_message(self):
@@ -950,89 +1016,168 @@ class LLMControlUI:
             self.queue_text.see(tk.END)
         self.add_task_to_queue(tk_command)
 
-    async def send_message(self):
+    def _warm_up_connections(self, load: bool):
+        """Open the selected model's connections in the background (LLM_HTTP_WARM_UP=0 disables)"""
+        if os.environ.get("LLM_HTTP_WARM_UP", "1") != "0":
+            asyncio.ensure_future(self.ui_model.warm_up(load=load))
+
+    def _on_input_typed(self, event=None):
+        # Warm-up is rate-limited per host, so calling it on every key is cheap;
+        # don't create a provider just because the user is typing
+        self._warm_up_connections(load=False)
+        # Only once the queue is idle: a running request changes the conversation anyway
+        if not self.send_queue.current(self.conversation_manager):
+            self.prefetcher.schedule(self.conversation_manager, self.prompt_manager.get_current_prompt())
+
+    def _update_connection_stats(self):
+        from http_transport import connection_stats
+        stats = connection_stats()
+        if stats["requests"]:
+            self.connection_var.set(f"Connections: {stats['connections']} opened for {stats['requests']} requests "
+                                    f"({stats['reuse_ratio']:.0%} reused)")
+
+    def cancel_request(self):
+        """Cancel the in-flight LLM request, if any; the turn is rolled back by _send_request"""
+        if self.current_request and not self.current_request.done():
+            self.current_request.cancel()
+
+    def _request_deadline(self) -> Deadline:
+        try:
+            timeout = float(self.deadline_var.get())
+        except ValueError:
+            timeout = 0
+        return Deadline(timeout if timeout > 0 else None)
+
+    def send_message(self):
+        """Queue the input box contents (and attachments) for the current conversation"""
         message = self.input_box.get("1.0", tk.END).strip()
         if message:
-            # Add file data
-            # FIXME: Extend beyond .mp3
-            parts = [message]
-            if self.selected_file_path:
-                if self.selected_file_path.endswith(".mp3"):
-                    parts.append({
-                        "mime_type": "audio/mp3",
-                        "data": pathlib.Path(self.selected_file_path).read_bytes()
-                    })
-                    print(">> File loaded:", self.selected_file_path)
-                    self.selected_file_path = None
-
-            # Prepare LLM chat session
-            self.chat_session = self.ui_model.generate_chat_session(self.conversation_manager, self.prompt_manager.get_current_prompt())
-
-            # Add input message to conversation manager
-            seq_id = self.conversation_manager.add_user_message(parts)
-            displayed_message = self.format_content_for_display(message)
-            displayed_message_size = len(displayed_message)
-            self.tree.insert("", tk.END, values=("user", seq_id, displayed_message_size, displayed_message))
-            self.input_box.delete("1.0", tk.END)
+            # Attachments may still be loading; the request waits for them before it is sent
+            attachments = [task for _, task in self.selected_attachments]
+            if attachments:
+                print(">> Attached:", ", ".join(path for path, _ in self.selected_attachments))
+                self.clear_selected_file(cancel=False)
 
-            # Update status
-            self.status_var.set("Status: RUNNING")
-            self.root.update()
-
-            # Get LLM response
-            start_time = time.time()
+            self.input_box.delete("1.0", tk.END)
+            self.send_queue.submit(self.conversation_manager, message, [message], attachments)
+
+    def _on_request_changed(self, request: QueuedRequest):
+        """Keep the queued rows at the bottom of the tree in sync with the send queue"""
+        self.tree.refresh()
+
+        if self.send_queue.current(self.conversation_manager):
+            queued = len(self.send_queue.pending(self.conversation_manager))
+            self.status_var.set(f"Status: RUNNING ({queued} queued)" if queued else "Status: RUNNING")
+
+    def _queued_requests(self):
+        """Prompts of the current conversation not yet in its history, in sending order"""
+        loading = self.loading_request
+        current = [loading] if loading and loading.conversation_key is self.conversation_manager else []
+        return current + self.send_queue.pending(self.conversation_manager)
+
+    def _row_count(self) -> int:
+        return len(self.conversation_manager.history) + len(self._queued_requests())
+
+    def _row(self, index: int):
+        """Values and tags of a tree row: history items, then queued prompts"""
+        history = self.conversation_manager.history
+        if index < len(history):
+            tags = ("running",) if index == self.running_index else ()
+            if index in self.search_index.matches:
+                tags += ("match",)
+            return self.row_summaries.get(history[index]).values(), tags
+        request = self._queued_requests()[index - len(history)]
+        return ("queued", "", len(request.message), preview_text(request.message)), ("pending",)
+
+    async def _send_request(self, request: QueuedRequest):
+        """Send one queued prompt; run by the send queue, in order, per conversation"""
+        message = request.message
+        parts = request.parts
+        if request.attachments:
+            # Keep showing the prompt as queued while its attachments load
+            self.loading_request = request
             try:
-                r, new_history_items = await self.chat_session.send_message_async(parts)
-            except:
-                print(f"FAIL, message sent to LLM: {message}")
-                self.status_var.set("Status: FAIL")
-                self.latency_var.set("Latency: N/A")
-                self.token_count_var.set("Tokens: N/A")
+                parts = parts + [attachment.part() for attachment in await asyncio.gather(*request.attachments)]
+            except (OSError, ValueError) as e:
+                if not self.input_box.get("1.0", tk.END).strip():
+                    self.input_box.insert("1.0", message)
+                messagebox.showerror("Error", f"Failed to load attachment: {e}")
+                return
+            finally:
+                self.loading_request = None
+                self.tree.refresh()
+
+        # Prepare LLM chat session, unless it was already built while the prompt was typed
+        system_prompt = self.prompt_manager.get_current_prompt()
+        chat_session = (self.prefetcher.take_session(self.conversation_manager, system_prompt)
+                        or self.ui_model.generate_chat_session(self.conversation_manager, system_prompt))
+
+        # Snapshot the conversation so a cancelled or timed-out turn can be rolled back
+        snapshot = self.conversation_manager.fork()
+
+        # Add input message to conversation manager; the queued row becomes its history row
+        self.conversation_manager.add_user_message(parts)
+        self.running_index = len(self.conversation_manager.history) - 1
+
+        # Update status
+        self._on_request_changed(request)
+
+        # Get LLM response
+        start_time = time.time()
+        with track_hits() as cache_hits:
+            # The task takes a copy of the context, so the hits list is shared with it
+            self.current_request = asyncio.ensure_future(
+                chat_session.send_message_async(parts, self._request_deadline()))
+        self.cancel_button.config(state=tk.NORMAL)
+        try:
+            r, _ = await self.current_request
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            # Drop the user message and anything half-applied by function calls
+            self.running_index = None
+            self.conversation_manager.adopt(snapshot)
+            if not self.input_box.get("1.0", tk.END).strip():
+                self.input_box.insert("1.0", message)
+            state = "TIMEOUT" if isinstance(e, asyncio.TimeoutError) else "CANCELLED"
+            print(f">> Request {state.lower()}, turn rolled back: {message}")
+            self.status_var.set(f"Status: {state}")
+            self.latency_var.set("Latency: N/A")
+            self.token_count_var.set("Tokens: N/A")
+            if isinstance(e, asyncio.CancelledError):
                 raise
-
-            # Calculate latency
-            latency = time.time() - start_time
-            self.latency_var.set(f"Latency: {latency:.2f}s")
-
-            # Get token count from the response
-            token_count = r.usage_metadata.total_token_count
-            self.token_count_var.set(f"Tokens: {token_count}")
-
-            # Update the history with all new items from the conversation manager
-            for item in new_history_items:
-                # Display the item in the UI if it's a model message or function result
-                if item["role"] == "model":
-                    content = item["parts"][0]
-                    displayed_content = self.format_content_for_display(content)
-                    displayed_content_size = len(content)
-                    self.tree.insert("", tk.END, values=("model", item.get("sequence"), displayed_content_size, displayed_content))
-                elif item["role"] == "function":
-                    # Display function calls in the UI
-                    function_name = item["function_call"].get("name", "unknown")
-                    args = json.dumps(item["function_call"].get("args", {}))
-                    displayed_content = f"Function call: {function_name}({args})"
-                    displayed_content_size = len(displayed_content)
-                    self.tree.insert("", tk.END, values=("function", item.get("sequence"), displayed_content_size, displayed_content))
-                elif item["role"] == "function_result":
-                    # Display function results in the UI
-                    function_name = item["function_call"].get("name", "unknown")
-                    result = item["function_call"].get("result", {})
-                    success = "✓" if result.get("success", False) else "✗"
-                    message = result.get("message", "")
-                    displayed_content = f"Function result: {function_name} {success} - {message}"
-                    displayed_content_size = len(displayed_content)
-                    self.tree.insert("", tk.END, values=("function_result", item.get("sequence"), displayed_content_size, displayed_content))
-
-            # Update status to IDLE
-            self.status_var.set("Status: IDLE")
-            self.root.update()
+            return
+        except:
+            print(f"FAIL, message sent to LLM: {message}")
+            self.status_var.set("Status: FAIL")
+            self.latency_var.set("Latency: N/A")
+            self.token_count_var.set("Tokens: N/A")
+            raise
+        finally:
+            self.current_request = None
+            self.cancel_button.config(state=tk.DISABLED)
+            self.running_index = None
+            self.tree.refresh()
+
+        # Calculate latency
+        latency = time.time() - start_time
+        self.latency_var.set(f"Latency: {latency:.2f}s")
+
+        # Get token count from the response
+        token_count = r.usage_metadata.total_token_count
+        self.token_count_var.set(f"Tokens: {token_count}")
+        self._update_connection_stats()
+
+        # Update status to IDLE, noting when a hedged request was answered by a fallback model
+        # and when (part of) the answer came from the response cache
+        notes = []
+        answered_by = getattr(chat_session, "answered_by", None)
+        if answered_by and answered_by != self.selected_model.get():
+            notes.append(f"answered by {answered_by}")
+        if cache_hits:
+            notes.append("cache hit: " + ", ".join(sorted(set(cache_hits))))
+        self.status_var.set("Status: IDLE" + (f" ({'; '.join(notes)})" if notes else ""))
 
     def scroll_tree_to_bottom(self):
-        children = self.tree.get_children()
-        if children:
-            last_item = children[-1]
-            self.tree.see(last_item)
-            self.tree.selection_set(last_item)
+        self.tree.scroll_to_end()
 
     def load_context(self):
         file_path = filedialog.askopenfilename(filetypes=[("Python files", "*.py"), ["Text files", "*.txt"]])
@@ -1086,9 +1231,10 @@ class LLMControlUI:
 
                     def load_bytes(input: dict):
                         if "mime_type" in input and "data" in input:
-                            data_bytes = base64.b64decode(input["data"])
-                            input["data"] = data_bytes
-                            print(f">> Loaded data: {len(data_bytes)} bytes")
+                            # Base64 as saved by save_context and AI Studio; file_* upload references are kept as they are
+                            if isinstance(input["data"], str):
+                                input["data"] = base64.b64decode(input["data"])
+                            print(f">> Loaded data: {len(input['data'])} bytes")
                         else:
                             print(">> Warning: Skipped input dict!")
                         return input
@@ -1111,8 +1257,6 @@ class LLMControlUI:
 
                     # Add to conversation manager
                     self.conversation_manager.import_history(my_history)
-
-                    self.update_tree_view()
                     self.scroll_tree_to_bottom()
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to load context: {str(e)}")
@@ -1122,82 +1266,58 @@ class LLMControlUI:
         file_path = filedialog.asksaveasfilename(defaultextension=".py", filetypes=[("Python files", "*.py")])
         if file_path:
             try:
-                with open(file_path, "w", encoding="utf-8") as file:
-                    # Get the data to save
-                    history_data = self.conversation_manager.get_full_history()
-                    cm_data = self.conversation_manager.to_dict()
-                    
-                    # Custom encoder for handling bytes objects
-                    class BytesRepr:
-                        def __init__(self, obj):
-                            self.obj = obj
-                        
-                        def __repr__(self):
-                            return f"b{repr(self.obj.decode('utf-8', errors='backslashreplace'))}"
-                    
-                    # Prepare the data structures, handling special types
-                    def prepare_data(obj):
-                        if isinstance(obj, dict):
-                            return {k: prepare_data(v) for k, v in obj.items()}
-                        elif isinstance(obj, list):
-                            return [prepare_data(item) for item in obj]
-                        elif isinstance(obj, bytes):
-                            return BytesRepr(obj)
-                        else:
-                            return obj
-                    
-                    # Prepare data for serialization
-                    prepared_history = prepare_data(history_data)
-                    prepared_cm_data = prepare_data(cm_data)
-                    
-                    # Use pprint to generate valid Python syntax
-                    import pprint
-                    pp = pprint.PrettyPrinter(indent=2, width=120)
-                    
-                    file.write(f"history={pp.pformat(prepared_history)}\n\n")
-                    # file.write(f"conversation_data = {pp.pformat(prepared_cm_data)}\n")
+                write_context(file_path, self.conversation_manager.get_full_history())
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to save context: {str(e)}")
 
     def format_content_for_display(self, content):
         """Format content for display in the tree view."""
-        return content.replace("\n", " ")[:256]
+        return preview_text(content)
 
     def update_tree_view(self):
-        self.tree.delete(*self.tree.get_children())
-        for item in self.conversation_manager.history:
-            sequence = item.get("sequence")
-            full_content = ""
-            if item["parts"]:
-                full_content = item["parts"][0]
-            content = self.format_content_for_display(full_content)
-            content_size = len(full_content)
-            self.tree.insert("", tk.END, values=(item["role"], sequence, content_size, content))
-        self.perform_search()  # Re-apply search after updating tree view
+        """Re-render after the history was replaced (loaded, adopted or rolled back)"""
+        self.row_summaries.prune(self.conversation_manager.history)
+        # Re-apply search after updating tree view
+        matches = self.search_index.search(self.search_index.term, self.conversation_manager.history)
+        if self.search_index.term:
+            self.search_results_var.set(f"Search Results: {matches}")
+        self.tree.refresh()
+
+    def _on_conversation_event(self, event):
+        """Update the tree, search results and preview for one change to the conversation"""
+        if isinstance(event, HistoryReplaced):
+            self.update_tree_view()
+            return
+        if isinstance(event, ItemAppended):
+            self.search_index.item_appended(event.index, event.item)
+            self.tree.refresh()
+        elif isinstance(event, ItemEdited):
+            self.search_index.item_edited(event.index, event.item)
+            self.tree.refresh()
+            if event.index in self.tree.selection():
+                self.update_preview()
+        elif isinstance(event, ItemDeleted):
+            self.search_index.item_deleted(event.index)
+            self.row_summaries.forget(event.item)
+            if self.running_index is not None and self.running_index >= event.index:
+                self.running_index = self.running_index - 1 if self.running_index > event.index else None
+            self.tree.row_deleted(event.index)
+        else:
+            # Artifact and memory changes only show in the preview of later selections
+            return
+        if self.search_index.term:
+            self.search_results_var.set(f"Search Results: {len(self.search_index.matches)}")
 
     def add_task_to_queue(self, tk_command):
-        self.queue.put(tk_command)
-
-async def listen_to_queue(app):
-    try:
-        while not app.stopped:
-            queue = app.queue
-
-            # Check if there's a task in the queue
-            if not queue.empty():
-                task = queue.get()
-                # Schedule the Tk command to run on the main thread
-                app.root.after(0, task)  # Run task in the Tkinter main loop
-            await asyncio.sleep(0.1)  # Small delay to prevent tight looping
-    except:
-        return
+        """Run tk_command on the Tk thread; callable from any thread"""
+        self.dispatcher.post(tk_command)
 
 if __name__ == "__main__":
     root = tk.Tk()
-    app = LLMControlUI(root, Queue())
+    app = LLMControlUI(root, TkDispatcher.from_env())
 
-    main_loop = asyncio.get_event_loop_policy().get_event_loop()
-    asyncio.run_coroutine_threadsafe(listen_to_queue(app), main_loop)
+    # Started from within the event loop that async_mainloop runs Tk in
+    root.after(0, app.dispatcher.start)
     async_mainloop(root)
 
     # Stop threads
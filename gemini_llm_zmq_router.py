@@ -1,7 +1,19 @@
 import zmq
+import argparse
+import threading
 import time
 
 def main():
+    parser = argparse.ArgumentParser(description="ZeroMQ broker for cross-posting between tool instances")
+    parser.add_argument("--cache", action="store_true", help="Also run the shared response cache service (see response_cache_service.py)")
+    parser.add_argument("--cache-dir", help="Keep the shared cache on disk in this directory")
+    args = parser.parse_args()
+
+    if args.cache:
+        from response_cache_service import CacheService
+        service = CacheService(directory=args.cache_dir)
+        threading.Thread(target=service.serve_forever, daemon=True).start()
+
     context = zmq.Context()
     frontend = context.socket(zmq.XPUB)
     backend = context.socket(zmq.XSUB)
@@ -12,4 +24,4 @@ def main():
     zmq.proxy(frontend, backend)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,292 @@
+"""
+Virtualized history list.
+
+A ttk.Treeview with one item per history row gets slow to fill and grows Tk's
+memory with every row. VirtualTreeview keeps only as many Treeview items as
+fit on screen ("slots") and refills them from a row source as the view
+scrolls, so loading, refreshing and scrolling cost the same for 100 or 100K
+rows. Row summaries are computed once per history item by RowSummaries.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Sequence, Set, Tuple
+import json
+import tkinter as tk
+from tkinter import ttk
+
+PREVIEW_CHARS = 256
+
+@dataclass
+class RowSummary:
+    role: str
+    sequence: Any
+    size: int
+    preview: str
+
+    def values(self) -> Tuple[Any, ...]:
+        return (self.role, self.sequence, self.size, self.preview)
+
+def preview_text(content: str) -> str:
+    """One-line preview; newline -> space keeps the length, so slicing first is equivalent and cheap"""
+    return content[:PREVIEW_CHARS].replace("\n", " ")
+
+def item_text(item: Dict[str, Any]) -> str:
+    """The text a history item is shown and searched by"""
+    if "function_call" in item:
+        call = item["function_call"]
+        return f"Function call: {call.get('name', 'unknown')}({json.dumps(call.get('args', {}))})"
+    if "function_response" in item:
+        response = item["function_response"]
+        result = response.get("response", {})
+        success = "✓" if result.get("success", False) else "✗"
+        return f"Function result: {response.get('name', 'unknown')} {success} - {result.get('message', '')}"
+    if not item["parts"]:
+        return ""
+    part = item["parts"][0]
+    if isinstance(part, str):
+        return part
+    if isinstance(part, dict) and "mime_type" in part:
+        return f"[{part.get('display_name', 'attachment')}: {part['mime_type']}, {len(part.get('data', b''))} bytes]"
+    return str(part)
+
+class RowSummaries:
+    """
+    Summaries of history items, computed once per item.
+
+    Keyed by item identity; an entry is recomputed when the item's first part
+    is replaced (e.g. by editing), which is the only way items change in place.
+    """
+
+    def __init__(self):
+        self._cache: Dict[int, Tuple[Dict[str, Any], Any, RowSummary]] = {}
+
+    def get(self, item: Dict[str, Any]) -> RowSummary:
+        first_part = item["parts"][0] if item["parts"] else None
+        cached = self._cache.get(id(item))
+        if cached and cached[0] is item and cached[1] is first_part:
+            return cached[2]
+        text = item_text(item)
+        summary = RowSummary(item["role"], item.get("sequence"), len(text), preview_text(text))
+        self._cache[id(item)] = (item, first_part, summary)
+        return summary
+
+    def forget(self, item: Dict[str, Any]) -> None:
+        cached = self._cache.get(id(item))
+        if cached and cached[0] is item:
+            del self._cache[id(item)]
+
+    def prune(self, history: Sequence[Dict[str, Any]]) -> None:
+        """Drop summaries of items no longer in the history"""
+        live = {id(item) for item in history}
+        self._cache = {key: entry for key, entry in self._cache.items() if key in live}
+
+class SearchIndex:
+    """Indices of the history items containing a search term, kept up to date item by item"""
+
+    def __init__(self):
+        self.term = ""
+        self.matches: Set[int] = set()
+
+    def _match(self, item: Dict[str, Any]) -> bool:
+        return bool(self.term) and self.term in item_text(item).lower()
+
+    def search(self, term: str, history: Sequence[Dict[str, Any]]) -> int:
+        """Search the whole history; returns the number of matches"""
+        self.term = term.lower()
+        self.matches = {index for index, item in enumerate(history) if self._match(item)} if self.term else set()
+        return len(self.matches)
+
+    def clear(self) -> None:
+        self.term = ""
+        self.matches = set()
+
+    def item_appended(self, index: int, item: Dict[str, Any]) -> None:
+        if self._match(item):
+            self.matches.add(index)
+
+    def item_edited(self, index: int, item: Dict[str, Any]) -> None:
+        self.matches.discard(index)
+        self.item_appended(index, item)
+
+    def item_deleted(self, index: int) -> None:
+        self.matches = {i - 1 if i > index else i for i in self.matches if i != index}
+
+class VirtualTreeview(ttk.Frame):
+    """
+    Treeview over a large list of rows, materializing only the visible window.
+
+    row_count() gives the number of rows and row(index) their (values, tags).
+    Selection is kept as row indices, independent of what is on screen;
+    on_select is called when it changes. Call refresh() after the rows change.
+    """
+
+    def __init__(self, master, columns: Sequence[str], row_count: Callable[[], int],
+                 row: Callable[[int], Tuple[Tuple[Any, ...], Tuple[str, ...]]],
+                 on_select: Callable[[], None] = lambda: None):
+        super().__init__(master)
+        self.row_count = row_count
+        self.row = row
+        self.on_select = on_select
+        self.top = 0
+        self.selected: Set[int] = set()
+        self.anchor = 0
+        self._extend_selection = False
+
+        self.tree = ttk.Treeview(self, columns=tuple(columns), show="headings", selectmode="extended")
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.slots: List[str] = []
+
+        self.tree.bind("<Configure>", lambda event: self._resize())
+        self.tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        self.tree.bind("<ButtonPress-1>", self._on_press, add=True)
+        self.tree.bind("<MouseWheel>", lambda event: self._scroll_by(-1 * (event.delta // 120 or (1 if event.delta > 0 else -1)) * 3))
+        self.tree.bind("<Button-4>", lambda event: self._scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda event: self._scroll_by(3))
+        for key, step in (("<Up>", -1), ("<Down>", 1)):
+            self.tree.bind(key, lambda event, step=step: self._move_selection(step, event))
+        self.tree.bind("<Prior>", lambda event: self._move_selection(-self._page(), event))
+        self.tree.bind("<Next>", lambda event: self._move_selection(self._page(), event))
+        self.tree.bind("<Home>", lambda event: self._move_to(0, event))
+        self.tree.bind("<End>", lambda event: self._move_to(self.row_count() - 1, event))
+
+    # Pass-throughs for column setup, tag styling and event bindings
+    def heading(self, *args, **kwargs):
+        return self.tree.heading(*args, **kwargs)
+
+    def column(self, *args, **kwargs):
+        return self.tree.column(*args, **kwargs)
+
+    def tag_configure(self, *args, **kwargs):
+        return self.tree.tag_configure(*args, **kwargs)
+
+    def bind(self, *args, **kwargs):
+        return self.tree.bind(*args, **kwargs)
+
+    def _row_height(self) -> int:
+        if self.slots:
+            bbox = self.tree.bbox(self.slots[0])
+            if bbox:
+                return max(1, bbox[3])
+        height = ttk.Style().lookup("Treeview", "rowheight")
+        try:
+            return max(1, int(height))
+        except (TypeError, ValueError):
+            return 20
+
+    def _page(self) -> int:
+        return max(1, len(self.slots) - 1)
+
+    def _resize(self) -> None:
+        # One spare slot so a partially visible last row is still filled
+        wanted = max(1, self.tree.winfo_height() // self._row_height())
+        while len(self.slots) < wanted:
+            self.slots.append(self.tree.insert("", tk.END))
+        while len(self.slots) > wanted:
+            self.tree.delete(self.slots.pop())
+        self.refresh()
+
+    def _visible(self) -> int:
+        # The heading takes about one row
+        return max(1, len(self.slots) - 1)
+
+    def refresh(self) -> None:
+        """Re-render the visible window from the row source"""
+        count = self.row_count()
+        self.selected = {index for index in self.selected if index < count}
+        self.top = max(0, min(self.top, count - self._visible()))
+        slot_selection = []
+        for offset, slot in enumerate(self.slots):
+            index = self.top + offset
+            if index < count:
+                values, tags = self.row(index)
+                self.tree.item(slot, values=values, tags=tags)
+                if index in self.selected:
+                    slot_selection.append(slot)
+            else:
+                self.tree.item(slot, values=(), tags=())
+        if tuple(self.tree.selection()) != tuple(slot_selection):
+            self.tree.selection_set(slot_selection)
+        if count:
+            self.scrollbar.set(self.top / count, min(1.0, (self.top + self._visible()) / count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def yview(self, *args) -> None:
+        """Scrollbar command: ("moveto", fraction) or ("scroll", n, "units" | "pages")"""
+        if not args:
+            return
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * self.row_count())
+        elif args[0] == "scroll":
+            amount = int(args[1]) * (self._page() if args[2] == "pages" else 1)
+            self.top += amount
+        self.refresh()
+
+    def _scroll_by(self, rows: int) -> str:
+        self.top += rows
+        self.refresh()
+        return "break"
+
+    def see(self, index: int) -> None:
+        """Scroll so that the row is visible"""
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + self._visible():
+            self.top = index - self._visible() + 1
+        self.refresh()
+
+    def _on_press(self, event) -> None:
+        # Shift / Control clicks add to the selection, including rows scrolled out of view
+        self._extend_selection = bool(event.state & 0x0005)
+
+    def _on_tree_select(self, event=None) -> None:
+        on_screen = {self.top + self.slots.index(slot) for slot in self.tree.selection() if slot in self.slots}
+        window = set(range(self.top, self.top + len(self.slots)))
+        if on_screen == self.selected & window:
+            # Echo of refresh() re-applying the selection
+            return
+        off_screen = self.selected - window if self._extend_selection else set()
+        self.selected = {index for index in on_screen if index < self.row_count()} | off_screen
+        if on_screen:
+            self.anchor = min(on_screen) if len(on_screen) > 1 else next(iter(on_screen))
+        self.on_select()
+
+    def _move_selection(self, step: int, event=None) -> str:
+        return self._move_to(self.anchor + step, event)
+
+    def _move_to(self, index: int, event=None) -> str:
+        count = self.row_count()
+        if count:
+            self.select(max(0, min(count - 1, index)))
+        return "break"
+
+    def row_deleted(self, index: int) -> None:
+        """Keep the selection on the same rows after a row above or at it was removed"""
+        self.selected = {i - 1 if i > index else i for i in self.selected if i != index}
+        if self.anchor > index:
+            self.anchor -= 1
+        self.refresh()
+
+    def selection(self) -> List[int]:
+        return sorted(self.selected)
+
+    def clear_selection(self) -> None:
+        self.selected = set()
+        self.refresh()
+
+    def select(self, index: int) -> None:
+        """Select a single row, scroll it into view and notify"""
+        self.selected = {index}
+        self.anchor = index
+        self.see(index)
+        self.on_select()
+
+    def scroll_to_end(self, select: bool = True) -> None:
+        count = self.row_count()
+        if count:
+            if select:
+                self.select(count - 1)
+            else:
+                self.see(count - 1)
@@ -0,0 +1,119 @@
+"""
+One pooled HTTP transport shared by all providers.
+
+Every provider SDK client is built on the same httpx transport, so they share
+one connection pool with tuned keep-alive instead of each opening its own
+connections (and paying TCP + TLS setup again after every idle period).
+HTTP/2 is used when the h2 package is installed.
+
+Settings (environment):
+  LLM_HTTP_MAX_CONNECTIONS      pool size (default 20)
+  LLM_HTTP_MAX_KEEPALIVE        idle connections kept open (default 10)
+  LLM_HTTP_KEEPALIVE_EXPIRY     seconds an idle connection is kept (default 120)
+  LLM_HTTP2                     0 to disable HTTP/2 (default on if h2 is installed)
+"""
+
+from typing import Any, Dict, Optional
+import importlib.util
+import os
+import time
+
+import httpx
+
+class CountingTransport(httpx.AsyncHTTPTransport):
+    """Async transport that counts requests and newly opened connections, per host"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _host_stats(self, host: str) -> Dict[str, int]:
+        return self.stats.setdefault(host, {"requests": 0, "connections": 0, "tls_handshakes": 0})
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host_stats = self._host_stats(request.url.host)
+        host_stats["requests"] += 1
+        outer_trace = request.extensions.get("trace")
+
+        # httpcore reports connection setup through the trace extension; no event means a reused connection
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                host_stats["connections"] += 1
+            elif event_name == "connection.start_tls.complete":
+                host_stats["tls_handshakes"] += 1
+            if outer_trace:
+                await outer_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        return await super().handle_async_request(request)
+
+_transport: Optional[CountingTransport] = None
+_warmed_up: Dict[str, float] = {}
+
+def http2_enabled() -> bool:
+    return os.environ.get("LLM_HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+def keepalive_expiry() -> float:
+    return float(os.environ.get("LLM_HTTP_KEEPALIVE_EXPIRY", "120"))
+
+def shared_transport() -> CountingTransport:
+    """The process-wide transport (and connection pool), created on first use"""
+    global _transport
+    if _transport is None:
+        _transport = CountingTransport(
+            http2=http2_enabled(),
+            limits=httpx.Limits(
+                max_connections=int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", "20")),
+                max_keepalive_connections=int(os.environ.get("LLM_HTTP_MAX_KEEPALIVE", "10")),
+                keepalive_expiry=keepalive_expiry()
+            ),
+            retries=1
+        )
+    return _transport
+
+def shared_async_client(**kwargs) -> httpx.AsyncClient:
+    """
+    A new client on the shared transport, e.g. for AsyncOpenAI(http_client=...).
+
+    Clients are cheap; the pool lives in the transport. SDK timeouts are passed
+    per request, so the client default only bounds requests that pass none.
+    """
+    kwargs.setdefault("timeout", httpx.Timeout(600.0, connect=10.0))
+    return httpx.AsyncClient(transport=shared_transport(), **kwargs)
+
+async def warm_up(url: str, min_interval: Optional[float] = None) -> bool:
+    """
+    Open (or refresh) a pooled connection to url's host ahead of a real request.
+
+    Any response, including an error status, leaves a connection in the pool.
+    Skipped when the host was warmed within min_interval seconds (default: half
+    the keep-alive expiry). Returns whether a request was sent.
+    """
+    host = httpx.URL(url).host
+    interval = keepalive_expiry() / 2 if min_interval is None else min_interval
+    if time.monotonic() - _warmed_up.get(host, float("-inf")) < interval:
+        return False
+    _warmed_up[host] = time.monotonic()
+    # Not closed on purpose: closing a client closes its transport, i.e. the shared pool
+    client = shared_async_client(timeout=httpx.Timeout(10.0))
+    try:
+        await client.head(url)
+    except httpx.HTTPError as e:
+        print(f">> Warm-up of {host} failed: {type(e).__name__}: {e}")
+        return False
+    return True
+
+def connection_stats() -> Dict[str, Any]:
+    """Requests, new connections and TLS handshakes per host, plus the overall reuse ratio"""
+    if _transport is None:
+        return {"requests": 0, "connections": 0, "reuse_ratio": None, "hosts": {}}
+    hosts = {host: dict(stats) for host, stats in _transport.stats.items()}
+    requests = sum(s["requests"] for s in hosts.values())
+    connections = sum(s["connections"] for s in hosts.values())
+    return {
+        "requests": requests,
+        "connections": connections,
+        # Share of requests that went out on an already open connection
+        "reuse_ratio": (requests - connections) / requests if requests else None,
+        "hosts": hosts
+    }
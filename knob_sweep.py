@@ -0,0 +1,150 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+import asyncio
+import csv
+import itertools
+import random
+import time
+
+from conversation_manager import ConversationManager
+from knob_factory import Knob, SliderKnob, CheckboxKnob
+from request_deadline import Deadline
+
+@dataclass
+class SweepResult:
+    """Outcome of one knob configuration in a sweep"""
+    config: Dict[str, Any]
+    text: str = ""
+    latency: float = 0.0
+    token_count: Optional[int] = None
+    error: Optional[str] = None
+
+def _parse_value(knob: Knob, text: str) -> Any:
+    text = text.strip()
+    if isinstance(knob, SliderKnob):
+        return int(float(text)) if knob.is_integer else float(text)
+    if isinstance(knob, CheckboxKnob):
+        return text.lower() in ("1", "true", "yes", "on")
+    return text
+
+def parse_sweep_spec(spec: str, knobs: Dict[str, Knob]) -> Dict[str, List[Any]]:
+    """
+    Parse a sweep specification into a value list per knob.
+
+    The format is "key=v1,v2,...; key=start:stop:step", e.g.
+    "temperature=0.0:2.0:0.5; top_k=1,20,40". Ranges include the stop value.
+    """
+    space = {}
+    for clause in spec.split(";"):
+        if not clause.strip():
+            continue
+        if "=" not in clause:
+            raise ValueError(f"Expected key=values in sweep clause: {clause.strip()}")
+        key, values = (s.strip() for s in clause.split("=", 1))
+        if key not in knobs:
+            raise ValueError(f"Unknown knob: {key} (available: {', '.join(knobs)})")
+        knob = knobs[key]
+        if ":" in values:
+            start, stop, step = (float(v) for v in values.split(":"))
+            if step <= 0:
+                raise ValueError(f"Step must be positive for knob: {key}")
+            count = int(round((stop - start) / step)) + 1
+            parsed = [_parse_value(knob, str(round(start + i * step, 10))) for i in range(count)]
+        else:
+            parsed = [_parse_value(knob, v) for v in values.split(",") if v.strip()]
+        space[key] = parsed
+    return space
+
+def grid_configurations(space: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Every combination of the given knob values"""
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+def random_configurations(space: Dict[str, List[Any]], knobs: Dict[str, Knob], samples: int,
+                          rng: Optional[random.Random] = None) -> List[Dict[str, Any]]:
+    """
+    Random configurations over the knobs named in space.
+
+    Sliders are sampled uniformly between the smallest and largest listed
+    value (or the knob's full range if only one value was listed); other
+    knobs pick one of the listed values.
+    """
+    rng = rng or random.Random()
+    configs = []
+    for _ in range(samples):
+        config = {}
+        for key, values in space.items():
+            knob = knobs[key]
+            if isinstance(knob, SliderKnob):
+                low, high = (min(values), max(values)) if len(values) > 1 else (knob.min_value, knob.max_value)
+                config[key] = rng.randint(int(low), int(high)) if knob.is_integer else round(rng.uniform(low, high), 3)
+            else:
+                config[key] = rng.choice(values)
+        configs.append(config)
+    return configs
+
+@contextmanager
+def knob_overrides(knobs: Dict[str, Knob], values: Dict[str, Any]) -> Iterator[None]:
+    """Temporarily set knob values, e.g. while a chat session captures its settings"""
+    saved = {key: knobs[key].get_value() for key in values}
+    try:
+        for key, value in values.items():
+            knobs[key].set_value(value)
+        yield
+    finally:
+        for key, value in saved.items():
+            knobs[key].value = value
+
+async def run_sweep(ui_model, target: str, conversation_manager: ConversationManager, system_prompt: Optional[str],
+                    parts: List[Any], configs: List[Dict[str, Any]], concurrency: int = 4,
+                    timeout: Optional[float] = None) -> List[SweepResult]:
+    """
+    Run the same turn once per knob configuration, at most `concurrency` at a time.
+
+    Every run happens on a throw-away fork of the conversation, so the main
+    history is never touched. Each run gets its own deadline of `timeout`
+    seconds (None: unbounded) from when it starts, not while it waits for its
+    turn. Results are in configuration order.
+    """
+    provider_name = target.split(":", 1)[0]
+    knobs = ui_model.get_provider(provider_name).get_settings()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(config: Dict[str, Any]) -> SweepResult:
+        async with semaphore:
+            branch = conversation_manager.fork()
+            deadline = Deadline(timeout)
+            start_time = time.monotonic()
+            try:
+                # Sessions capture their settings on creation, so the override is only needed here
+                with knob_overrides(knobs, config):
+                    session = ui_model.create_target_session(target, branch, system_prompt)
+                branch.add_user_message(parts)
+                response, new_history_items = await session.send_message_async(list(parts), deadline)
+            except Exception as e:
+                return SweepResult(config=config, latency=time.monotonic() - start_time, error=f"{type(e).__name__}: {e}")
+
+            texts = [item["parts"][0] for item in new_history_items if item["role"] == "model" and item["parts"]]
+            usage = getattr(response, "usage_metadata", None)
+            return SweepResult(
+                config=config,
+                text="\n\n".join(texts),
+                latency=time.monotonic() - start_time,
+                token_count=getattr(usage, "total_token_count", None)
+            )
+
+    return await asyncio.gather(*[run_one(config) for config in configs])
+
+def write_csv(results: List[SweepResult], path: str) -> None:
+    """Write sweep results as CSV, one column per swept knob"""
+    keys = []
+    for result in results:
+        keys += [k for k in result.config if k not in keys]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(keys + ["latency_s", "token_count", "error", "text"])
+        for result in results:
+            writer.writerow([result.config.get(k, "") for k in keys] +
+                            [f"{result.latency:.3f}", result.token_count if result.token_count is not None else "",
+                             result.error or "", result.text])
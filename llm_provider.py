@@ -1,17 +1,77 @@
 from abc import ABC, abstractmethod
 from typing import Dict, List, Any, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import asyncio
+import uuid
+
+from conversation_manager import ConversationManager
+from request_hedging import HedgePolicy
+from response_cache import ResponseCache
+from request_deadline import Deadline, UNBOUNDED
+from file_uploads import UploadedFile, upload_attachments
 
 @dataclass
 class ModelOption:
     id: str
     name: str
+    # Optional tail-latency hedging / fallback policy for this model
+    hedge: Optional[HedgePolicy] = None
+
+@dataclass
+class BatchRequest:
+    """One turn to run as part of a batch: parts are sent after the conversation's history"""
+    custom_id: str
+    model_id: str
+    conversation_manager: ConversationManager
+    parts: List[Any]
+    system_prompt: Optional[str] = None
+
+@dataclass
+class BatchResult:
+    custom_id: str
+    text: str = ""
+    token_count: Optional[int] = None
+    error: Optional[str] = None
+
+@dataclass
+class BatchJob:
+    """A submitted batch; handle is whatever the provider needs to poll and collect it"""
+    id: str
+    provider: str
+    requests: List[BatchRequest]
+    status: str = "running"  # running -> succeeded | failed | cancelled
+    results: Dict[str, BatchResult] = field(default_factory=dict)
+    handle: Any = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def apply_results(self) -> int:
+        """
+        Append each successful result to its conversation as a user / model turn.
+
+        Batch results are text only; function calls are not executed. Returns
+        the number of conversations updated.
+        """
+        applied = 0
+        for request in self.requests:
+            result = self.results.get(request.custom_id)
+            if result and not result.error:
+                cm = request.conversation_manager
+                cm.add_user_message(request.parts)
+                cm.add_model_message(result.text, cm.seq_user + 1)
+                cm.seq_user += 1
+                applied += 1
+        return applied
 
 class LLMProvider(ABC):
     def __init__(self):
         self.name: str = ""
         self.models: List[ModelOption] = []
         self.settings: Dict[str, Any] = {}
+        # Record / replay cache shared by this provider's chat sessions (None = off)
+        self.response_cache: Optional[ResponseCache] = None
         
     @abstractmethod
     def initialize(self) -> None:
@@ -31,4 +91,88 @@ class LLMProvider(ABC):
     @abstractmethod
     def create_chat_session(self, model_id: str, history: List[Dict], system_prompt: Optional[str]) -> Any:
         """Create a chat session with the specified model"""
-        pass
\ No newline at end of file
+        pass
+
+    def warm_up_urls(self, model_id: str) -> List[str]:
+        """Endpoints a request to the model goes to, for connection warm-up"""
+        return []
+
+    async def warm_up(self, model_id: str) -> None:
+        """Open pooled connections to the model's endpoints before the first request"""
+        urls = self.warm_up_urls(model_id)
+        if urls:
+            from http_transport import warm_up
+            for url in urls:
+                await warm_up(url)
+
+    # File uploads. Providers with a file API override these; large attachments
+    # are then sent by reference (see file_uploads.py) instead of inline.
+    def can_upload_files(self) -> bool:
+        return False
+
+    async def upload_file(self, data: bytes, mime_type: str, deadline: Deadline = UNBOUNDED) -> UploadedFile:
+        """Upload one attachment within the deadline and return its reference"""
+        raise NotImplementedError(f"Provider {self.name} has no file upload API")
+
+    async def upload_attachments(self, parts: List[Any], deadline: Deadline = UNBOUNDED) -> int:
+        """Upload the large attachments among parts that have no current reference on this provider"""
+        if not self.can_upload_files():
+            return 0
+        return await upload_attachments(parts, self.name,
+                                        lambda data, mime_type: self.upload_file(data, mime_type, deadline))
+
+    # Batch interface. Providers with a native batch API override submit / poll /
+    # collect; the defaults simulate a batch in-process with bounded concurrency.
+    batch_concurrency: int = 4
+
+    async def submit_batch(self, requests: List[BatchRequest]) -> BatchJob:
+        """Submit many requests to run offline"""
+        job = BatchJob(id=f"local-{uuid.uuid4()}", provider=self.name, requests=requests)
+        job.handle = asyncio.ensure_future(self._run_local_batch(job))
+        return job
+
+    async def poll_batch(self, job: BatchJob) -> str:
+        """Refresh and return the job status"""
+        return job.status
+
+    async def collect_batch(self, job: BatchJob) -> Dict[str, BatchResult]:
+        """Return the results of a finished job, keyed by custom_id"""
+        return job.results
+
+    async def run_batch(self, requests: List[BatchRequest], poll_interval: float = 30.0) -> BatchJob:
+        """Submit, wait for completion and collect; results still need job.apply_results()"""
+        job = await self.submit_batch(requests)
+        while not job.done:
+            if await self.poll_batch(job) in ("succeeded", "failed", "cancelled"):
+                break
+            await asyncio.sleep(poll_interval)
+        job.results = await self.collect_batch(job)
+        return job
+
+    async def _run_local_batch(self, job: BatchJob) -> None:
+        semaphore = asyncio.Semaphore(max(1, self.batch_concurrency))
+
+        async def run_one(request: BatchRequest) -> BatchResult:
+            async with semaphore:
+                # Run on a fork; apply_results() later records the turn in the real conversation
+                branch = request.conversation_manager.fork()
+                try:
+                    session = self.create_chat_session(request.model_id, branch, request.system_prompt)
+                    branch.add_user_message(request.parts)
+                    response, new_history_items = await session.send_message_async(list(request.parts))
+                except Exception as e:
+                    return BatchResult(custom_id=request.custom_id, error=f"{type(e).__name__}: {e}")
+                usage = getattr(response, "usage_metadata", None)
+                return BatchResult(
+                    custom_id=request.custom_id,
+                    text="\n\n".join(i["parts"][0] for i in new_history_items if i["role"] == "model" and i["parts"]),
+                    token_count=getattr(usage, "total_token_count", None)
+                )
+
+        try:
+            results = await asyncio.gather(*[run_one(r) for r in job.requests])
+            job.results = {r.custom_id: r for r in results}
+            job.status = "succeeded"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
\ No newline at end of file
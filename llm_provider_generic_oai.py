@@ -1,11 +1,19 @@
-from llm_provider import LLMProvider, ModelOption
+from llm_provider import LLMProvider, ModelOption, BatchRequest, BatchResult, BatchJob
 from knob_factory import KnobFactory
+from builtin_models import groq_nous_models
 
 from typing import Dict, List, Any, Optional
 from conversation_manager import ConversationManager
+from request_deadline import Deadline, UNBOUNDED
+from response_cache import request_fingerprint
+from http_transport import shared_async_client
 
 import os
+import copy
+import json
+import uuid
 from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
 
 from icecream import ic
 DEBUG = True
@@ -27,48 +35,22 @@ class GenericOAIWrapperProvider(LLMProvider):
         if not "NOUS_API_KEY" in os.environ:
             raise ValueError("Missing NOUS_API_KEY environment variable")
             
-        self.settings = {
-            "temperature": KnobFactory.create_knob("slider", 
-                name="Temperature", 
-                min_value=0.0, 
-                max_value=2.0, 
-                default_value=1.25
-            ),
-            "top_p": KnobFactory.create_knob("slider", 
-                name="Top P", 
-                min_value=0.0, 
-                max_value=1.0, 
-                default_value=0.95
-            )
-        }
+        self.settings = self._create_settings()
         
-        self.models = [
-            ModelOption(
-                id="groq-llama-3.3-70b-versatile",
-                name="Llama 3.3 70B Versatile (Groq)"
-            ),
-            ModelOption(
-                id="nous-Hermes-3-Llama-3.1-70B",
-                name="Hermes 3 Llama 3.1 70B (Nous)"
-            ),
-            ModelOption(
-                id="nous-DeepHermes-3-Mistral-24B-Preview",
-                name="DeepHermes 3 Mistral 24B Preview (Nous)"
-            ),
-            ModelOption(
-                id="nous-DeepHermes-3-Llama-3-8B-Preview",
-                name="DeepHermes 3 Llama 3 8B Preview (Nous)"
-            )
-        ]
+        self.models = groq_nous_models()
         
+        # Base URLs can be overridden, e.g. to point at fake_llm_server.py
+        # Both clients share the pooled transport from http_transport
         self.client_groq = AsyncOpenAI(
             api_key=os.environ["GROQ_API_KEY"],
-            base_url="https://api.groq.com/openai/v1"
+            base_url=os.environ.get("GROQ_BASE_URL", "https://api.groq.com/openai/v1"),
+            http_client=shared_async_client()
         )
         
         self.client_nous = AsyncOpenAI(
             api_key=os.environ["NOUS_API_KEY"],
-            base_url="https://inference-api.nousresearch.com/v1"
+            base_url=os.environ.get("NOUS_BASE_URL", "https://inference-api.nousresearch.com/v1"),
+            http_client=shared_async_client()
         )
 
     def get_available_models(self) -> List[ModelOption]:
@@ -76,8 +58,25 @@ class GenericOAIWrapperProvider(LLMProvider):
         
     def get_settings(self) -> Dict[str, Any]:
         return self.settings
+
+    def _create_settings(self) -> Dict[str, Any]:
+        return {
+            "temperature": KnobFactory.create_knob("slider", 
+                name="Temperature", 
+                min_value=0.0, 
+                max_value=2.0, 
+                default_value=1.25
+            ),
+            "top_p": KnobFactory.create_knob("slider", 
+                name="Top P", 
+                min_value=0.0, 
+                max_value=1.0, 
+                default_value=0.95
+            )
+        }
         
-    def create_chat_session(self, model_id: str, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> Any:
+    def _build_messages(self, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> List[Dict[str, str]]:
+        """Translate conversation manager history into OpenAI chat messages (text only)"""
         messages = []
         if system_prompt:
             messages.append(
@@ -101,7 +100,10 @@ class GenericOAIWrapperProvider(LLMProvider):
                 })
             else:
                 print("!!! message ignored --", item)
+        return messages
 
+    def _resolve_model(self, model_id: str):
+        """Return the client and the actual model ID for a prefixed model ID"""
         # Select the appropriate client based on model prefix
         if model_id.startswith("groq-"):
             client = self.client_groq
@@ -113,17 +115,125 @@ class GenericOAIWrapperProvider(LLMProvider):
             actual_model_id = model_id[5:]
         else:
             raise ValueError(f"Unknown model provider prefix in model_id: {model_id}")
+        return client, actual_model_id
+
+    def warm_up_urls(self, model_id: str) -> List[str]:
+        client, _ = self._resolve_model(model_id)
+        return [str(client.base_url)]
+
+    def create_chat_session(self, model_id: str, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> Any:
+        messages = self._build_messages(conversation_manager, system_prompt)
+        client, actual_model_id = self._resolve_model(model_id)
 
         return ChatSession(
             client=client,
             model=actual_model_id,
             messages=messages,
-            settings=self.settings,
-            conversation_manager=conversation_manager
+            # Snapshot the knobs so later changes (or a sweep) don't affect this session
+            settings=copy.deepcopy(self.settings),
+            conversation_manager=conversation_manager,
+            response_cache=self.response_cache
         )
 
+    async def submit_batch(self, requests: List[BatchRequest]) -> BatchJob:
+        """Submit requests through the OpenAI-compatible /batches API, one batch per endpoint"""
+        job = BatchJob(id=f"oai-{uuid.uuid4()}", provider=self.name, requests=requests, handle={})
+
+        lines_by_client = {}
+        for request in requests:
+            if len(request.parts) != 1 or not isinstance(request.parts[0], str):
+                raise ValueError('Only text messages are supported!')
+            client, actual_model_id = self._resolve_model(request.model_id)
+            messages = self._build_messages(request.conversation_manager, request.system_prompt)
+            messages.append({"role": "user", "content": request.parts[0]})
+            line = {
+                "custom_id": request.custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": actual_model_id,
+                    "messages": messages,
+                    "temperature": self.settings["temperature"].get_value(),
+                    "top_p": self.settings["top_p"].get_value()
+                }
+            }
+            lines_by_client.setdefault(client, []).append(json.dumps(line))
+
+        for client, lines in lines_by_client.items():
+            batch_file = await client.files.create(file=(f"{job.id}.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+            batch = await client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+            job.handle[batch.id] = client
+        return job
+
+    async def poll_batch(self, job: BatchJob) -> str:
+        statuses = []
+        for batch_id, client in job.handle.items():
+            batch = await client.batches.retrieve(batch_id)
+            statuses.append(batch.status)
+        if any(s in ("validating", "in_progress", "finalizing", "cancelling") for s in statuses):
+            job.status = "running"
+        elif all(s == "completed" for s in statuses):
+            job.status = "succeeded"
+        elif any(s == "cancelled" for s in statuses):
+            job.status = "cancelled"
+        else:
+            job.status = "failed"
+        return job.status
+
+    async def collect_batch(self, job: BatchJob) -> Dict[str, BatchResult]:
+        results = {}
+        for batch_id, client in job.handle.items():
+            batch = await client.batches.retrieve(batch_id)
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                content = await client.files.content(file_id)
+                for line in content.text.splitlines():
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    custom_id = item["custom_id"]
+                    response = item.get("response") or {}
+                    body = response.get("body") or {}
+                    if item.get("error") or response.get("status_code", 200) != 200:
+                        error = item.get("error") or body.get("error") or f"HTTP {response.get('status_code')}"
+                        results[custom_id] = BatchResult(custom_id=custom_id, error=str(error))
+                    else:
+                        results[custom_id] = BatchResult(
+                            custom_id=custom_id,
+                            text=body["choices"][0]["message"]["content"],
+                            token_count=body.get("usage", {}).get("total_tokens")
+                        )
+        for request in job.requests:
+            if request.custom_id not in results:
+                results[request.custom_id] = BatchResult(custom_id=request.custom_id, error="No result returned")
+        return results
+
+class OpenAICompatibleProvider(GenericOAIWrapperProvider):
+    """
+    Any single OpenAI-compatible endpoint (vLLM, llama.cpp server, Ollama, ...).
+
+    Meant to be configured from providers.json; name and models come from the
+    provider spec, model IDs are passed to the endpoint as they are.
+    """
+
+    def __init__(self, base_url: str, api_key_env: Optional[str] = None):
+        super().__init__()
+        self.name = ""
+        self.base_url = base_url
+        self.api_key_env = api_key_env
+
+    def initialize(self):
+        # Local servers usually ignore the key, but the client requires one
+        api_key = os.environ.get(self.api_key_env, "") if self.api_key_env else ""
+        self.settings = self._create_settings()
+        self.client = AsyncOpenAI(api_key=api_key or "none", base_url=self.base_url, http_client=shared_async_client())
+
+    def _resolve_model(self, model_id: str):
+        return self.client, model_id
+
 class ChatSession:
-    def __init__(self, client, model, messages, settings, conversation_manager):
+    def __init__(self, client, model, messages, settings, conversation_manager, response_cache=None):
         self.client = client
         self.model = model
         self.messages = messages
@@ -131,8 +241,9 @@ class ChatSession:
         self.text = None
         self.usage_metadata = UsageMetadataWrapper()
         self.conversation_manager = conversation_manager
+        self.response_cache = response_cache
         
-    async def send_message_async(self, parts: List[Any]):
+    async def send_message_async(self, parts: List[Any], deadline: Deadline = UNBOUNDED):
         # Track the initial history length to identify new items
         initial_history_length = len(self.conversation_manager.history)
 
@@ -147,12 +258,29 @@ class ChatSession:
         if DEBUG:
             ic("LLM chat_history:", self.messages)
        
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=self.messages,
-            temperature=self.settings["temperature"].get_value(),
-            top_p=self.settings["top_p"].get_value()
-        )
+        request = {
+            "model": self.model,
+            "messages": self.messages,
+            "temperature": self.settings["temperature"].get_value(),
+            "top_p": self.settings["top_p"].get_value()
+        }
+
+        def create():
+            # An explicit timeout=None would turn the client's default timeout off, so only bounded deadlines pass one
+            remaining = deadline.remaining()
+            options = {} if remaining is None else {"timeout": remaining}
+            return deadline.wait_for(self.client.chat.completions.create(**request, **options))
+
+        if self.response_cache is None:
+            response = await create()
+        else:
+            response = await self.response_cache.fetch(
+                request_fingerprint(**request),
+                create,
+                encode=lambda r: r.model_dump(mode="json", exclude_none=True),
+                decode=ChatCompletion.model_validate,
+                deadline=deadline
+            )
         if DEBUG:
             ic("LLM response:", response)
 
@@ -1,14 +1,30 @@
-from llm_provider import LLMProvider, ModelOption
+from llm_provider import LLMProvider, ModelOption, BatchRequest, BatchResult, BatchJob
 from knob_factory import KnobFactory, Knob
+from builtin_models import google_models
+from request_deadline import Deadline, UNBOUNDED
+from response_cache import ResponseCache, request_fingerprint
+from http_transport import shared_transport
+from file_uploads import UploadedFile, history_parts, processing_timeout, uploaded_uri
 from typing import Dict, List, Any, Optional
+import asyncio
+import io
 import os
+import uuid
 from conversation_manager import ConversationManager
 
 from icecream import ic
 
 from google import genai
-from google.genai.types import HarmCategory, HarmBlockThreshold, SafetySetting
-from google.genai.types import GenerateContentConfig, Content, Part, Tool, FunctionDeclaration
+from google.genai.types import HarmCategory, HarmBlockThreshold, SafetySetting, HttpOptions
+from google.genai.types import GenerateContentConfig, GenerateContentResponse, Content, Part, Tool, FunctionDeclaration
+from google.genai.types import FileState, UploadFileConfig
+
+def attachment_part(part: Dict[str, Any], provider_name: str) -> Part:
+    """An attachment by file URI once uploaded to this provider, inline otherwise"""
+    file_uri = uploaded_uri(part, provider_name)
+    if file_uri:
+        return Part.from_uri(file_uri=file_uri, mime_type=part["mime_type"])
+    return Part.from_bytes(data=part["data"], mime_type=part["mime_type"])
 
 class GoogleAIProvider(LLMProvider):
     def __init__(self):
@@ -17,15 +33,23 @@ class GoogleAIProvider(LLMProvider):
         self.settings = {}
         self.conversation_manager = ConversationManager()
 
+        # Async requests go through the pooled transport shared with the other providers;
+        # GOOGLE_GEMINI_BASE_URL points the Developer API elsewhere, e.g. at fake_llm_server.py
+        http_options = HttpOptions(async_client_args={"transport": shared_transport()},
+                                   base_url=os.environ.get("GOOGLE_GEMINI_BASE_URL"))
+
         # Import based on API flavor
         if not "GOOGLE_API_KEY" in os.environ:
             print(">> Using Gen AI SDK on Vertex AI Gemini API")
             self.client = genai.Client(vertexai=True,
                                        project=os.environ["GOOGLE_VERTEX_AI_PROJECT_ID"],
-                                       location=os.environ["GOOGLE_VERTEX_AI_REGION"])
+                                       location=os.environ["GOOGLE_VERTEX_AI_REGION"],
+                                       http_options=http_options)
+            self.endpoint = f"https://{os.environ['GOOGLE_VERTEX_AI_REGION']}-aiplatform.googleapis.com/"
         else:
             print(">> Using Gen AI SDK on Gemini Developer API")
-            self.client = genai.Client(api_key=os.environ['GOOGLE_API_KEY'])
+            self.client = genai.Client(api_key=os.environ['GOOGLE_API_KEY'], http_options=http_options)
+            self.endpoint = http_options.base_url or "https://generativelanguage.googleapis.com/"
 
     def initialize(self):
         # Initialize settings with knobs
@@ -68,44 +92,16 @@ class GoogleAIProvider(LLMProvider):
             )
         }
 
-        # Vertex AI model list
-        if not "GOOGLE_API_KEY" in os.environ:
-            self.models = [
-                ModelOption(
-                    id="gemini-2.0-pro-exp-02-05",
-                    name="Gemini 2.0 Pro Experimental"
-                ),
-                ModelOption(
-                    id="gemini-1.5-pro-002",
-                    name="Gemini 1.5 Pro"
-                ),
-                ModelOption(
-                    id="gemini-2.0-flash-exp",
-                    name="Gemini 2.0 Flash Experimental"
-                ),
-                ModelOption(
-                    id="gemini-2.0-flash-thinking-exp-01-21",
-                    name="Gemini 2.0 Flash Experimental (Thinking)"
-                )
-            ]
-        # Gemini Developer API model list
-        else:
-            self.models = [
-                ModelOption(
-                    id="gemini-2.0-pro-exp-02-05",
-                    name="Gemini 2.0 Pro Experimental"
-                ),
-                ModelOption(
-                    id="gemini-1.5-pro",
-                    name="Gemini 1.5 Pro"
-                )
-            ]
+        self.models = google_models()
 
     def get_available_models(self) -> List[ModelOption]:
         return self.models
         
     def get_settings(self) -> Dict[str, Any]:
         return self.settings
+
+    def warm_up_urls(self, model_id: str) -> List[str]:
+        return [self.endpoint]
     
     def _get_artifact_tool_functions(self):
         """Define the function declarations for the model to use"""
@@ -218,25 +214,8 @@ class GoogleAIProvider(LLMProvider):
         )
         return [memory_twizzle_function]
         
-    def create_chat_session(self, model_id: str, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> Any:
-        DO_DEBUG = self.settings["enable_debug_prints"].get_value()
-
-        # Update the conversation manager with the provided history
-        self.conversation_manager = conversation_manager
-
-        # If a system_prompt is provided, update it in the conversation manager
-        if system_prompt:
-            if self.conversation_manager.system_prompt_setup != system_prompt:
-                self.conversation_manager.system_prompt_setup = system_prompt
-                self.conversation_manager.system_prompt = system_prompt
-        
-        # Get the full system prompt with memories
-        full_system_prompt = self.conversation_manager.get_full_system_prompt()
-
-        # Debug
-        if DO_DEBUG:
-            ic("SP:", full_system_prompt)
-
+    def _build_generation_config(self, full_system_prompt: Optional[str], include_tools: bool = True) -> Dict[str, Any]:
+        """Build the generation config from the current knob values"""
         safety_settings = [
             SafetySetting(category='HARM_CATEGORY_CIVIC_INTEGRITY', threshold='BLOCK_NONE'),
             SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT', threshold='BLOCK_NONE'),
@@ -248,9 +227,9 @@ class GoogleAIProvider(LLMProvider):
         
         # Check if function calling is enabled
         tools = []
-        if self.settings["enable_artifact_gizmos"].get_value():
+        if include_tools and self.settings["enable_artifact_gizmos"].get_value():
             tools += [Tool(function_declarations=self._get_artifact_tool_functions())]
-        if self.settings["enable_memory_gizmos"].get_value():
+        if include_tools and self.settings["enable_memory_gizmos"].get_value():
             tools += [Tool(function_declarations=self._get_system_prompt_tool_functions())]
             tools += [Tool(function_declarations=self._get_memory_twizzle_tool_functions())]
 
@@ -265,10 +244,10 @@ class GoogleAIProvider(LLMProvider):
             "top_k": self.settings["top_k"].get_value(),
             "max_output_tokens": self.settings["max_output_tokens"].get_value(),
         }
+        return generation_config
 
-        # Get the LLM-compatible history
-        llm_history = self.conversation_manager.get_llm_history()
-        
+    def _translate_history(self, llm_history: List[Dict[str, Any]]) -> List[Content]:
+        """Translate conversation manager history into Gen AI SDK contents"""
         filtered_history = []
         for item in llm_history:
             if item["role"] == "user" or item["role"] == "model":
@@ -278,7 +257,7 @@ class GoogleAIProvider(LLMProvider):
                     if isinstance(part, str):
                         parts.append(Part.from_text(text=part))
                     elif isinstance(part, dict) and "mime_type" in part and "data" in part:
-                        parts.append(Part.from_bytes(data=part["data"], mime_type=part["mime_type"]))
+                        parts.append(attachment_part(part, self.name))
                 filtered_item = Content(role=item["role"], parts=parts)
             elif item["role"] == "function" and "function_call" in item:
                 # Process function calls
@@ -296,6 +275,32 @@ class GoogleAIProvider(LLMProvider):
                 )
                 filtered_item = Content(role="function", parts=[part])
             filtered_history.append(filtered_item)
+        return filtered_history
+
+    def create_chat_session(self, model_id: str, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> Any:
+        DO_DEBUG = self.settings["enable_debug_prints"].get_value()
+
+        # Update the conversation manager with the provided history
+        self.conversation_manager = conversation_manager
+
+        # If a system_prompt is provided, update it in the conversation manager
+        if system_prompt:
+            if self.conversation_manager.system_prompt_setup != system_prompt:
+                self.conversation_manager.system_prompt_setup = system_prompt
+                self.conversation_manager.system_prompt = system_prompt
+        
+        # Get the full system prompt with memories
+        full_system_prompt = self.conversation_manager.get_full_system_prompt()
+
+        # Debug
+        if DO_DEBUG:
+            ic("SP:", full_system_prompt)
+
+        generation_config = self._build_generation_config(full_system_prompt)
+
+        # Get the LLM-compatible history
+        llm_history = self.conversation_manager.get_llm_history()
+        filtered_history = self._translate_history(llm_history)
 
         # Debug
         if DO_DEBUG:
@@ -309,31 +314,187 @@ class GoogleAIProvider(LLMProvider):
         )
         
         # Wrap the chat session to handle function calls if enabled
+        session_class = SimpleChatSession
         if self.settings["enable_artifact_gizmos"].get_value():
-            return FunctionCallingChatSession(chat_session, self.conversation_manager, DO_DEBUG)
-        
-        return SimpleChatSession(chat_session, self.conversation_manager, DO_DEBUG)
+            session_class = FunctionCallingChatSession
+
+        return session_class(chat_session, self.conversation_manager, DO_DEBUG, generation_config,
+                             response_cache=self.response_cache, client=self.client, model_id=model_id,
+                             history=filtered_history, provider=self, llm_history=llm_history)
+
+    def can_upload_files(self) -> bool:
+        # The file API is only part of the Gemini Developer API
+        return not self.client.vertexai
+
+    async def upload_file(self, data: bytes, mime_type: str, deadline: Deadline = UNBOUNDED) -> UploadedFile:
+        file = await deadline.wait_for(
+            self.client.aio.files.upload(file=io.BytesIO(data), config=UploadFileConfig(mime_type=mime_type)))
+        # Audio and video are processed before they can be used
+        loop, timeout = asyncio.get_running_loop(), processing_timeout()
+        give_up_at = loop.time() + timeout
+        while file.state == FileState.PROCESSING:
+            if loop.time() >= give_up_at:
+                # Not recorded as uploaded, so the attachment is sent inline
+                raise asyncio.TimeoutError(f"Uploaded file {file.name} still processing after {timeout:.0f}s")
+            await deadline.wait_for(asyncio.sleep(1))
+            file = await deadline.wait_for(self.client.aio.files.get(name=file.name))
+        if file.state == FileState.FAILED:
+            raise ValueError(f"Processing of uploaded file {file.name} failed: {file.error}")
+        expires_at = file.expiration_time.timestamp() if file.expiration_time else None
+        return UploadedFile(uri=file.uri, name=file.name, expires_at=expires_at)
+
+    async def submit_batch(self, requests: List[BatchRequest]) -> BatchJob:
+        """Submit requests through Gemini batch mode, one batch job per model"""
+        job = BatchJob(id=f"gemini-{uuid.uuid4()}", provider=self.name, requests=requests, handle={})
+
+        requests_by_model = {}
+        for request in requests:
+            requests_by_model.setdefault(request.model_id, []).append(request)
+
+        for model_id, model_requests in requests_by_model.items():
+            inlined_requests = []
+            for request in model_requests:
+                # Resolve the system prompt the same way create_chat_session does, without touching the conversation
+                conversation = request.conversation_manager.fork()
+                if request.system_prompt and conversation.system_prompt_setup != request.system_prompt:
+                    conversation.system_prompt_setup = request.system_prompt
+                    conversation.system_prompt = request.system_prompt
+
+                # Batch results are text only, so no function calling tools
+                contents = self._translate_history(conversation.get_llm_history())
+                contents += self._translate_history([{"role": "user", "parts": request.parts}])
+                inlined_requests.append({
+                    "contents": contents,
+                    "config": self._build_generation_config(conversation.get_full_system_prompt(), include_tools=False)
+                })
+
+            batch = await self.client.aio.batches.create(
+                model=model_id,
+                src=inlined_requests,
+                config={"display_name": job.id}
+            )
+            job.handle[batch.name] = [r.custom_id for r in model_requests]
+        return job
+
+    async def poll_batch(self, job: BatchJob) -> str:
+        states = []
+        for name in job.handle:
+            batch = await self.client.aio.batches.get(name=name)
+            states.append(getattr(batch.state, "name", str(batch.state)))
+        if any(s in ("JOB_STATE_PENDING", "JOB_STATE_QUEUED", "JOB_STATE_RUNNING", "JOB_STATE_CANCELLING") for s in states):
+            job.status = "running"
+        elif all(s == "JOB_STATE_SUCCEEDED" for s in states):
+            job.status = "succeeded"
+        elif any(s == "JOB_STATE_CANCELLED" for s in states):
+            job.status = "cancelled"
+        else:
+            job.status = "failed"
+        return job.status
+
+    async def collect_batch(self, job: BatchJob) -> Dict[str, BatchResult]:
+        results = {}
+        for name, custom_ids in job.handle.items():
+            batch = await self.client.aio.batches.get(name=name)
+            responses = (batch.dest.inlined_responses if batch.dest else None) or []
+            # Inlined responses come back in request order
+            for custom_id, inlined in zip(custom_ids, responses):
+                if inlined.error or not inlined.response:
+                    results[custom_id] = BatchResult(custom_id=custom_id, error=str(inlined.error or "No response"))
+                else:
+                    usage = inlined.response.usage_metadata
+                    results[custom_id] = BatchResult(
+                        custom_id=custom_id,
+                        text=inlined.response.text or "",
+                        token_count=usage.total_token_count if usage else None
+                    )
+        for request in job.requests:
+            if request.custom_id not in results:
+                results[request.custom_id] = BatchResult(custom_id=request.custom_id, error="No result returned")
+        return results
 
 class SimpleChatSession:
     """Basic chat session that updates the conversation manager"""
     
-    def __init__(self, chat_session, conversation_manager, do_debug: bool):
+    def __init__(self, chat_session, conversation_manager, do_debug: bool, generation_config: Optional[Dict[str, Any]] = None,
+                 response_cache: Optional[ResponseCache] = None, client=None, model_id: Optional[str] = None,
+                 history: Optional[List[Content]] = None, provider: Optional[GoogleAIProvider] = None,
+                 llm_history: Optional[List[Dict[str, Any]]] = None):
         self.chat_session = chat_session
         self.conversation_manager = conversation_manager
         self.do_debug = do_debug
+        self.generation_config = generation_config
+        self.response_cache = response_cache
+        self.client = client
+        self.model_id = model_id
+        # Contents sent so far; with a cache the SDK chat is bypassed and this is the history
+        self.contents = list(history or [])
+        # The provider uploads large attachments; llm_history is what the history was translated from
+        self.provider = provider
+        self.llm_history = llm_history or []
+
+    async def _upload_attachments(self, in_parts, deadline: Deadline) -> None:
+        """Upload large attachments before sending: new ones, and any in the history whose upload expired"""
+        if self.provider is None:
+            return
+        try:
+            if await self.provider.upload_attachments(history_parts(self.llm_history), deadline):
+                # Re-translate so the history refers to the new uploads
+                history = self.provider._translate_history(self.llm_history)
+                self.contents = list(history)
+                self.chat_session = self.client.aio.chats.create(model=self.model_id, config=self.generation_config,
+                                                                  history=history)
+            await self.provider.upload_attachments(in_parts, deadline)
+        except Exception as e:
+            # Inline data still works up to the request size limit (if the deadline passed, sending raises)
+            print(f">> Attachment upload failed, sending inline: {type(e).__name__}: {e}")
   
     def get_parts(self, in_parts):
+        provider_name = self.provider.name if self.provider else ""
         parts = []
         for part in in_parts:
             if isinstance(part, str):
                 parts.append(Part.from_text(text=part))
             elif isinstance(part, dict) and "mime_type" in part and "data" in part:
-                parts.append(Part.from_bytes(data=part["data"], mime_type=part["mime_type"]))
+                parts.append(attachment_part(part, provider_name))
             else:
                 raise ValueError('Unsupported input part type!')
         return parts
 
-    async def send_message_async(self, in_parts):
+    async def _send(self, message, deadline: Deadline):
+        """Send to the SDK chat session, bounded by the deadline both client- and transport-side"""
+        config = None
+        timeout_ms = deadline.remaining_ms()
+        if timeout_ms is not None and self.generation_config is not None:
+            # Passing a config replaces the chat's one, so extend the original
+            config = dict(self.generation_config, http_options={"timeout": timeout_ms})
+        if self.response_cache is None:
+            return await deadline.wait_for(self.chat_session.send_message(message, config=config))
+        return await self._send_cached(message, config, deadline)
+
+    async def _send_cached(self, message, config, deadline: Deadline):
+        """Send through the response cache, keeping the history like the SDK chat would"""
+        parts = message if isinstance(message, list) else [message]
+        contents = self.contents + [Content(role="user", parts=parts)]
+        key = request_fingerprint(model=self.model_id, config=self.generation_config, contents=contents)
+        response = await self.response_cache.fetch(
+            key,
+            lambda: deadline.wait_for(self.client.aio.models.generate_content(
+                model=self.model_id,
+                contents=contents,
+                config=config or self.generation_config
+            )),
+            encode=lambda r: r.model_dump(mode="json", exclude_none=True),
+            decode=GenerateContentResponse.model_validate,
+            deadline=deadline
+        )
+
+        # Function call follow-ups are fingerprinted on top of this exchange
+        self.contents = contents
+        if response.candidates and response.candidates[0].content:
+            self.contents.append(response.candidates[0].content)
+        return response
+
+    async def send_message_async(self, in_parts, deadline: Deadline = UNBOUNDED):
         """Send a message and update the conversation manager"""
         # Track the initial history length to identify new items
         initial_history_length = len(self.conversation_manager.history)
@@ -342,8 +503,9 @@ class SimpleChatSession:
         sequence = self.conversation_manager.seq_user + 1
         
         # Send to LLM
+        await self._upload_attachments(in_parts, deadline)
         out_parts = self.get_parts(in_parts)
-        response = await self.chat_session.send_message(out_parts)
+        response = await self._send(out_parts, deadline)
         if self.do_debug:
             ic("LLM response:", response)
         
@@ -361,7 +523,7 @@ class SimpleChatSession:
 class FunctionCallingChatSession(SimpleChatSession):
     """Chat session that handles function calling and updates the conversation manager"""
     
-    async def send_message_async(self, in_parts):
+    async def send_message_async(self, in_parts, deadline: Deadline = UNBOUNDED):
         """Send a message, handle any function calls, and update the conversation manager"""
         # Track the initial history length to identify new items
         initial_history_length = len(self.conversation_manager.history)
@@ -370,8 +532,9 @@ class FunctionCallingChatSession(SimpleChatSession):
         sequence = self.conversation_manager.seq_user + 1
         
         # Send to LLM
+        await self._upload_attachments(in_parts, deadline)
         out_parts = self.get_parts(in_parts)
-        response = await self.chat_session.send_message(out_parts)
+        response = await self._send(out_parts, deadline)
         if self.do_debug:
             ic("LLM response:", response)
         
@@ -396,7 +559,7 @@ class FunctionCallingChatSession(SimpleChatSession):
                                 name=function_name,
                                 response={"content": result}
                             )
-                            response = await self.chat_session.send_message(content)
+                            response = await self._send(content, deadline)
                     elif hasattr(part, 'text') and part.text:
                         self.conversation_manager.add_model_message(part.text, sequence)
 
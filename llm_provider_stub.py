@@ -0,0 +1,115 @@
+from llm_provider import LLMProvider, ModelOption
+from knob_factory import KnobFactory
+from builtin_models import stub_models
+from request_deadline import Deadline, UNBOUNDED
+
+from typing import Dict, List, Any, Optional
+from conversation_manager import ConversationManager
+
+import asyncio
+import copy
+import random
+
+class UsageMetadataWrapper:
+    def __init__(self):
+        self.total_token_count = 0
+
+class StubProvider(LLMProvider):
+    """
+    Local stand-in provider that echoes the user message back after an injected delay.
+
+    Used to exercise latency-sensitive code paths (hedging, deadlines, fan-out, ...)
+    without network access or API keys. Enable it in the UI with LLM_STUB_PROVIDER=1.
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        super().__init__()
+        self.name = "stub"
+        self.settings = {}
+        self.rng = random.Random(seed)
+
+    def initialize(self):
+        self.settings = {
+            "latency_ms": KnobFactory.create_knob("slider",
+                name="Base Latency (ms)",
+                min_value=0,
+                max_value=10000,
+                default_value=300
+            ),
+            "jitter_ms": KnobFactory.create_knob("slider",
+                name="Latency Jitter (ms)",
+                min_value=0,
+                max_value=10000,
+                default_value=200
+            ),
+            "stall_probability": KnobFactory.create_knob("slider",
+                name="Stall Probability",
+                min_value=0.0,
+                max_value=1.0,
+                default_value=0.05
+            ),
+            "stall_ms": KnobFactory.create_knob("slider",
+                name="Stall Duration (ms)",
+                min_value=0,
+                max_value=120000,
+                default_value=60000
+            ),
+            "failure_rate": KnobFactory.create_knob("slider",
+                name="Failure Rate",
+                min_value=0.0,
+                max_value=1.0,
+                default_value=0.0
+            )
+        }
+
+        self.models = stub_models()
+
+    def get_available_models(self) -> List[ModelOption]:
+        return self.models
+
+    def get_settings(self) -> Dict[str, Any]:
+        return self.settings
+
+    def sample_delay(self, settings: Dict[str, Any]) -> float:
+        """Draw a response delay (in seconds) from a latency profile"""
+        delay_ms = settings["latency_ms"].get_value()
+        delay_ms += self.rng.uniform(0, settings["jitter_ms"].get_value())
+        if self.rng.random() < settings["stall_probability"].get_value():
+            delay_ms += settings["stall_ms"].get_value()
+        return delay_ms / 1000.0
+
+    def create_chat_session(self, model_id: str, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> Any:
+        return ChatSession(self, model_id, conversation_manager)
+
+class ChatSession:
+    def __init__(self, provider, model, conversation_manager):
+        self.provider = provider
+        self.model = model
+        # Snapshot the knobs so later changes (or a sweep) don't affect this session
+        self.settings = copy.deepcopy(provider.settings)
+        self.text = None
+        self.usage_metadata = UsageMetadataWrapper()
+        self.conversation_manager = conversation_manager
+
+    async def send_message_async(self, parts: List[Any], deadline: Deadline = UNBOUNDED):
+        # Track the initial history length to identify new items
+        initial_history_length = len(self.conversation_manager.history)
+
+        await deadline.wait_for(asyncio.sleep(self.provider.sample_delay(self.settings)))
+        if self.provider.rng.random() < self.settings["failure_rate"].get_value():
+            raise RuntimeError(f"Injected failure from {self.model}")
+
+        message = " ".join(p for p in parts if isinstance(p, str))
+        self.text = f"[{self.model}] {message}"
+        self.usage_metadata.total_token_count = len(message.split()) + len(self.text.split())
+
+        # Attach new response
+        self.conversation_manager.add_model_message(self.text, self.conversation_manager.seq_user + 1)
+
+        # Bump conversation manager's sequence number
+        self.conversation_manager.seq_user += 1
+
+        # Attach the new history items to the response
+        new_history_items = self.conversation_manager.history[initial_history_length:]
+
+        return (self, new_history_items)
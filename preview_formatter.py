@@ -0,0 +1,105 @@
+"""
+The pygments formatter of the preview's HTML, imported with pygments on
+first use (see preview_renderer.html_formatter).
+
+PreviewHtmlFormatter writes what the preview page embeds in a single pass
+over the token stream: lines are separated by <br/>, the block is wrapped
+in a code-wrapper div instead of a <pre>, and the spaces inside highlighted
+spans are made non-breaking so indentation survives while long lines can
+still wrap. Adjacent tokens of the same class are joined before anything
+else is done with them, so escaping and the whitespace rewrite run once
+per span rather than once per token. Changing its output means bumping
+preview_renderer.RENDER_VERSION, so cached renderings are not reused.
+"""
+
+from html import escape
+from typing import Dict, List
+import re
+
+from pygments.formatters import HtmlFormatter
+from pygments.token import STANDARD_TYPES
+
+DOUBLE_SPACES = re.compile(r"  +")
+
+def _alternate_spaces(match) -> str:
+    # Alternating non-breaking and normal spaces, so the line can still wrap
+    run = len(match.group(0))
+    return "&nbsp; " * (run // 2) + ("&nbsp;" if run % 2 else "")
+
+def preserve_whitespace(text: str) -> str:
+    """Escaped span text with leading and repeated spaces made non-breaking"""
+    if text[:1] in (" ", "\t"):
+        indent = len(text) - len(text.lstrip(" \t"))
+        text = "&nbsp;" * indent + text[indent:]
+    if "  " in text:
+        text = DOUBLE_SPACES.sub(_alternate_spaces, text)
+    return text
+
+class PreviewHtmlFormatter(HtmlFormatter):
+    """
+    HtmlFormatter for the preview page (CSS classes, no line numbers or
+    other wrapping options); get_style_defs() gives its CSS as usual.
+    """
+
+    line_separator = "<br/>"
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        # Token type -> classes of its spans, "" for unstyled text
+        self._classes: Dict[object, str] = {}
+
+    def _css_classes(self, ttype) -> str:
+        """Like HtmlFormatter: the token type's short class, then those of its parents up to a standard type"""
+        classes, current = [], ttype
+        while True:
+            name, suffix, parent = STANDARD_TYPES.get(current), "", current
+            while name is None:
+                suffix = "-" + parent[-1] + suffix
+                parent = parent.parent
+                name = STANDARD_TYPES.get(parent)
+            if name + suffix:
+                classes.append(self.classprefix + name + suffix)
+            if current in STANDARD_TYPES:
+                break
+            current = current.parent
+        css_classes = " ".join(reversed(classes))
+        self._classes[ttype] = css_classes
+        return css_classes
+
+    def format_unencoded(self, tokensource, outfile):
+        write = outfile.write
+        line_separator = self.line_separator
+
+        def write_run(css_classes: str, text: str) -> None:
+            text = escape(text, quote=False)
+            if not css_classes:
+                write(text.replace("\n", line_separator))
+            elif "\n" not in text:
+                write(f'<span class="{css_classes}">{preserve_whitespace(text)}</span>')
+            else:
+                # Spans are closed at the end of each line
+                write(line_separator.join(f'<span class="{css_classes}">{preserve_whitespace(line)}</span>' if line else ""
+                                          for line in text.split("\n")))
+
+        # The empty span keeps leading empty lines from being dropped by HTML parsers
+        write(f'<div class="{self.cssclass}"><div class="code-wrapper"><span></span>')
+
+        classes = self._classes
+        run: List[str] = []
+        run_classes = ""
+        for ttype, value in tokensource:
+            css_classes = classes.get(ttype)
+            if css_classes is None:
+                css_classes = self._css_classes(ttype)
+            if css_classes != run_classes:
+                if run:
+                    write_run(run_classes, "".join(run))
+                    run.clear()
+                run_classes = css_classes
+            run.append(value)
+        if run:
+            text = "".join(run)
+            write_run(run_classes, text)
+            if not text.endswith("\n"):
+                write(line_separator)
+        write("</div></div>\n")
@@ -0,0 +1,575 @@
+"""
+Rendering of the preview pane, kept free of tkinter so it can be cached,
+benchmarked and run outside the Tk thread.
+
+preview_source() turns a history item into what the preview shows;
+render_preview() turns that into plain text or, for the Syntax Highlight
+viewer, a complete HTML document (pygments, loaded on first use). Rendering
+reruns fix_content and pygments, so RenderCache keeps recent results in
+memory, bounded in bytes, and optionally on disk so a reopened session
+renders instantly. RenderPool runs the rendering in worker threads, and big
+code blocks in worker processes, since pygments is CPU bound and holds the GIL.
+Large previews are rendered in chunks, so the first screenful shows at once
+and the rest is appended as it is ready.
+
+Settings (environment):
+  LLM_PREVIEW_CACHE_MB            memory bound of the render cache (default 32, 0 disables it)
+  LLM_PREVIEW_CACHE_DIR           directory of the disk tier (default: none)
+  LLM_PREVIEW_CACHE_DISK_MB       size bound of the disk tier (default 256)
+  LLM_RENDER_THREADS              render worker threads (default 2)
+  LLM_RENDER_PROCESSES            render worker processes (default: CPUs - 1, up to 4; 0: threads only)
+  LLM_RENDER_PROCESS_MIN_CHARS    code blocks from this size on are highlighted in a process (default 20000)
+  LLM_PREVIEW_FIRST_CHUNK_CHARS   size of the first, immediately shown chunk of a preview (default 8000)
+  LLM_PREVIEW_CHUNK_CHARS         size of the chunks appended after it (default 32000)
+  LLM_PREVIEW_MAX_CHARS           characters shown unless Render Full is checked (default 256000, 0: all)
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import re
+import sys
+import threading
+
+from artifact_diff import ArtifactEdit, DiffLine, artifact_diffs, diff_text
+from code_lexers import lexer_for
+from content_utils import fix_content, looks_like_json, looks_like_xml
+from response_cache import DiskTier
+
+@dataclass(frozen=True)
+class PreviewSource:
+    """
+    What the preview shows for one row: text segments, each with whether
+    fix_content applies to it, the row's metadata and, for artifact edits,
+    the versions to show the diff of after the segments
+    """
+    segments: Tuple[Tuple[str, bool], ...]
+    role: str
+    sequence: Any
+    edit: Optional[ArtifactEdit] = None
+
+@dataclass(frozen=True)
+class RenderSettings:
+    viewer_type: str  # "text" or "html"
+    font_size: int
+    clean_xml: bool
+    style: str = "monokai"
+
+def wrap_content_in_markdown_block(content):
+    # Skip if content is None or empty
+    if not content:
+        return content
+
+    # Apply appropriate formatting
+    if looks_like_xml(content):
+        return f"```xml\n{content}\n```"
+    elif looks_like_json(content):
+        return f"```json\n{content}\n```"
+    # Return as is if no specific format detected
+    return content
+
+def _edit_artifact_source(args: Dict[str, Any], role: str, sequence: Any, conversation_manager) -> Optional[PreviewSource]:
+    """Diff view of an artifact edit; None if either version is unknown"""
+    artifact_id = args.get("id", "")
+
+    # Get artifact content before and after this edit
+    before_content = conversation_manager.get_artifact_before_sequence(artifact_id, sequence)
+    after_content = conversation_manager.get_artifact_at_sequence(artifact_id, sequence)
+    if not (before_content and after_content):
+        return None
+
+    # Handle both new and legacy format
+    global_subst = args.get("global_substitutions", [])
+    single_subst = list(args.get("single_substitutions", []))
+
+    # Handle legacy format
+    if "from_string" in args and "to_string" in args:
+        single_subst.append({
+            "from": args["from_string"],
+            "to": args["to_string"]
+        })
+
+    # Format substitutions for display
+    subst_display = ""
+    if global_subst:
+        subst_display += "Global substitutions:\n"
+        for i, s in enumerate(global_subst, 1):
+            subst_display += f"  {i}. '{s.get('from_str', '')}' → '{s.get('to_str', '')}'\n"
+
+    if single_subst:
+        if subst_display:
+            subst_display += "\n"
+        subst_display += "Single-occurrence substitutions:\n"
+        for i, s in enumerate(single_subst, 1):
+            subst_display += f"  {i}. '{s.get('from_str', '')}' → '{s.get('to_str', '')}'\n"
+
+    rule = "-" * 40
+    header = f"ARTIFACT EDIT: {artifact_id}\n{subst_display}\n{rule}\nCHANGES:\n{rule}\n"
+    return PreviewSource(((header, False),), role, sequence,
+                         ArtifactEdit(artifact_id, sequence, before_content, after_content))
+
+def preview_source(message: Dict[str, Any], conversation_manager) -> PreviewSource:
+    """What the preview shows for a history item"""
+    sequence = message.get("sequence", "N/A")
+    role = message["role"]
+
+    # Handle function calls (especially artifact-related ones)
+    if role == "function" and "function_call" in message:
+        function_name = message["function_call"].get("name", "")
+        args = message["function_call"].get("args", {})
+
+        # FIXME: Wrap in markdown ```xml tags for XML
+        if function_name == "create_artifact":
+            # For create_artifact, show the initial content
+            content = wrap_content_in_markdown_block(args.get("contents", ""))
+            return PreviewSource(((content, True),), role, sequence)
+
+        if function_name == "edit_artifact":
+            source = _edit_artifact_source(args, role, sequence, conversation_manager)
+            if source:
+                return source
+
+        # Default function call display
+        content = f"Function: {function_name}\n"
+        content += f"Arguments: {json.dumps(args, indent=2)}"
+        return PreviewSource(((content, False),), role, sequence)
+
+    # Handle normal message content
+    if message["parts"]:
+        content = message["parts"][0]
+        if isinstance(content, dict):
+            # An attachment
+            return PreviewSource(((f"[{content.get('mime_type')}, {len(content.get('data', b''))} bytes]", False),), role, sequence)
+        return PreviewSource(((content, True),), role, sequence)
+    # Empty parts array
+    return PreviewSource((("(No content)", False),), role, sequence)
+
+def queued_source(message: str) -> PreviewSource:
+    """A prompt still waiting in the send queue"""
+    return PreviewSource(((message, False),), "queued", "N/A")
+
+# Part of every render key: bump it when the rendered HTML changes, so cached renderings are not reused
+RENDER_VERSION = 2
+
+def render_key(source: PreviewSource, settings: RenderSettings) -> str:
+    """Hash of everything a rendering depends on"""
+    canonical = json.dumps([RENDER_VERSION, source.segments, source.role, str(source.sequence), asdict(settings),
+                            source.edit.digest() if source.edit else None], separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def render_text(source: PreviewSource, clean_xml: bool) -> str:
+    """The displayed text, with the rendering fix-ups applied, followed by the edit's diff if any"""
+    text = "".join(fix_content(text, clean_xml) if fix else text for text, fix in source.segments)
+    if source.edit:
+        text += diff_text(artifact_diffs.get(source.edit, clean_xml))
+    return text
+
+_formatters: Dict[str, Tuple[Any, str]] = {}
+
+def html_formatter(style: str) -> Tuple[Any, str]:
+    """Preview HTML formatter (see preview_formatter) and its CSS for a style, created once"""
+    if style not in _formatters:
+        from preview_formatter import PreviewHtmlFormatter
+        formatter = PreviewHtmlFormatter(style=style)
+        _formatters[style] = (formatter, formatter.get_style_defs('.highlight'))
+    return _formatters[style]
+
+# Fenced code blocks: ```language ... ```
+CODE_BLOCK = re.compile(r'(```(\w*)\n)(.*?)(\n```)', re.DOTALL)
+
+def split_blocks(content: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    Split markdown into independently highlighted blocks of (text, lexer name);
+    a lexer name of None means the lexer is guessed from the text
+    """
+    blocks: List[Tuple[str, Optional[str]]] = []
+    last_end = 0
+    for match in CODE_BLOCK.finditer(content):
+        start, end = match.span()
+
+        # Text before this code block uses the markdown lexer
+        if start > last_end:
+            blocks.append((content[last_end:start], "markdown"))
+
+        # Opening and closing backticks are markdown, the code uses its language
+        lang = match.group(2).strip()
+        if lang and lang.lower() not in ('text', 'plain', 'markdown', 'md'):
+            code_lexer = lang.lower()
+        else:
+            # Detect or guess if no useful language is specified (see code_lexers)
+            code_lexer = None
+        blocks.append((match.group(1), "markdown"))
+        blocks.append((match.group(3), code_lexer))
+        blocks.append((match.group(4), "markdown"))
+        last_end = end
+
+    # Add any remaining text after the last code block; without code blocks, the whole text is markdown
+    if last_end < len(content) or not blocks:
+        blocks.append((content[last_end:], "markdown"))
+    return blocks
+
+def split_lines(text: str, first_chars: int, chunk_chars: int) -> List[str]:
+    """Text in pieces of up to first_chars, then chunk_chars characters, cut after a newline where possible"""
+    pieces: List[str] = []
+    start, limit = 0, first_chars
+    while len(text) - start > limit:
+        cut = text.rfind("\n", start, start + limit) + 1
+        if cut <= start:
+            # One very long line
+            cut = start + limit
+        pieces.append(text[start:cut])
+        start, limit = cut, chunk_chars
+    pieces.append(text[start:])
+    return pieces
+
+def chunk_blocks(content: str, first_chars: int, chunk_chars: int) -> List[List[Tuple[str, Optional[str]]]]:
+    """
+    split_blocks() grouped into chunks of about first_chars, then chunk_chars
+    characters, for progressive display. Blocks stay whole where they fit in
+    a chunk; bigger ones are cut between lines and keep their language.
+    Content that fits in the first chunk gives just [split_blocks(content)].
+    """
+    chunks: List[List[Tuple[str, Optional[str]]]] = [[]]
+    budget = first_chars
+    for text, lexer_name in split_blocks(content):
+        while len(text) > budget:
+            cut = text.rfind("\n", 0, budget) + 1
+            if chunks[-1] and (cut == 0 or len(text) <= chunk_chars):
+                # Start the block in a chunk of its own
+                chunks.append([])
+                budget = chunk_chars
+                continue
+            if cut == 0:
+                cut = budget
+            if lexer_name is None:
+                # Detect once, so all pieces use the same lexer
+                lexer = lexer_for(text, None)
+                lexer_name = lexer.aliases[0] if lexer.aliases else "text"
+            chunks[-1].append((text[:cut], lexer_name))
+            text = text[cut:]
+            chunks.append([])
+            budget = chunk_chars
+        chunks[-1].append((text, lexer_name))
+        budget -= len(text)
+    return chunks
+
+def highlight_block(text: str, lexer_name: Optional[str], style: str = "monokai") -> str:
+    """One block of split_blocks() as highlighted HTML, ready to be placed in the preview page"""
+    import pygments
+
+    return pygments.highlight(text, lexer_for(text, lexer_name), html_formatter(style)[0])
+
+def highlight(content: str, style: str = "monokai") -> str:
+    """Markdown with fenced code blocks as highlighted HTML"""
+    return "".join(highlight_block(text, lexer_name, style) for text, lexer_name in split_blocks(content))
+
+DIFF_PREFIXES = {"context": "&nbsp; ", "removed": "-&nbsp;", "added": "+&nbsp;"}
+
+def diff_html(lines: List[DiffLine]) -> str:
+    """A diff (see artifact_diff) as HTML for the preview page: changed lines and characters on colored backgrounds"""
+    from preview_formatter import preserve_whitespace
+
+    def escaped(text: str) -> str:
+        return preserve_whitespace(html.escape(text, quote=False))
+
+    if not lines:
+        return '<div class="diff"><div class="diff-skipped">(no changed lines)</div></div>'
+    parts = ['<div class="diff">']
+    for line in lines:
+        if line.kind == "skipped":
+            parts.append(f'<div class="diff-skipped">@@ {line.skipped} unchanged lines @@</div>')
+            continue
+        pieces, position = [], 0
+        for start, end in line.changes:
+            pieces.append(escaped(line.text[position:start]))
+            pieces.append(f'<span class="diff-change">{escaped(line.text[start:end])}</span>')
+            position = end
+        pieces.append(escaped(line.text[position:]))
+        parts.append(f'<div class="diff-{line.kind}">{DIFF_PREFIXES[line.kind]}{"".join(pieces)}</div>')
+    parts.append("</div>")
+    return "".join(parts)
+
+def html_document(highlighted_code: str, role: str, sequence: Any, font_size: int, style: str = "monokai") -> str:
+    """Wrap highlighted HTML (see highlight()) into the preview page"""
+    css = html_formatter(style)[1] + f"""
+        body {{
+            font-size: {font_size}px;
+        }}
+    """
+
+    return f"""
+    <html>
+    <head>
+        <style>
+            body {{
+                background-color: #282828;
+                color: #f8f8f2;
+                font-family: 'IBM Plex Mono', 'Consolas', 'Monaco', monospace;
+                padding: 2px;
+            }}
+            .metadata {{
+                color: #66d9ef;
+                margin-bottom: 10px;
+            }}
+            .code-wrapper {{
+                font-family: monospace;
+                margin: 0;
+                padding: 0;
+            }}
+            .diff {{
+                font-family: monospace;
+            }}
+            .diff-removed {{
+                background-color: #4a2020;
+            }}
+            .diff-added {{
+                background-color: #203f20;
+            }}
+            .diff-removed .diff-change {{
+                background-color: #8c2f2f;
+            }}
+            .diff-added .diff-change {{
+                background-color: #2f7a2f;
+            }}
+            .diff-skipped {{
+                color: #75715e;
+            }}
+            {css}
+        </style>
+    </head>
+    <body>
+        <div class="metadata">
+            Sequence: {sequence}<br>
+            Role: {role}
+        </div>
+        {highlighted_code}
+    </body>
+    </html>
+    """
+
+def render_preview(source: PreviewSource, settings: RenderSettings) -> str:
+    """The preview as plain text ("text" viewer) or as an HTML document ("html" viewer)"""
+    if settings.viewer_type == "text":
+        return render_text(source, settings.clean_xml)
+    body = highlight(render_text(replace(source, edit=None), settings.clean_xml), settings.style)
+    if source.edit:
+        body += diff_html(artifact_diffs.get(source.edit, settings.clean_xml))
+    return html_document(body, source.role, source.sequence, settings.font_size, settings.style)
+
+class RenderCache:
+    """
+    Rendered previews by render_key(), least recently used evicted first once
+    the memory tier holds more than max_bytes. With a disk tier, misses are
+    looked up there before rendering, and renderings are written through.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, disk: Optional[DiskTier] = None):
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+        # Renders may run off the Tk thread
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RenderCache":
+        disk = None
+        directory = os.environ.get("LLM_PREVIEW_CACHE_DIR")
+        if directory:
+            disk = DiskTier(directory, int(float(os.environ.get("LLM_PREVIEW_CACHE_DISK_MB", "256")) * 1024 * 1024))
+        return cls(int(float(os.environ.get("LLM_PREVIEW_CACHE_MB", "32")) * 1024 * 1024), disk)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+        if self.disk:
+            value = self.disk.get(key)
+            if value is not None:
+                self._put_memory(key, value)
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                return value
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def _put_memory(self, key: str, value: str) -> None:
+        size = sys.getsizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self.entries:
+                self.total_bytes -= sys.getsizeof(self.entries.pop(key))
+            self.entries[key] = value
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= sys.getsizeof(evicted)
+
+    def put(self, key: str, value: str) -> None:
+        self._put_memory(key, value)
+        if self.disk:
+            self.disk.put(key, value)
+
+    def render(self, source: PreviewSource, settings: RenderSettings) -> str:
+        """The cached rendering, or render_preview() and remember it"""
+        key = render_key(source, settings)
+        value = self.get(key)
+        if value is None:
+            value = render_preview(source, settings)
+            self.put(key, value)
+        return value
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        return (self.stats["hits"] + self.stats["disk_hits"]) / lookups if lookups else 0.0
+
+    def describe(self) -> str:
+        return (f"Preview cache: {self.hit_rate():.0%} hits ({len(self.entries)} entries, "
+                f"{self.total_bytes / (1024 * 1024):.1f} MB)")
+
+class RenderPool:
+    """
+    Renders previews off the Tk thread, through a RenderCache.
+
+    The blocks of a document are highlighted concurrently: small ones in a
+    thread pool, big ones in a process pool (started on first use). Cancelling
+    the task consuming render_chunks() cancels its queued blocks, so a render that was
+    superseded by a newer selection does not hold up the next one.
+    """
+
+    def __init__(self, cache: RenderCache, threads: int = 2, processes: int = 0, process_min_chars: int = 20000,
+                 first_chunk_chars: int = 8000, chunk_chars: int = 32000, max_chars: int = 256000):
+        self.cache = cache
+        self.threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="render")
+        self.process_count = processes
+        self.process_min_chars = process_min_chars
+        self._processes: Optional[ProcessPoolExecutor] = None
+        # Progressive display of large previews, see render_chunks()
+        self.first_chunk_chars = max(1, first_chunk_chars)
+        self.chunk_chars = max(1, chunk_chars)
+        self.max_chars = max_chars
+
+    @classmethod
+    def from_env(cls, cache: RenderCache) -> "RenderPool":
+        return cls(cache, int(os.environ.get("LLM_RENDER_THREADS", "2")),
+                   int(os.environ.get("LLM_RENDER_PROCESSES", str(min(4, (os.cpu_count() or 1) - 1)))),
+                   int(os.environ.get("LLM_RENDER_PROCESS_MIN_CHARS", "20000")),
+                   int(os.environ.get("LLM_PREVIEW_FIRST_CHUNK_CHARS", "8000")),
+                   int(os.environ.get("LLM_PREVIEW_CHUNK_CHARS", "32000")),
+                   int(os.environ.get("LLM_PREVIEW_MAX_CHARS", "256000")))
+
+    def _executor(self, size: int) -> Executor:
+        if self.process_count <= 0 or size < self.process_min_chars:
+            return self.threads
+        if self._processes is None:
+            # Not forked: the parent holds Tk and event loop state
+            self._processes = ProcessPoolExecutor(self.process_count, mp_context=multiprocessing.get_context("spawn"))
+        return self._processes
+
+    async def _run(self, size: int, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor(size), function, *args)
+
+    async def _render_chunk(self, key: str, blocks: List[Tuple[str, Optional[str]]], first: bool,
+                            source: PreviewSource, settings: RenderSettings) -> str:
+        rendered = self.cache.get(key)
+        if rendered is None:
+            highlighted = await asyncio.gather(*(self._run(len(text), highlight_block, text, lexer_name, settings.style)
+                                                 for text, lexer_name in blocks))
+            rendered = "".join(highlighted)
+            if first:
+                rendered = html_document(rendered, source.role, source.sequence, settings.font_size, settings.style)
+            await self._run(0, self.cache.put, key, rendered)
+        return rendered
+
+    async def _chunk_blocks(self, key: str, source: PreviewSource,
+                            settings: RenderSettings) -> List[List[Tuple[str, Optional[str]]]]:
+        """chunk_blocks() of the rendered text, cached so showing an item again skips the text clean-up"""
+        chunks_key = f"{key}:{self.first_chunk_chars}:{self.chunk_chars}:chunks"
+        cached = self.cache.get(chunks_key)
+        if cached is not None:
+            return [[(text, lexer_name) for text, lexer_name in blocks] for blocks in json.loads(cached)]
+        content = await self._run(0, render_text, source, settings.clean_xml)
+        chunks = await self._run(0, chunk_blocks, content, self.first_chunk_chars, self.chunk_chars)
+        await self._run(0, self.cache.put, chunks_key, json.dumps(chunks, separators=(",", ":")))
+        return chunks
+
+    async def render_chunks(self, source: PreviewSource, settings: RenderSettings, full: bool = False) -> AsyncIterator[str]:
+        """
+        The preview in chunks for progressive display: the first is the text
+        or a complete HTML document of about a screenful, the following ones
+        are appended to it. The next chunk is rendered while the current one
+        is shown. Unless full, stops after max_chars with a note of what was
+        left out. Close the iterator when not consuming it to the end.
+        """
+        key = render_key(source, settings)
+
+        def stop(shown: int) -> bool:
+            return not full and self.max_chars > 0 and shown >= self.max_chars
+
+        def notice(hidden: int) -> str:
+            text = f"{hidden} more characters not shown; check Render Full to show them"
+            return f"\n\n[{text}]\n" if settings.viewer_type == "text" else f'<div class="metadata">{text}</div>'
+
+        if settings.viewer_type == "text":
+            content = self.cache.get(key)
+            if content is None:
+                content = await self._run(0, render_text, source, settings.clean_xml)
+                await self._run(0, self.cache.put, key, content)
+            shown = 0
+            for piece in split_lines(content, self.first_chunk_chars, self.chunk_chars):
+                if shown and stop(shown):
+                    yield notice(len(content) - shown)
+                    return
+                shown += len(piece)
+                yield piece
+            return
+
+        if source.edit:
+            # Diffs are collapsed to the changes, so they are shown in one piece
+            rendered = self.cache.get(key)
+            if rendered is None:
+                rendered = await self._run(0, render_preview, source, settings)
+                await self._run(0, self.cache.put, key, rendered)
+            yield rendered
+            return
+
+        chunks = await self._chunk_blocks(key, source, settings)
+        total = sum(len(text) for blocks in chunks for text, _ in blocks)
+
+        def render(index: int) -> "asyncio.Future[str]":
+            # Chunks are cached on their own, keyed by how the content was cut
+            chunk_key = f"{key}:{self.first_chunk_chars}:{self.chunk_chars}:{index}"
+            return asyncio.ensure_future(self._render_chunk(chunk_key, chunks[index], index == 0, source, settings))
+
+        shown = 0
+        pending = render(0)
+        try:
+            for index, blocks in enumerate(chunks):
+                if index and stop(shown):
+                    yield notice(total - shown)
+                    return
+                rendered = await pending
+                shown += sum(len(text) for text, _ in blocks)
+                if index + 1 < len(chunks) and not stop(shown):
+                    pending = render(index + 1)
+                yield rendered
+        finally:
+            pending.cancel()
+
+    def shutdown(self) -> None:
+        self.threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes:
+            self._processes.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,128 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+import importlib
+import importlib.metadata
+import json
+import os
+
+from llm_provider import LLMProvider, ModelOption
+
+@dataclass
+class ProviderSpec:
+    """
+    Everything needed to list a provider without importing it.
+
+    factory is "module:ClassName"; the module (and with it the provider's SDK)
+    is only imported when the provider is first used, and constructed with
+    options as keyword arguments.
+    """
+    name: str
+    factory: str
+    models: List[ModelOption]
+    required_env: List[str] = field(default_factory=list)
+    options: Dict[str, Any] = field(default_factory=dict)
+
+    def missing_env(self) -> List[str]:
+        return [var for var in self.required_env if var not in os.environ]
+
+class ProviderRegistry:
+    """Creates and initializes providers on first use"""
+
+    def __init__(self, specs: List[ProviderSpec], on_create: Optional[Callable[[LLMProvider], None]] = None):
+        self.specs: Dict[str, ProviderSpec] = {spec.name: spec for spec in specs}
+        self.on_create = on_create or (lambda provider: None)
+        self.providers: Dict[str, LLMProvider] = {}
+
+    def available(self) -> Dict[str, ProviderSpec]:
+        """Specs whose required environment variables are all set"""
+        return {name: spec for name, spec in self.specs.items() if not spec.missing_env()}
+
+    def models(self, name: str) -> List[ModelOption]:
+        """The provider's models: its own list once created, otherwise the spec's"""
+        if name in self.providers:
+            return self.providers[name].get_available_models()
+        return self.specs[name].models
+
+    def get(self, name: str) -> LLMProvider:
+        if name in self.providers:
+            return self.providers[name]
+        if name not in self.specs:
+            raise ValueError(f"Unknown provider: {name}")
+        spec = self.specs[name]
+        missing = spec.missing_env()
+        if missing:
+            raise ValueError(f"Provider {name} needs environment variable(s): {', '.join(missing)}")
+
+        module_name, class_name = spec.factory.split(":", 1)
+        print(f">> Loading provider {name} ({spec.factory})")
+        provider = getattr(importlib.import_module(module_name), class_name)(**spec.options)
+        provider.initialize()
+        # The spec name is what targets refer to; providers may leave their models to the spec
+        provider.name = spec.name
+        provider.models = provider.models or list(spec.models)
+        self.on_create(provider)
+        self.providers[name] = provider
+        return provider
+
+ENTRY_POINT_GROUP = "llm_tkui.providers"
+
+def spec_from_dict(data: Dict[str, Any]) -> ProviderSpec:
+    """Build a spec from its config file form"""
+    for key in ("name", "factory"):
+        if key not in data:
+            raise ValueError(f"Provider entry is missing '{key}': {data}")
+    return ProviderSpec(
+        name=data["name"],
+        factory=data["factory"],
+        models=[ModelOption(id=m["id"], name=m.get("name", m["id"])) for m in data.get("models", [])],
+        required_env=list(data.get("required_env", [])),
+        options=dict(data.get("options", {}))
+    )
+
+def entry_point_specs(group: str = ENTRY_POINT_GROUP) -> List[ProviderSpec]:
+    """
+    Specs published by installed packages.
+
+    An entry point in the group points to a function returning a ProviderSpec.
+    It should live in a lightweight module: loading the entry point imports that
+    module, while the provider module named in spec.factory is imported only
+    when the provider is used.
+    """
+    specs = []
+    for entry_point in importlib.metadata.entry_points(group=group):
+        try:
+            spec = entry_point.load()()
+        except Exception as e:
+            print(f">> Skipping provider plugin {entry_point.name} ({entry_point.value}): {type(e).__name__}: {e}")
+            continue
+        if not isinstance(spec, ProviderSpec):
+            print(f">> Skipping provider plugin {entry_point.name}: {entry_point.value} did not return a ProviderSpec")
+            continue
+        specs.append(spec)
+    return specs
+
+def config_file_specs(path: str) -> List[Dict[str, Any]]:
+    """Raw provider entries from a JSON config file ({"providers": [...]}), if it exists"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("providers", [])
+
+def discover_provider_specs(builtin: List[ProviderSpec], config_path: Optional[str] = None) -> List[ProviderSpec]:
+    """
+    Built-in specs, then entry point plugins, then the config file
+    (LLM_PROVIDERS_CONFIG, default providers.json). Later sources replace
+    earlier specs of the same name; a config entry with "disabled": true
+    removes a provider.
+    """
+    specs: Dict[str, ProviderSpec] = {spec.name: spec for spec in builtin}
+    for spec in entry_point_specs():
+        specs[spec.name] = spec
+    config_path = config_path or os.environ.get("LLM_PROVIDERS_CONFIG", "providers.json")
+    for entry in config_file_specs(config_path):
+        if entry.get("disabled"):
+            specs.pop(entry.get("name"), None)
+        else:
+            spec = spec_from_dict(entry)
+            specs[spec.name] = spec
+    return list(specs.values())
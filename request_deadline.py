@@ -0,0 +1,43 @@
+from typing import Any, Awaitable, Optional
+import asyncio
+import time
+
+class Deadline:
+    """
+    Absolute point in time by which a request must have completed.
+
+    A deadline is created once per user turn and handed down through the chat
+    session wrappers, so that every SDK call and follow-up request made for that
+    turn shares the same budget. A deadline without a timeout never expires.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout if timeout else None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None for an unbounded deadline"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self) -> None:
+        """Raise asyncio.TimeoutError if the deadline has passed"""
+        if self.expired():
+            raise asyncio.TimeoutError(f"Request deadline of {self.timeout:.0f}s exceeded")
+
+    async def wait_for(self, awaitable: Awaitable[Any]) -> Any:
+        """Await something, cancelling it if the deadline passes first"""
+        self.check()
+        return await asyncio.wait_for(awaitable, self.remaining())
+
+    def remaining_ms(self) -> Optional[int]:
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        return max(1, int(remaining * 1000))
+
+UNBOUNDED = Deadline(None)
@@ -0,0 +1,194 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import deque
+import asyncio
+import math
+import time
+
+from request_deadline import Deadline, UNBOUNDED
+
+@dataclass
+class HedgePolicy:
+    """Per-model hedging policy, attached to a ModelOption"""
+    # Seconds to wait before starting a hedge while there are too few latency samples
+    hedge_delay: float = 30.0
+    # Models to hedge to, as "provider_name:model_id"; empty means duplicate the same model
+    fallback_models: List[str] = field(default_factory=list)
+    # Total number of requests (primary included) that may be in flight for one turn
+    max_attempts: int = 2
+    # Use the observed p95 latency of the primary model as the hedge delay once known
+    use_observed_p95: bool = True
+    min_samples: int = 10
+    min_delay: float = 2.0
+    # Circuit breaker: consecutive failures before a model is skipped, and for how long
+    failure_threshold: int = 3
+    reset_timeout: float = 120.0
+
+class LatencyTracker:
+    """Keeps a sliding window of successful request latencies for one model"""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, latency: float) -> None:
+        self.samples.append(latency)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+        return ordered[index]
+
+class CircuitBreaker:
+    """Classic closed / open / half-open breaker for a single model"""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 120.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Return True if a request may be sent to this model"""
+        return self.state != "open"
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        # A failed trial while half-open re-opens the breaker straight away
+        if self.failures >= self.failure_threshold or self.state == "half_open":
+            self.opened_at = time.monotonic()
+
+class ModelHealth:
+    """Latency trackers and circuit breakers for every model, keyed by "provider:model_id" """
+
+    def __init__(self):
+        self.latencies: Dict[str, LatencyTracker] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def latency(self, target: str) -> LatencyTracker:
+        if target not in self.latencies:
+            self.latencies[target] = LatencyTracker()
+        return self.latencies[target]
+
+    def breaker(self, target: str, policy: Optional[HedgePolicy] = None) -> CircuitBreaker:
+        if target not in self.breakers:
+            policy = policy or HedgePolicy()
+            self.breakers[target] = CircuitBreaker(policy.failure_threshold, policy.reset_timeout)
+        return self.breakers[target]
+
+    def hedge_delay(self, target: str, policy: HedgePolicy) -> float:
+        """Delay before hedging a request to target, based on its observed p95"""
+        tracker = self.latency(target)
+        if policy.use_observed_p95 and len(tracker.samples) >= policy.min_samples:
+            return max(policy.min_delay, tracker.percentile(95))
+        return policy.hedge_delay
+
+class HedgedChatSession:
+    """
+    Chat session that races the primary model against hedged requests.
+
+    Every attempt runs on its own fork of the conversation manager, so that a
+    losing request can never write into the real conversation. The first
+    attempt that succeeds is adopted and all others are cancelled.
+    """
+
+    def __init__(self, conversation_manager, targets: List[str], policy: HedgePolicy,
+                 health: ModelHealth, session_factory: Callable[[str, Any], Any]):
+        self.conversation_manager = conversation_manager
+        self.targets = targets
+        self.policy = policy
+        self.health = health
+        self.session_factory = session_factory
+        self.answered_by: Optional[str] = None
+        # Sessions are created lazily per attempt from the history as it is now,
+        # i.e. before the caller appends the pending user message
+        self.base_length = len(conversation_manager.history)
+
+    def _attempt_plan(self) -> List[str]:
+        primary = self.targets[0]
+        fallbacks = self.targets[1:] or [primary]
+        plan = [primary]
+        while len(plan) < self.policy.max_attempts:
+            plan.append(fallbacks[(len(plan) - 1) % len(fallbacks)])
+        allowed = [t for t in plan if self.health.breaker(t, self.policy).allow()]
+        if not allowed:
+            raise RuntimeError(f"All models are circuit-broken: {', '.join(sorted(set(plan)))}")
+        return allowed
+
+    def _start_attempt(self, target: str, pending: List[Dict[str, Any]], in_parts, deadline: Deadline) -> Tuple[asyncio.Task, Any]:
+        fork = self.conversation_manager.fork()
+        del fork.history[self.base_length:]
+        session = self.session_factory(target, fork)
+        fork.history.extend(pending)
+        task = asyncio.ensure_future(session.send_message_async(list(in_parts), deadline))
+        return task, fork
+
+    async def send_message_async(self, in_parts, deadline: Deadline = UNBOUNDED):
+        """Send a message, hedging it when the primary is slow, and adopt the first good answer"""
+        initial_history_length = len(self.conversation_manager.history)
+        pending = self.conversation_manager.history[self.base_length:]
+
+        plan = self._attempt_plan()
+        running: Dict[asyncio.Task, Tuple[str, Any, float]] = {}
+        last_error: Optional[BaseException] = None
+
+        def start_next():
+            target = plan.pop(0)
+            task, fork = self._start_attempt(target, pending, in_parts, deadline)
+            if running:
+                print(f">> Hedging request to {target} ({len(running) + 1} in flight)")
+            running[task] = (target, fork, time.monotonic())
+
+        try:
+            start_next()
+            while running:
+                timeout = None
+                if plan:
+                    timeout = self.health.hedge_delay(self.targets[0], self.policy)
+                done, _ = await asyncio.wait(running.keys(), timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary (and any earlier hedges) are too slow; hedge
+                    start_next()
+                    continue
+
+                for task in done:
+                    target, fork, started = running.pop(task)
+                    breaker = self.health.breaker(target, self.policy)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        # Running out of time for the whole turn is not the model's fault
+                        if isinstance(last_error, asyncio.TimeoutError) and deadline.expired():
+                            raise last_error
+                        breaker.record_failure()
+                        print(f">> Request to {target} failed: {last_error!r}")
+                        continue
+
+                    breaker.record_success()
+                    self.health.latency(target).record(time.monotonic() - started)
+                    response, _ = task.result()
+                    self.conversation_manager.adopt(fork)
+                    self.answered_by = target
+                    return (response, self.conversation_manager.history[initial_history_length:])
+
+                # Everything in flight failed; fail over immediately if possible
+                if not running and plan:
+                    start_next()
+        finally:
+            for task in running:
+                task.cancel()
+
+        raise last_error or RuntimeError("No model answered")
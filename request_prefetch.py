@@ -0,0 +1,90 @@
+"""
+Prepares the next request while the user is still typing.
+
+Building a chat session translates the whole history (and with it any inline
+attachments), the tool declarations and the generation config, so on a long
+conversation it costs noticeable time between Send and the first byte on the
+wire. RequestPrefetcher does that work once typing pauses (attachments are
+loaded as soon as they are picked, see attachments.py, and connections are
+warmed up separately, see http_transport.warm_up). On Send the prepared session is used if nothing it depends on has changed
+since, and only the new user message still has to be added.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+import asyncio
+import os
+import time
+
+from conversation_manager import ConversationManager
+
+@dataclass
+class PreparedSession:
+    conversation_manager: ConversationManager
+    key: Tuple
+    session: Any
+    prepare_time: float
+
+class RequestPrefetcher:
+    """Debounced background preparation of the next chat session (LLM_PREFETCH=0 disables)"""
+
+    def __init__(self, ui_model, delay: float = 0.3):
+        self.ui_model = ui_model
+        self.delay = delay
+        self.enabled = os.environ.get("LLM_PREFETCH", "1") != "0"
+        self.prepared: Optional[PreparedSession] = None
+        self.stats = {"prepared": 0, "used": 0, "stale": 0, "saved_ms": 0.0}
+        self._timer: Optional[asyncio.Task] = None
+
+    def _session_key(self, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> Optional[Tuple]:
+        """Everything a session is built from; None if the provider is not created yet"""
+        ui_model = self.ui_model
+        if ui_model.current_provider_name not in ui_model.registry.providers:
+            return None
+        knobs = tuple((name, knob.get_value()) for name, knob in ui_model.get_knobs().items())
+        return (conversation_manager.revision, ui_model.current_provider_name, ui_model.current_model,
+                system_prompt, knobs)
+
+    def schedule(self, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> None:
+        """Prepare once no new call has come in for `delay` seconds (call on every key press)"""
+        if not self.enabled:
+            return
+        if self._timer and not self._timer.done():
+            self._timer.cancel()
+        self._timer = asyncio.ensure_future(self._prepare_later(conversation_manager, system_prompt))
+
+    async def _prepare_later(self, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> None:
+        await asyncio.sleep(self.delay)
+        try:
+            self.prepare(conversation_manager, system_prompt)
+        except Exception as e:
+            print(f">> Prefetch failed: {type(e).__name__}: {e}")
+
+    def prepare(self, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> None:
+        """Build the session for the current state now, unless an up-to-date one is already prepared"""
+        key = self._session_key(conversation_manager, system_prompt)
+        if key is None or self._matches(self.prepared, conversation_manager, key):
+            return
+        start = time.perf_counter()
+        session = self.ui_model.generate_chat_session(conversation_manager, system_prompt)
+        # Building the session may settle the system prompt in the conversation; key on the result
+        key = self._session_key(conversation_manager, system_prompt)
+        self.prepared = PreparedSession(conversation_manager, key, session, time.perf_counter() - start)
+        self.stats["prepared"] += 1
+
+    @staticmethod
+    def _matches(prepared: Optional[PreparedSession], conversation_manager: ConversationManager, key: Optional[Tuple]) -> bool:
+        return prepared is not None and prepared.conversation_manager is conversation_manager and prepared.key == key
+
+    def take_session(self, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> Optional[Any]:
+        """The prepared session if it still matches the conversation and settings; it can only be used once"""
+        prepared, self.prepared = self.prepared, None
+        if prepared is None:
+            return None
+        if not self._matches(prepared, conversation_manager, self._session_key(conversation_manager, system_prompt)):
+            self.stats["stale"] += 1
+            return None
+        self.stats["used"] += 1
+        self.stats["saved_ms"] += prepared.prepare_time * 1000
+        print(f">> Using prefetched session (saved {prepared.prepare_time * 1000:.1f}ms)")
+        return prepared.session
@@ -0,0 +1,279 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+
+from request_deadline import Deadline, UNBOUNDED
+
+# Cache modes
+OFF = "off"                    # no caching
+READ_THROUGH = "read_through"  # serve hits, call the provider on a miss and store the response
+RECORD = "record"              # always call the provider and store (refreshes recordings)
+REPLAY = "replay"              # serve hits only; a miss is an error and nothing is sent
+MODES = (OFF, READ_THROUGH, RECORD, REPLAY)
+
+# Where the responses of the current request came from; see track_hits()
+_request_hits: ContextVar[Optional[List[str]]] = ContextVar("response_cache_hits", default=None)
+
+@contextmanager
+def track_hits() -> Iterator[List[str]]:
+    """
+    Collect the cache hits ("memory", "disk", "shared", "in flight") of the
+    requests made inside the block, including from tasks it starts.
+    """
+    hits: List[str] = []
+    token = _request_hits.set(hits)
+    try:
+        yield hits
+    finally:
+        _request_hits.reset(token)
+
+def to_jsonable(value: Any) -> Any:
+    """Convert request values (SDK objects, dicts, lists) into plain JSON for fingerprinting"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, bytes):
+        return hashlib.sha256(value).hexdigest()
+    return value
+
+def request_fingerprint(**request: Any) -> str:
+    """
+    Stable hash of everything that determines a response.
+
+    Callers pass the model id, the generation settings (which include the
+    system prompt and tools where the SDK takes them that way) and the
+    translated history including the new message.
+    """
+    canonical = json.dumps(to_jsonable(request), sort_keys=True, separators=(",", ":"), default=repr)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class MemoryTier:
+    """In-process LRU over the most recently used entries"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Any]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key: str, value: Any) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+class DiskTier:
+    """
+    One JSON file per entry, evicted least recently used first once the
+    directory grows beyond max_bytes. Reads touch the file so its mtime
+    doubles as the last-used time, which also survives restarts.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.total_bytes = sum(stat.st_size for stat, _ in self._entries())
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, json.JSONDecodeError):
+            # Missing, or evicted meanwhile by another writer of the directory
+            return None
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        temp_path = None
+        try:
+            path.parent.mkdir(exist_ok=True)
+            old_size = path.stat().st_size if path.exists() else 0
+            # Write to a temporary file of our own first, so a concurrent reader never sees a partial entry
+            # and concurrent writers (threads or instances sharing the directory) don't clobber each other
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent, suffix=".tmp", delete=False) as f:
+                temp_path = f.name
+                json.dump(value, f)
+            os.replace(temp_path, path)
+            self.total_bytes += path.stat().st_size - old_size
+        except OSError as e:
+            print(f">> Disk cache write of {key} skipped: {e}")
+            if temp_path:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+            return
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _entries(self) -> List[Tuple[os.stat_result, pathlib.Path]]:
+        entries = []
+        for file in self.directory.glob("*/*.json"):
+            try:
+                entries.append((file.stat(), file))
+            except OSError:
+                # Evicted meanwhile by another writer of the directory
+                continue
+        return entries
+
+    def _evict(self) -> None:
+        files = sorted(self._entries(), key=lambda entry: entry[0].st_mtime)
+        self.total_bytes = sum(stat.st_size for stat, _ in files)
+        # Evict down to 90% so that eviction doesn't run on every put
+        for stat, file in files:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            self.total_bytes -= stat.st_size
+            try:
+                file.unlink()
+            except OSError:
+                pass
+
+class ResponseCache:
+    """
+    Record / replay cache for provider responses, keyed by request_fingerprint().
+
+    Values are JSON-serializable encodings of the SDK response objects; each
+    chat session supplies the encode / decode pair for its SDK. Lookups go to
+    the memory tier, then to the disk tier and then to the shared cache service
+    (if configured). Identical requests that are already in flight, in this
+    instance or (via the service) in another one, are waited for instead of
+    being sent again.
+    """
+
+    def __init__(self, mode: str = READ_THROUGH, memory: Optional[MemoryTier] = None, disk: Optional[DiskTier] = None,
+                 shared=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown response cache mode: {mode} (expected one of {', '.join(MODES)})")
+        self.mode = mode
+        self.memory = memory or MemoryTier()
+        self.disk = disk
+        self.shared = shared
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "stores": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """
+        Configure from LLM_RESPONSE_CACHE (mode), LLM_RESPONSE_CACHE_DIR,
+        LLM_RESPONSE_CACHE_MAX_MB, LLM_RESPONSE_CACHE_MEMORY_ENTRIES and
+        LLM_SHARED_CACHE (address of response_cache_service.py). Returns None
+        when caching is off; the mode defaults to read_through with a shared
+        cache and to off without one.
+        """
+        shared_address = os.environ.get("LLM_SHARED_CACHE")
+        mode = os.environ.get("LLM_RESPONSE_CACHE", READ_THROUGH if shared_address else OFF).strip().lower().replace("-", "_")
+        if mode == OFF:
+            return None
+        disk = None
+        directory = os.environ.get("LLM_RESPONSE_CACHE_DIR", ".response_cache")
+        if directory:
+            disk = DiskTier(directory, int(float(os.environ.get("LLM_RESPONSE_CACHE_MAX_MB", "256")) * 1024 * 1024))
+        memory = MemoryTier(int(os.environ.get("LLM_RESPONSE_CACHE_MEMORY_ENTRIES", "256")))
+        shared = None
+        if shared_address:
+            from response_cache_service import SharedCacheClient
+            shared = SharedCacheClient(shared_address)
+        print(f">> Response cache: {mode}" + (f" ({directory})" if disk else "") + (f", shared via {shared_address}" if shared else ""))
+        return cls(mode, memory, disk, shared)
+
+    def _lookup(self, key: str) -> Tuple[Optional[Any], str]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value, "memory"
+        if self.disk:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+                return value, "disk"
+        return None, ""
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._lookup(key)[0]
+
+    def put(self, key: str, value: Any) -> None:
+        self.memory.put(key, value)
+        if self.disk:
+            self.disk.put(key, value)
+        self.stats["stores"] += 1
+
+    def _hit(self, source: str) -> None:
+        self.stats["hits"] += 1
+        hits = _request_hits.get()
+        if hits is not None:
+            hits.append(source)
+
+    async def fetch(self, key: str, call: Callable[[], Awaitable[Any]],
+                    encode: Callable[[Any], Any], decode: Callable[[Any], Any],
+                    deadline: Deadline = UNBOUNDED) -> Any:
+        """Return the response for a request, calling the provider only as the mode allows"""
+        if self.mode in (READ_THROUGH, REPLAY):
+            while key in self.in_flight:
+                # Same request already running here; a None result means it failed, so try ourselves
+                shared_value = await deadline.wait_for(asyncio.shield(self.in_flight[key]))
+                if shared_value is not None:
+                    self._hit("in flight")
+                    return decode(shared_value)
+            cached, source = self._lookup(key)
+            if cached is not None:
+                self._hit(source)
+                return decode(cached)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        encoded = None
+        claimed = False
+        try:
+            if self.mode in (READ_THROUGH, REPLAY) and self.shared:
+                reply = await self.shared.lookup(key, claim=self.mode == READ_THROUGH, deadline=deadline)
+                if reply and reply["status"] == "hit":
+                    encoded = reply["value"]
+                    self.put(key, encoded)
+                    self._hit("shared")
+                    return decode(encoded)
+                claimed = bool(reply) and reply["status"] == "miss" and self.mode == READ_THROUGH
+
+            if self.mode in (READ_THROUGH, REPLAY):
+                self.stats["misses"] += 1
+            if self.mode == REPLAY:
+                raise ValueError(f"Response cache miss in replay mode (request {key[:12]})")
+
+            response = await call()
+            encoded = encode(response)
+            self.put(key, encoded)
+            if self.shared:
+                await self.shared.publish(key, encoded)
+                claimed = False
+            return response
+        finally:
+            # Local waiters first: nothing below may keep them waiting
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+            future.set_result(encoded)
+            if claimed:
+                try:
+                    await asyncio.shield(self.shared.abandon(key))
+                except Exception as e:
+                    # The service hands the claim on after its claim timeout
+                    print(f">> Shared cache abandon of {key[:12]} failed: {type(e).__name__}: {e}")
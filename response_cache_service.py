@@ -0,0 +1,235 @@
+"""
+Response cache shared by several tool instances on one machine.
+
+Instances with LLM_SHARED_CACHE=tcp://localhost:5561 ask this service before
+calling a provider. If another instance is already sending an identical
+request, the service holds the answer back until that request finishes, so
+only one of them pays for it.
+
+Protocol (JSON over DEALER -> ROUTER):
+  {"op": "get", "key": k, "claim": true}  -> {"status": "hit", "value": v}
+                                             {"status": "miss"}  (the caller now owns the request if it claimed)
+                                             {"status": "wait"}, later followed by "hit" or "miss"
+  {"op": "ack", "key": k}                 -> {"status": "ok"}; sent on the same socket after a claimed "miss"
+  {"op": "put", "key": k, "value": v}     -> {"status": "ok"}; waiters get "hit"
+  {"op": "abandon", "key": k}             -> {"status": "ok"}; the next claiming waiter gets "miss"
+  {"op": "cancel", "key": k, "waiter": id} -> {"status": "ok"}; the waiter with that socket identity (hex)
+                                             stopped waiting, and gives up the claim if it was handed one
+
+A claim whose "miss" is not acknowledged within the handoff timeout (the
+claimant's socket was already closed, e.g. its deadline passed) goes to the
+next waiter; acknowledged claims are only handed on after the claim timeout.
+
+Usage:
+    python response_cache_service.py [--bind tcp://*:5561] [--cache-dir DIR]
+    (or python gemini_llm_zmq_router.py --cache)
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from request_deadline import Deadline, UNBOUNDED
+from response_cache import DiskTier, MemoryTier
+
+DEFAULT_BIND = "tcp://*:5561"
+
+class CacheService:
+    def __init__(self, bind: str = DEFAULT_BIND, memory_entries: int = 1024, directory: Optional[str] = None,
+                 max_bytes: int = 1024 * 1024 * 1024, claim_timeout: float = 600.0, handoff_timeout: float = 10.0):
+        self.bind = bind
+        self.memory = MemoryTier(memory_entries)
+        self.disk = DiskTier(directory, max_bytes) if directory else None
+        # Requests being sent by some instance: key -> (owner identity, claimed at, acknowledged)
+        self.claims: Dict[str, Tuple[bytes, float, bool]] = {}
+        # Instances waiting for an in-flight key: key -> [(identity, wants claim)]
+        self.waiters: Dict[str, List[Tuple[bytes, bool]]] = {}
+        self.claim_timeout = claim_timeout
+        self.handoff_timeout = handoff_timeout
+        self.stats = {"hits": 0, "misses": 0, "deduplicated": 0, "stores": 0}
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is None and self.disk:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return value
+
+    def handle(self, identity: bytes, message: Dict[str, Any]) -> List[Tuple[bytes, Dict[str, Any]]]:
+        """Process one request and return the (identity, reply) pairs to send"""
+        op, key = message.get("op"), message.get("key")
+        if op == "get":
+            value = self._lookup(key)
+            if value is not None:
+                self.stats["hits"] += 1
+                return [(identity, {"status": "hit", "value": value})]
+            if key in self.claims:
+                self.stats["deduplicated"] += 1
+                self.waiters.setdefault(key, []).append((identity, bool(message.get("claim"))))
+                return [(identity, {"status": "wait"})]
+            self.stats["misses"] += 1
+            if message.get("claim"):
+                self.claims[key] = (identity, time.monotonic(), False)
+            return [(identity, {"status": "miss"})]
+        if op == "ack":
+            claim = self.claims.get(key)
+            if claim and claim[0] == identity:
+                self.claims[key] = (identity, claim[1], True)
+            return [(identity, {"status": "ok"})]
+        if op == "put":
+            self.memory.put(key, message["value"])
+            if self.disk:
+                self.disk.put(key, message["value"])
+            self.stats["stores"] += 1
+            self.claims.pop(key, None)
+            hit = {"status": "hit", "value": message["value"]}
+            return [(identity, {"status": "ok"})] + [(w, hit) for w, _ in self.waiters.pop(key, [])]
+        if op == "abandon":
+            return [(identity, {"status": "ok"})] + self._release(key)
+        if op == "cancel":
+            waiter = bytes.fromhex(message["waiter"])
+            waiters = [w for w in self.waiters.pop(key, []) if w[0] != waiter]
+            if waiters:
+                self.waiters[key] = waiters
+            released = self._release(key) if key in self.claims and self.claims[key][0] == waiter else []
+            return [(identity, {"status": "ok"})] + released
+        if op == "stats":
+            return [(identity, dict(self.stats, in_flight=len(self.claims)))]
+        return [(identity, {"status": "error", "message": f"Unknown op: {op}"})]
+
+    def _release(self, key: str) -> List[Tuple[bytes, Dict[str, Any]]]:
+        """Hand an abandoned (or stale) claim to the next waiter that wants one"""
+        self.claims.pop(key, None)
+        replies = []
+        waiters = self.waiters.pop(key, [])
+        while waiters:
+            identity, wants_claim = waiters.pop(0)
+            replies.append((identity, {"status": "miss"}))
+            if wants_claim:
+                self.claims[key] = (identity, time.monotonic(), False)
+                if waiters:
+                    self.waiters[key] = waiters
+                break
+        return replies
+
+    def expire_claims(self) -> List[Tuple[bytes, Dict[str, Any]]]:
+        """Release claims of instances that never acknowledged them or never answered (crashed, cancelled, ...)"""
+        now = time.monotonic()
+        replies = []
+        for key, (_, claimed_at, acknowledged) in list(self.claims.items()):
+            if now - claimed_at > (self.claim_timeout if acknowledged else self.handoff_timeout):
+                replies += self._release(key)
+        return replies
+
+    def serve_forever(self) -> None:
+        import zmq
+
+        context = zmq.Context.instance()
+        socket = context.socket(zmq.ROUTER)
+        socket.bind(self.bind)
+        print(f">> Response cache service listening on {self.bind}")
+        while True:
+            replies = []
+            if socket.poll(1000):
+                identity, payload = socket.recv_multipart()
+                try:
+                    replies = self.handle(identity, json.loads(payload))
+                except (ValueError, KeyError) as e:
+                    replies = [(identity, {"status": "error", "message": str(e)})]
+            replies += self.expire_claims()
+            for identity, reply in replies:
+                socket.send_multipart([identity, json.dumps(reply).encode("utf-8")])
+
+class SharedCacheClient:
+    """
+    Client side of the service, for ResponseCache.
+
+    Every call uses its own short-lived DEALER socket so that replies can never
+    get mixed up between concurrent requests. If the service does not answer
+    within connect_timeout it is assumed to be down and skipped for retry_after
+    seconds, so a missing service only ever costs one short delay.
+    """
+
+    def __init__(self, address: str, connect_timeout: float = 1.0, retry_after: float = 30.0):
+        import zmq
+        import zmq.asyncio
+
+        self.zmq = zmq
+        self.context = zmq.asyncio.Context.instance()
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self.retry_after = retry_after
+        self.unavailable_until = 0.0
+
+    async def _request(self, message: Dict[str, Any], deadline: Deadline = UNBOUNDED) -> Optional[Dict[str, Any]]:
+        if time.monotonic() < self.unavailable_until:
+            return None
+        socket = self.context.socket(self.zmq.DEALER)
+        socket.setsockopt(self.zmq.LINGER, 0)
+        # Known identity, so the service can be told when this socket stops waiting (ZMQ reserves a leading zero byte)
+        identity = uuid.uuid4().hex.encode("ascii")
+        socket.setsockopt(self.zmq.ROUTING_ID, identity)
+        socket.connect(self.address)
+        try:
+            await socket.send(json.dumps(message).encode("utf-8"))
+            try:
+                reply = json.loads(await asyncio.wait_for(socket.recv(), self.connect_timeout))
+            except asyncio.TimeoutError:
+                print(f">> Response cache service at {self.address} is not answering, skipping it for {self.retry_after:.0f}s")
+                self.unavailable_until = time.monotonic() + self.retry_after
+                return None
+            if reply.get("status") == "wait":
+                # Another instance is sending the same request; its answer comes on this socket
+                try:
+                    reply = json.loads(await deadline.wait_for(socket.recv()))
+                except BaseException:
+                    # A claim handed to this socket once it is closed would hold up the other waiters
+                    await self._cancel(message["key"], identity)
+                    raise
+            if message.get("claim") and reply.get("status") == "miss":
+                # Claims are only held for an owner that confirms it got them
+                await socket.send(json.dumps({"op": "ack", "key": message["key"]}).encode("utf-8"))
+                try:
+                    await asyncio.wait_for(socket.recv(), self.connect_timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return reply
+        finally:
+            socket.close()
+
+    async def _cancel(self, key: str, identity: bytes) -> None:
+        try:
+            await asyncio.shield(self._request({"op": "cancel", "key": key, "waiter": identity.hex()}))
+        except Exception as e:
+            print(f">> Shared cache cancel of {key[:12]} failed: {type(e).__name__}: {e}")
+
+    async def lookup(self, key: str, claim: bool, deadline: Deadline = UNBOUNDED) -> Optional[Dict[str, Any]]:
+        """Look a key up, waiting for an identical in-flight request; None if the service is unavailable"""
+        return await self._request({"op": "get", "key": key, "claim": claim}, deadline)
+
+    async def publish(self, key: str, value: Any) -> None:
+        await self._request({"op": "put", "key": key, "value": value})
+
+    async def abandon(self, key: str) -> None:
+        await self._request({"op": "abandon", "key": key})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bind", default=DEFAULT_BIND)
+    parser.add_argument("--cache-dir", help="Also keep responses on disk in this directory")
+    parser.add_argument("--max-mb", type=float, default=1024, help="Disk cache size limit")
+    parser.add_argument("--memory-entries", type=int, default=1024)
+    parser.add_argument("--claim-timeout", type=float, default=600, help="Seconds before an unfinished request is handed to a waiter")
+    parser.add_argument("--handoff-timeout", type=float, default=10,
+                        help="Seconds before a claim its owner did not acknowledge is handed to a waiter")
+    args = parser.parse_args()
+
+    CacheService(args.bind, args.memory_entries, args.cache_dir, int(args.max_mb * 1024 * 1024),
+                 args.claim_timeout, args.handoff_timeout).serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from collections import deque
+import asyncio
+import itertools
+import traceback
+
+@dataclass
+class QueuedRequest:
+    """A prompt waiting to be (or being) sent for one conversation"""
+    request_id: int
+    conversation_key: Hashable
+    message: str
+    parts: List[Any]
+    state: str = "pending"  # pending -> running -> done | failed | cancelled
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    # Parts still being prepared (e.g. attachments being read), awaited by the runner
+    attachments: List[Awaitable[Any]] = field(default_factory=list, repr=False)
+
+class SendQueue:
+    """
+    Outbound request queue.
+
+    Requests for the same conversation are sent strictly in submission order,
+    one at a time, since each turn builds on the previous one. Requests for
+    different conversations are independent and run concurrently, each on its
+    own worker task. Workers only exist while their conversation has work.
+    """
+
+    def __init__(self, runner: Callable[[QueuedRequest], Awaitable[Any]],
+                 on_change: Optional[Callable[[QueuedRequest], None]] = None):
+        self.runner = runner
+        self.on_change = on_change or (lambda request: None)
+        self.queues: Dict[Hashable, deque] = {}
+        self.workers: Dict[Hashable, asyncio.Task] = {}
+        self.running: Dict[Hashable, QueuedRequest] = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, conversation_key: Hashable, message: str, parts: List[Any],
+               attachments: Optional[List[Awaitable[Any]]] = None) -> QueuedRequest:
+        """Queue a prompt for a conversation and make sure its worker is running"""
+        request = QueuedRequest(next(self._ids), conversation_key, message, parts, attachments=list(attachments or []))
+        self.queues.setdefault(conversation_key, deque()).append(request)
+        self.on_change(request)
+        if conversation_key not in self.workers:
+            self.workers[conversation_key] = asyncio.ensure_future(self._worker(conversation_key))
+        return request
+
+    def pending(self, conversation_key: Hashable) -> List[QueuedRequest]:
+        return list(self.queues.get(conversation_key, ()))
+
+    def current(self, conversation_key: Hashable) -> Optional[QueuedRequest]:
+        return self.running.get(conversation_key)
+
+    def cancel(self, request: QueuedRequest) -> None:
+        """Remove a pending request, or cancel it if it is already running"""
+        if request.state == "pending":
+            self.queues[request.conversation_key].remove(request)
+            request.state = "cancelled"
+            self.on_change(request)
+        elif request.state == "running" and request.task:
+            request.task.cancel()
+
+    def cancel_all(self) -> None:
+        for key in list(self.queues):
+            for request in self.pending(key):
+                self.cancel(request)
+        for request in list(self.running.values()):
+            self.cancel(request)
+
+    async def _worker(self, conversation_key: Hashable) -> None:
+        queue = self.queues[conversation_key]
+        try:
+            while queue:
+                request = queue.popleft()
+                request.state = "running"
+                self.running[conversation_key] = request
+                self.on_change(request)
+
+                request.task = asyncio.ensure_future(self.runner(request))
+                try:
+                    await request.task
+                    request.state = "done"
+                except asyncio.CancelledError:
+                    request.state = "cancelled"
+                except Exception:
+                    # Keep draining the queue; later prompts are still wanted
+                    traceback.print_exc()
+                    request.state = "failed"
+                finally:
+                    del self.running[conversation_key]
+                self.on_change(request)
+        finally:
+            del self.workers[conversation_key]
+            if not queue:
+                del self.queues[conversation_key]
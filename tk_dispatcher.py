@@ -0,0 +1,127 @@
+"""
+Running callables on the Tk thread, posted from any thread (ZMQ messages,
+change events of background requests).
+
+The Tk thread runs the asyncio loop (async_tkinter_loop), so posting wakes
+that loop through its self-pipe (call_soon_threadsafe) instead of waiting
+for the next poll. A wakeup runs everything pending, up to a time budget;
+what is left runs on the next loop iteration, after Tk had a chance to
+handle its events. Queue depth and the delay from post to run are kept as
+metrics.
+
+Settings (environment):
+  LLM_TK_DISPATCH_BUDGET_MS   time a wakeup may spend running tasks before yielding to Tk (default 8)
+"""
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+import asyncio
+import os
+import threading
+import time
+import traceback
+
+class TkDispatcher:
+    """Queue of tasks for the Tk thread, drained as soon as one is posted"""
+
+    def __init__(self, budget: float = 0.008, latency_samples: int = 1000):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._tasks: Deque[Tuple[Callable[[], Any], float]] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup_pending = False
+        # Seconds from post to run of the most recent tasks
+        self.latencies: Deque[float] = deque(maxlen=latency_samples)
+        self.stats = {"posted": 0, "dispatched": 0, "failed": 0, "wakeups": 0, "over_budget": 0, "max_depth": 0}
+        # Called with the dispatcher after a wakeup, at most every report_interval seconds (e.g. to update the status bar)
+        self.on_report: Optional[Callable[["TkDispatcher"], None]] = None
+        self.report_interval = 1.0
+        self._last_report = 0.0
+
+    @classmethod
+    def from_env(cls) -> "TkDispatcher":
+        return cls(float(os.environ.get("LLM_TK_DISPATCH_BUDGET_MS", "8")) / 1000.0)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        Dispatch through loop, by default the running one (so call this on the
+        Tk thread once the loop runs). Tasks posted before run now.
+        """
+        with self._lock:
+            self._loop = loop or asyncio.get_running_loop()
+            wake = bool(self._tasks) and not self._wakeup_pending
+            self._wakeup_pending = self._wakeup_pending or wake
+        if wake:
+            self._loop.call_soon_threadsafe(self._drain)
+
+    def post(self, task: Callable[[], Any]) -> None:
+        """Run task on the Tk thread as soon as possible; callable from any thread"""
+        with self._lock:
+            self._tasks.append((task, time.perf_counter()))
+            self.stats["posted"] += 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], len(self._tasks))
+            # One wakeup drains all tasks, so only the first of a burst needs to wake the loop
+            wake = self._loop is not None and not self._wakeup_pending
+            if wake:
+                self._wakeup_pending = True
+        if wake:
+            try:
+                self._loop.call_soon_threadsafe(self._drain)
+            except RuntimeError:
+                # The loop is closed: the app is exiting
+                pass
+
+    def depth(self) -> int:
+        with self._lock:
+            return len(self._tasks)
+
+    def _drain(self) -> None:
+        deadline = time.perf_counter() + self.budget
+        dispatched = failed = 0
+        while True:
+            with self._lock:
+                if not self._tasks:
+                    self._wakeup_pending = False
+                    more = False
+                    break
+                task, posted = self._tasks.popleft()
+            self.latencies.append(time.perf_counter() - posted)
+            try:
+                task()
+            except Exception:
+                # Like a failing Tk callback: report it and go on with the others
+                traceback.print_exc()
+                failed += 1
+            dispatched += 1
+            if time.perf_counter() >= deadline:
+                with self._lock:
+                    more = bool(self._tasks)
+                    self._wakeup_pending = more
+                break
+
+        with self._lock:
+            self.stats["wakeups"] += 1
+            self.stats["dispatched"] += dispatched
+            self.stats["failed"] += failed
+            self.stats["over_budget"] += more
+        if more:
+            # Out of budget: continue on the next iteration, once Tk has handled its events
+            self._loop.call_soon(self._drain)
+
+        now = time.perf_counter()
+        if self.on_report and now - self._last_report >= self.report_interval:
+            self._last_report = now
+            self.on_report(self)
+
+    def latency_percentiles(self) -> Dict[str, float]:
+        """p50 / p95 / max of the recent post-to-run delays, in seconds"""
+        ordered = sorted(self.latencies)
+        if not ordered:
+            return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+        return {"p50": ordered[len(ordered) // 2], "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1]}
+
+    def describe(self) -> str:
+        latency = self.latency_percentiles()
+        return (f"Tk queue: {self.depth()} pending (max {self.stats['max_depth']}), "
+                f"delay p50 {latency['p50'] * 1000:.1f}ms / p95 {latency['p95'] * 1000:.1f}ms")
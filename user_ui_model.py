@@ -1,40 +1,85 @@
 from typing import Any, Dict, List, Optional
 from conversation_manager import ConversationManager
+import os
 
-from llm_provider import LLMProvider
-from llm_provider_google import GoogleAIProvider
-from llm_provider_generic_oai import GenericOAIWrapperProvider
+from llm_provider import LLMProvider, ModelOption
+from provider_registry import ProviderRegistry, ProviderSpec, discover_provider_specs
+from request_hedging import HedgedChatSession, ModelHealth
+from fan_out import FanOutSession
+from builtin_models import google_models, groq_nous_models, stub_models
+from response_cache import ResponseCache
+
+def builtin_provider_specs() -> List[ProviderSpec]:
+    """Built-in providers; their SDKs are imported only when a provider is first used"""
+    if "GOOGLE_API_KEY" in os.environ:
+        google_env = ["GOOGLE_API_KEY"]
+    else:
+        google_env = ["GOOGLE_VERTEX_AI_PROJECT_ID", "GOOGLE_VERTEX_AI_REGION"]
+
+    specs = [
+        ProviderSpec(
+            name="google_ai",
+            factory="llm_provider_google:GoogleAIProvider",
+            models=google_models(),
+            required_env=google_env
+        ),
+        ProviderSpec(
+            name="groq_nous",
+            factory="llm_provider_generic_oai:GenericOAIWrapperProvider",
+            models=groq_nous_models(),
+            required_env=["GROQ_API_KEY", "NOUS_API_KEY"]
+        )
+    ]
+    if os.environ.get("LLM_STUB_PROVIDER"):
+        specs.append(ProviderSpec(
+            name="stub",
+            factory="llm_provider_stub:StubProvider",
+            models=stub_models()
+        ))
+    return specs
 
 class UserUIModel:
     def __init__(self):
-        self.providers: Dict[str, LLMProvider] = {}
-        self.current_provider = None
+        self.current_provider_name: Optional[str] = None
         self.current_model = None
+        self.model_health = ModelHealth()
+        self.response_cache = ResponseCache.from_env()
         self._initialize_providers()
         
     def _initialize_providers(self):
-        # Initialize built-in providers
-        providers = [
-            GoogleAIProvider(),
-            GenericOAIWrapperProvider()
-        ]
-        
-        for provider in providers:
-            provider.initialize()
-            self.providers[provider.name] = provider
-            
+        # Providers are only listed here (built-ins, plugins, providers.json); each one is created when first used
+        self.registry = ProviderRegistry(discover_provider_specs(builtin_provider_specs()), on_create=self._on_provider_created)
+        for name, spec in self.registry.specs.items():
+            if spec.missing_env():
+                print(f">> Provider {name} unavailable, missing: {', '.join(spec.missing_env())}")
+
         # Set default provider
-        if self.providers:
-            self.current_provider = next(iter(self.providers.values()))
-            self.current_model = self.current_provider.get_available_models()[0].id
-    
-    def get_providers(self) -> Dict[str, LLMProvider]:
-        return self.providers
+        available = self.registry.available()
+        if available:
+            self.current_provider_name = next(iter(available))
+            self.current_model = self.registry.models(self.current_provider_name)[0].id
+
+    def _on_provider_created(self, provider: LLMProvider) -> None:
+        provider.response_cache = self.response_cache
+
+    @property
+    def current_provider(self) -> Optional[LLMProvider]:
+        """The selected provider, created on first access"""
+        if self.current_provider_name is None:
+            return None
+        return self.registry.get(self.current_provider_name)
+
+    def get_provider(self, provider_name: str) -> LLMProvider:
+        return self.registry.get(provider_name)
+
+    def get_provider_models(self) -> Dict[str, List[ModelOption]]:
+        """Models of every usable provider, without creating the providers"""
+        return {name: self.registry.models(name) for name in self.registry.available()}
     
     def set_provider(self, provider_name: str) -> None:
-        if provider_name in self.providers:
-            self.current_provider = self.providers[provider_name]
-            self.current_model = self.current_provider.get_available_models()[0].id
+        if provider_name in self.registry.available():
+            self.current_provider_name = provider_name
+            self.current_model = self.registry.models(provider_name)[0].id
     
     def set_model(self, model_id: str) -> None:
         self.current_model = model_id
@@ -44,15 +89,60 @@ class UserUIModel:
             return self.current_provider.get_settings()
         return {}
     
+    def get_model_option(self, provider_name: str, model_id: str) -> Optional[ModelOption]:
+        if provider_name in self.registry.specs:
+            for model in self.registry.models(provider_name):
+                if model.id == model_id:
+                    return model
+        return None
+
+    def create_target_session(self, target: str, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> Any:
+        """Create a chat session for a "provider_name:model_id" target"""
+        provider_name, model_id = target.split(":", 1)
+        return self.registry.get(provider_name).create_chat_session(
+            model_id=model_id,
+            conversation_manager=conversation_manager,
+            system_prompt=system_prompt
+        )
+
     def generate_chat_session(self, conversation_manager: ConversationManager, system_prompt: Optional[str]) -> Any:
         if not self.current_provider:
             raise ValueError("No provider selected")
+
+        # Wrap in a hedged session if the selected model has a hedging policy
+        option = self.get_model_option(self.current_provider.name, self.current_model)
+        if option and option.hedge:
+            targets = [f"{self.current_provider.name}:{self.current_model}"] + option.hedge.fallback_models
+            return HedgedChatSession(
+                conversation_manager,
+                targets,
+                option.hedge,
+                self.model_health,
+                lambda target, cm: self.create_target_session(target, cm, system_prompt)
+            )
+
         return self.current_provider.create_chat_session(
             model_id=self.current_model,
             conversation_manager=conversation_manager,
             system_prompt=system_prompt
         )
 
+    async def warm_up(self, load: bool = True) -> None:
+        """Open connections for the selected model ahead of a request; load=False skips providers not yet created"""
+        name = self.current_provider_name
+        if name is None or (not load and name not in self.registry.providers):
+            return
+        try:
+            await self.registry.get(name).warm_up(self.current_model)
+        except Exception as e:
+            print(f">> Warm-up for {name}:{self.current_model} failed: {type(e).__name__}: {e}")
+
+    def fan_out(self, conversation_manager: ConversationManager, targets: List[str], system_prompt: Optional[str]) -> FanOutSession:
+        """Start comparing several "provider_name:model_id" targets, each on its own branch of the conversation"""
+        if not targets:
+            raise ValueError("No models selected for fan-out")
+        return FanOutSession(self, conversation_manager, targets, system_prompt)
+
 # Example usage:
 if __name__ == "__main__":
     user_model = UserUIModel()